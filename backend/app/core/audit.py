@@ -1,6 +1,7 @@
 """Audit logging utilities"""
 from typing import Optional, Dict, Any
 from app.db.models import AuditEvent
+from app.mikrotik.records import to_plain
 
 
 def record_audit_event(
@@ -24,7 +25,7 @@ def record_audit_event(
         method_used=method_used,
         result=result,
         error_message=error_message,
-        extra_data=extra_data
+        extra_data=to_plain(extra_data)
     )
     db.add(event)
     db.commit()
@@ -26,6 +26,7 @@ class Settings(BaseSettings):
     PORT: int = 8000
     WORKERS: int = 1
     RELOAD: bool = True
+    REQUEST_DEADLINE_SECONDS: float = 30  # Tiempo máximo que una petición espera a los routers
     
     # Security
     SECRET_KEY: str = Field(..., min_length=32)
@@ -54,6 +55,66 @@ class Settings(BaseSettings):
     MT_SSL_VERIFY: bool = False
     MT_TIMEOUT: int = 10
     
+    # MikroTik Connection Pool
+    MT_POOL_MIN_IDLE: int = 1
+    MT_POOL_MAX_IDLE: int = 4
+    MT_POOL_MAX_SIZE: int = 8
+    MT_POOL_IDLE_TIMEOUT_SECONDS: int = 300
+    MT_POOL_HEALTH_CHECK_SECONDS: int = 60
+    MT_POOL_MAINTENANCE_INTERVAL_SECONDS: int = 30
+    MT_PIPELINE_WINDOW: int = 32  # Comandos etiquetados en vuelo por conexión
+    MT_FANOUT_CONCURRENCY: int = 16  # Routers consultados a la vez en operaciones sobre todos
+    MT_SCHEDULER_MAX_CONCURRENT: int = 4  # Llamadas simultáneas por router (CPU de RouterOS)
+    MT_SCHEDULER_INTERACTIVE_RESERVED: int = 1  # Turnos que bulk/background no pueden ocupar
+    
+    # Espejo en memoria de leases, address-lists y queues (suscripciones listen).
+    # Cada worker abre su propia suscripción por router: con WORKERS > 1 son
+    # N conexiones listen y N fotos iniciales por router, por eso va apagado
+    MT_MIRROR_ENABLED: bool = False
+    MT_MIRROR_PING_SECONDS: int = 30
+    MT_MIRROR_SYNC_INTERVAL_SECONDS: int = 60  # Revisión de routers dados de alta/baja
+    MT_MIRROR_SNAPSHOT_TIMEOUT_SECONDS: int = 120  # Foto inicial de tablas grandes (no Router.timeout)
+    MT_MIRROR_WRITE_BYPASS_SECONDS: float = 2  # Tras una escritura propia se lee del router hasta que llegue el evento
+    
+    # Timeouts adaptativos por router (acotados por Router.timeout)
+    MT_ADAPTIVE_TIMEOUT_ENABLED: bool = True
+    MT_TIMEOUT_MIN_SECONDS: float = 1.0
+    MT_TIMEOUT_MIN_SAMPLES: int = 20  # Muestras antes de dejar de usar Router.timeout
+    MT_TIMEOUT_P99_MULTIPLIER: float = 3.0
+    
+    # Sondeo de salud de routers en segundo plano
+    MT_HEALTH_ENABLED: bool = True
+    MT_HEALTH_INTERVAL_SECONDS: int = 60
+    MT_HEALTH_CONCURRENCY: int = 4
+    
+    # Outbox de cambios en routers (se aplican en segundo plano con reintentos)
+    MT_OUTBOX_POLL_SECONDS: float = 2
+    MT_OUTBOX_BATCH_SIZE: int = 100
+    MT_OUTBOX_MAX_ATTEMPTS: int = 10
+    MT_OUTBOX_BACKOFF_BASE_SECONDS: float = 2
+    MT_OUTBOX_BACKOFF_MAX_SECONDS: float = 300
+    MT_OUTBOX_CLAIM_TIMEOUT_SECONDS: int = 120  # En curso más tiempo = worker caído, se reintenta
+    MT_OUTBOX_SYNC_WAIT_SECONDS: float = 3  # Espera del endpoint al resultado antes de responder 202 (0 = no esperar)
+    
+    # Trabajos de asignación masiva / rollout de planes
+    MT_PLAN_JOB_STALE_SECONDS: int = 120  # Sin latido más tiempo = proceso caído, se marca fallido
+    
+    # Reconciliación periódica de address-lists gestionadas (0 = solo bajo demanda)
+    MT_RECONCILE_INTERVAL_SECONDS: int = 0
+    MT_RECONCILE_MAX_REMOVE_RATIO: float = 0.2  # Proporción máxima de entradas del router que puede eliminar
+    
+    # Caché de lecturas MikroTik (cuando el espejo no está disponible)
+    MT_CACHE_ENABLED: bool = True
+    MT_CACHE_TTL_SECONDS: float = 5
+    MT_CACHE_STALE_SECONDS: float = 30  # Ventana stale-while-revalidate tras el TTL
+    MT_CACHE_MAX_ENTRIES: int = 1024
+    MT_CACHE_VERSION_CHECK_SECONDS: float = 1  # WORKERS > 1: cada cuánto se consulta la versión compartida
+    MT_QUEUE_INDEX_TTL_SECONDS: float = 300  # Índice target → queue sin espejo
+    
+    # MikroTik SSH (fallback): sesión persistente por router
+    MT_SSH_KEEPALIVE_SECONDS: int = 30
+    MT_SSH_IDLE_TIMEOUT_SECONDS: int = 600
+    
     # Address Lists
     LIST_PERMITIDO: str = "INET_PERMITIDO"
     LIST_BLOQUEADO: str = "INET_BLOQUEADO"
@@ -62,6 +123,8 @@ class Settings(BaseSettings):
     CIRCUIT_FAILURE_THRESHOLD: int = 3
     CIRCUIT_TIMEOUT_SECONDS: int = 300
     CIRCUIT_HALF_OPEN_MAX_CALLS: int = 1
+    CIRCUIT_PROBE_INTERVAL_SECONDS: int = 15  # Sondeo de fondo de la API con breaker abierto
+    CIRCUIT_SYNC_INTERVAL_SECONDS: int = 5  # Sincronización del estado entre workers (WORKERS > 1)
     
     # Stats
     STATS_COLLECTION_INTERVAL_MINUTES: int = 60
@@ -91,6 +154,11 @@ class Settings(BaseSettings):
     )
 
 
+# Listas de control de internet gestionadas por el portal: un dispositivo
+# está en exactamente una (toggle, reconciliación y estadísticas)
+MANAGED_LISTS = ("INET_PERMITIDO", "INET_LIMITADO", "INET_BLOQUEADO")
+
+
 # Singleton settings instance
 settings = Settings()
 
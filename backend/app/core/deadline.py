@@ -0,0 +1,46 @@
+"""Plazo máximo por petición HTTP
+
+El middleware fija el deadline de cada petición en un ContextVar; el código
+que habla con los routers consulta remaining() para no gastar más tiempo del
+que le queda a la petición (API, fallback SSH y reintentos incluidos). Las
+tareas creadas durante la petición heredan el mismo deadline.
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Se agotó el plazo de la petición antes de completar la operación"""
+
+
+def set_deadline(seconds: Optional[float]):
+    """Fija el deadline a seconds desde ahora (None: sin límite); devuelve el token del ContextVar"""
+    return _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Segundos que le quedan a la petición actual (None si no hay deadline)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def budget(timeout: float) -> float:
+    """Timeout a usar en una operación: el menor entre timeout y lo que queda de la petición
+
+    Lanza DeadlineExceeded si la petición ya no tiene tiempo.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Se agotó el tiempo de la petición")
+    return min(timeout, left)
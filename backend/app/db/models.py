@@ -1,6 +1,6 @@
 """SQLAlchemy Models según especificación del plan"""
 from sqlalchemy import (
-    Column, Integer, String, Boolean, DateTime, Text, ForeignKey, BigInteger, Date, JSON
+    Column, Integer, String, Boolean, DateTime, Text, ForeignKey, BigInteger, Date, JSON, UniqueConstraint
 )
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -195,3 +195,71 @@ class DeviceTrafficStats(Base):
     
     # Relationships
     device = relationship("Device", back_populates="traffic_stats")
+
+
+class CircuitBreakerState(Base):
+    """Estado persistido del circuit breaker API → SSH por router"""
+    __tablename__ = "circuit_breaker_states"
+    
+    key = Column(String(100), primary_key=True)  # Router.id o host:puerto
+    state = Column(String(20), nullable=False, default="closed")  # closed, open, half_open
+    failure_count = Column(Integer, default=0)
+    opened_at = Column(DateTime)
+    changed_at = Column(DateTime, nullable=False)  # Último cambio (UTC), para sincronizar workers
+
+
+class CacheVersion(Base):
+    """Versión de escritura por router y ruta: invalida la caché de lecturas entre workers"""
+    __tablename__ = "mikrotik_cache_versions"
+
+    key = Column(String(200), primary_key=True)  # Router.id|ruta
+    version = Column(Integer, nullable=False, default=0)
+
+
+class RouterMutation(Base):
+    """Outbox de cambios pendientes de aplicar en un router"""
+    __tablename__ = "router_mutations"
+    __table_args__ = (
+        UniqueConstraint("router_id", "idempotency_key", name="uq_router_mutation_idempotency"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    router_id = Column(Integer, ForeignKey("routers.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(String(50), nullable=False)  # address_list_move, ...
+    coalesce_key = Column(String(200), nullable=False, index=True)  # kind:objetivo (p.ej. la IP)
+    idempotency_key = Column(String(100))  # Cabecera Idempotency-Key del cliente
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending, in_progress, done, failed, superseded
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)  # UTC
+    claimed_at = Column(DateTime)
+    last_error = Column(Text)
+    result = Column(JSON)
+    created_by = Column(String(50))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime)
+
+
+class PlanAssignmentJob(Base):
+    """Asignación masiva de un plan o despliegue de sus nuevos límites (progreso consultable)"""
+    __tablename__ = "plan_assignment_jobs"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(20), nullable=False, default="assign")  # assign, rollout (cambio de límites del plan)
+    selection = Column(JSON)  # Filtros pedidos: device_ids, router_id, subnet
+    device_ids = Column(JSON, nullable=False)  # Dispositivos resueltos al crear el trabajo
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending, running, done, failed
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    succeeded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)  # Sin IP
+    summary = Column(JSON)  # Conteo por acción (queue_created, queue_updated, pcq...)
+    errors = Column(JSON)  # Primeros errores por dispositivo
+    created_by = Column(String(50))
+    created_by_user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)  # Último latido del proceso que lo ejecuta (UTC)
+    completed_at = Column(DateTime)
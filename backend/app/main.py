@@ -1,4 +1,5 @@
 """FastAPI main application"""
+import asyncio
 import time
 from fastapi import FastAPI, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,14 +9,26 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.responses import JSONResponse
 from app.core.config import settings
 from app.core.logging import get_logger
+from app.core.deadline import DeadlineExceeded, reset_deadline, set_deadline
 from app.db.database import init_db
 from app.routes import auth, routers, devices, plans, qos, stats, users, audit
 from app.core.security import decode_access_token, get_current_user_payload
 from app.core.audit import record_audit_event
 from app.db.database import SessionLocal
+from app.mikrotik.pool import pool_registry
+from app.mikrotik.breaker import breaker_registry
+from app.mikrotik.ssh_pool import ssh_registry
+from app.mikrotik.mirror import mirror_registry
+from app.mikrotik.health import health_prober
+from app.mikrotik.outbox import outbox_worker
+from app.mikrotik.plan_jobs import plan_job_runner
+from app.mikrotik.reconcile import reconcile_forever
 
 logger = get_logger(__name__)
 
+# Tareas de fondo iniciadas en el arranque
+background_tasks: list = []
+
 # Crear aplicación FastAPI
 app = FastAPI(
     title=settings.APP_NAME,
@@ -88,8 +101,12 @@ async def log_requests(request: Request, call_next):
         client_host=request.client.host if request.client else "unknown"
     )
     
-    # Process request
-    response = await call_next(request)
+    # Process request (con deadline para las llamadas a los routers)
+    deadline_token = set_deadline(settings.REQUEST_DEADLINE_SECONDS)
+    try:
+        response = await call_next(request)
+    finally:
+        reset_deadline(deadline_token)
     # Audit log for mutating requests with valid JWT
     try:
         if request.method in {"POST", "PUT", "PATCH", "DELETE"}:
@@ -125,6 +142,10 @@ async def log_requests(request: Request, call_next):
     
     return response
 
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -154,12 +175,41 @@ async def startup_event():
     except Exception as e:
         logger.error("database_init_failed", error=str(e))
         raise
+    
+    # Estado persistido de los circuit breakers
+    try:
+        await breaker_registry.load()
+    except Exception as e:
+        logger.warning("circuit_breaker_load_failed", error=str(e))
+    
+    background_tasks.append(asyncio.create_task(pool_registry.run_forever()))
+    background_tasks.append(asyncio.create_task(ssh_registry.run_forever()))
+    background_tasks.append(asyncio.create_task(breaker_registry.probe_forever()))
+    if settings.WORKERS > 1:
+        background_tasks.append(asyncio.create_task(breaker_registry.sync_forever()))
+    if settings.MT_MIRROR_ENABLED:
+        background_tasks.append(asyncio.create_task(mirror_registry.supervise_forever()))
+    if settings.MT_HEALTH_ENABLED:
+        background_tasks.append(asyncio.create_task(health_prober.run_forever()))
+    background_tasks.append(asyncio.create_task(outbox_worker.run_forever()))
+    background_tasks.append(asyncio.create_task(plan_job_runner.run_forever()))
+    if settings.MT_RECONCILE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(reconcile_forever()))
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Limpieza al cerrar"""
     logger.info("application_shutting_down")
+    
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await plan_job_runner.cancel_all()
+    
+    await mirror_registry.close_all()
+    await pool_registry.close_all()
+    await ssh_registry.close_all()
 
 
 # Health check
@@ -1,14 +1,19 @@
-"""Cliente API MikroTik usando routeros-api"""
-import routeros_api
-from typing import Optional, List, Dict, Any
+"""Cliente API MikroTik asíncrono (protocolo API nativo sobre asyncio)"""
+import asyncio
+from typing import Optional, List, Dict, Any, Sequence
+from app.mikrotik.protocol import ApiConnection
+from app.mikrotik.records import AddressListItem, DhcpLease, SimpleQueue
 from app.core.logging import get_logger
 from app.core.config import settings
 
 logger = get_logger(__name__)
 
+# .id por comando remove al reconciliar address-lists
+RECONCILE_REMOVE_CHUNK = 500
+
 
 class MikroTikAPIClient:
-    """Wrapper para routeros-api con manejo de errores y logging"""
+    """Cliente API de RouterOS con manejo de errores y logging"""
     
     def __init__(
         self,
@@ -27,106 +32,210 @@ class MikroTikAPIClient:
         self.use_ssl = use_ssl
         self.ssl_verify = ssl_verify
         self.timeout = timeout
-        self.connection: Optional[routeros_api.RouterOsApiPool] = None
+        self.connection: Optional[ApiConnection] = None
         
-    def connect(self) -> bool:
+    async def connect(self) -> bool:
         """Conecta al router MikroTik"""
+        connection = ApiConnection(
+            host=self.host,
+            port=self.port,
+            use_ssl=self.use_ssl,
+            ssl_verify=self.ssl_verify,
+            timeout=self.timeout
+        )
         try:
             logger.info("mikrotik_api_connecting", host=self.host, port=self.port)
             
-            self.connection = routeros_api.RouterOsApiPool(
-                host=self.host,
-                username=self.username,
-                password=self.password,
-                port=self.port,
-                use_ssl=self.use_ssl,
-                ssl_verify=self.ssl_verify,
-                plaintext_login=True
-            )
-            
-            # Test de conexión
-            api = self.connection.get_api()
-            system_resource = api.get_resource('/system/resource')
-            system_resource.get()
+            await connection.open()
+            # La salud de conexiones reutilizadas se verifica en el pool con ping()
+            await asyncio.wait_for(connection.login(self.username, self.password), self.timeout)
+            self.connection = connection
             
             logger.info("mikrotik_api_connected", host=self.host)
             return True
             
         except Exception as e:
             logger.error("mikrotik_api_connection_failed", host=self.host, error=str(e))
+            await connection.close()
             self.connection = None
             raise
     
-    def disconnect(self):
+    async def disconnect(self):
         """Desconecta del router"""
         if self.connection:
             try:
-                self.connection.disconnect()
+                await self.connection.close()
                 logger.info("mikrotik_api_disconnected", host=self.host)
             except Exception as e:
                 logger.warning("mikrotik_api_disconnect_error", error=str(e))
             finally:
                 self.connection = None
     
-    def get_resource(self, path: str):
-        """Obtiene un recurso de la API"""
-        if not self.connection:
-            raise Exception("No hay conexión activa. Llamar connect() primero.")
-        
-        api = self.connection.get_api()
-        return api.get_resource(path)
+    @property
+    def is_connected(self) -> bool:
+        return self.connection is not None and not self.connection.closed
     
-    def execute(self, path: str, method: str = "get", params: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Ejecuta comando en la API"""
+    async def ping(self) -> bool:
+        """Verificación ligera de que la conexión sigue viva"""
         try:
-            resource = self.get_resource(path)
-            
-            if method == "get":
-                result = resource.get(**params) if params else resource.get()
-            elif method == "add":
-                result = resource.add(**params)
-            elif method == "set":
-                result = resource.set(**params)
-            elif method == "remove":
-                result = resource.remove(**params)
+            await self.execute("/system/identity", "get")
+            return True
+        except Exception:
+            return False
+    
+    @staticmethod
+    def build_query(queries: Optional[Dict[str, Any]]) -> List[str]:
+        """Convierte filtros en palabras de consulta API evaluadas por el router
+
+        Cada clave se combina con AND; un valor lista/tupla se combina con OR:
+        {"list": ["A", "B"], "address": "10.0.0.1"} →
+        ?list=A ?list=B ?#| ?address=10.0.0.1
+        """
+        words = []
+        for key, value in (queries or {}).items():
+            if key == "id":
+                key = ".id"
+            if isinstance(value, (list, tuple, set)):
+                values = list(value)
+                if not values:
+                    raise ValueError(f"Filtro vacío para {key}")
+                words.extend(f"?{key}={v}" for v in values)
+                if len(values) > 1:
+                    words.append("?#" + "|" * (len(values) - 1))
             else:
-                raise ValueError(f"Método no soportado: {method}")
+                words.append(f"?{key}={value}")
+        return words
+    
+    @classmethod
+    def build_command(
+        cls,
+        path: str,
+        method: str = "get",
+        params: Optional[Dict] = None,
+        queries: Optional[Dict[str, Any]] = None,
+        proplist: Optional[Sequence[str]] = None,
+        count_only: bool = False
+    ) -> List[str]:
+        """Construye las palabras del comando API (get → print, id → .id)"""
+        if method not in ("get", "add", "set", "remove"):
+            raise ValueError(f"Método no soportado: {method}")
+        
+        command = "print" if method == "get" else method
+        words = [f"{path.rstrip('/')}/{command}"]
+        for key, value in (params or {}).items():
+            if key == "id":
+                key = ".id"
+            words.append(f"={key}={value}")
+        if (queries or proplist or count_only) and method != "get":
+            raise ValueError("Filtros, proyección y conteo solo aplican a lecturas (get)")
+        if count_only:
+            words.append("=count-only=")
+        elif proplist:
+            words.append(f"=.proplist={','.join(proplist)}")
+        if queries:
+            words.extend(cls.build_query(queries))
+        return words
+    
+    async def execute(
+        self,
+        path: str,
+        method: str = "get",
+        params: Optional[Dict] = None,
+        queries: Optional[Dict[str, Any]] = None,
+        proplist: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Ejecuta comando en la API
+
+        queries se envía como palabras ?clave=valor para que el router
+        devuelva solo las filas que coinciden; proplist (=.proplist=) limita
+        las columnas devueltas a las indicadas.
+        """
+        if not self.is_connected:
+            raise Exception("No hay conexión activa. Llamar connect() primero.")
+        
+        try:
+            words = self.build_command(path, method, params, queries, proplist)
+            rows, done = await asyncio.wait_for(self.connection.talk(words), self.timeout)
             
-            return result if isinstance(result, list) else [result]
+            # add devuelve el *ID creado en !done (=ret=)
+            if rows:
+                return rows
+            return [done] if done else []
             
         except Exception as e:
             logger.error("mikrotik_api_execute_error", path=path, method=method, error=str(e))
             raise
     
+    async def execute_many(self, commands: Sequence[Dict[str, Any]], window: Optional[int] = None) -> List[Any]:
+        """Ejecuta varios comandos en pipeline sobre la misma conexión
+        
+        Cada comando es un dict con los argumentos de execute() (path, method,
+        params, queries, proplist). Se mantienen hasta `window` comandos en
+        vuelo a la vez, emparejados por .tag, en lugar de pagar un RTT por cada
+        uno. Devuelve, en el mismo orden, el resultado o la excepción de cada
+        comando.
+        """
+        semaphore = asyncio.Semaphore(window or settings.MT_PIPELINE_WINDOW)
+        
+        async def run(command: Dict[str, Any]):
+            async with semaphore:
+                return await self.execute(**command)
+        
+        return await asyncio.gather(*(run(c) for c in commands), return_exceptions=True)
+    
+    async def count(self, path: str, queries: Optional[Dict[str, Any]] = None) -> int:
+        """Cuenta filas en el router (print count-only) sin transferirlas"""
+        try:
+            words = self.build_command(path, "get", queries=queries, count_only=True)
+            _, done = await asyncio.wait_for(self.connection.talk(words), self.timeout)
+            return int(done.get("ret", 0))
+        except Exception as e:
+            logger.error("mikrotik_api_count_error", path=path, error=str(e))
+            raise
+    
     # === Métodos específicos ===
     
-    def get_dhcp_leases(self, status: Optional[str] = None) -> List[Dict]:
-        """Obtiene leases DHCP"""
+    async def get_dhcp_leases(
+        self,
+        status: Optional[str] = None,
+        address: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> List[DhcpLease]:
+        """Obtiene leases DHCP (filtrados en el router)"""
         try:
-            leases = self.execute("/ip/dhcp-server/lease", "get")
-            
+            queries = {}
             if status:
-                leases = [lease for lease in leases if lease.get("status") == status]
+                queries["status"] = status
+            if address:
+                queries["address"] = address
             
-            return leases
+            rows = await self.execute("/ip/dhcp-server/lease", "get", queries=queries, proplist=fields)
+            return DhcpLease.from_rows(rows)
         except Exception as e:
             logger.error("get_dhcp_leases_error", error=str(e))
             raise
     
-    def get_address_list(self, list_name: Optional[str] = None) -> List[Dict]:
-        """Obtiene entradas de address-list"""
+    async def get_address_list(
+        self,
+        list_name: Optional[str] = None,
+        address: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> List[AddressListItem]:
+        """Obtiene entradas de address-list (filtradas en el router)"""
         try:
-            entries = self.execute("/ip/firewall/address-list", "get")
-            
+            queries = {}
             if list_name:
-                entries = [e for e in entries if e.get("list") == list_name]
+                queries["list"] = list_name
+            if address:
+                queries["address"] = address
             
-            return entries
+            rows = await self.execute("/ip/firewall/address-list", "get", queries=queries, proplist=fields)
+            return AddressListItem.from_rows(rows)
         except Exception as e:
             logger.error("get_address_list_error", error=str(e))
             raise
     
-    def add_to_address_list(self, list_name: str, address: str, comment: Optional[str] = None) -> Dict:
+    async def add_to_address_list(self, list_name: str, address: str, comment: Optional[str] = None) -> Dict:
         """Agrega entrada a address-list"""
         try:
             params = {
@@ -136,7 +245,7 @@ class MikroTikAPIClient:
             if comment:
                 params["comment"] = comment
             
-            result = self.execute("/ip/firewall/address-list", "add", params)
+            result = await self.execute("/ip/firewall/address-list", "add", params)
             logger.info("address_list_added", list=list_name, address=address)
             return result
         except Exception as e:
@@ -147,41 +256,44 @@ class MikroTikAPIClient:
             logger.error("add_address_list_error", list=list_name, address=address, error=str(e))
             raise
     
-    def remove_from_address_list(self, entry_id: str) -> bool:
+    async def remove_from_address_list(self, entry_id: str) -> bool:
         """Elimina entrada de address-list por ID"""
         try:
-            self.execute("/ip/firewall/address-list", "remove", {"id": entry_id})
+            await self.execute("/ip/firewall/address-list", "remove", {"id": entry_id})
             logger.info("address_list_removed", id=entry_id)
             return True
         except Exception as e:
             logger.error("remove_address_list_error", id=entry_id, error=str(e))
             raise
     
-    def remove_from_address_list_by_address(self, list_name: str, address: str) -> int:
+    async def remove_from_address_list_by_address(self, list_name: str, address: str) -> int:
         """Elimina entrada(s) de address-list por nombre de lista y dirección
         
         Returns:
             int: Número de entradas eliminadas
         """
         try:
-            # Buscar todas las entradas que coincidan
-            entries = self.get_address_list(list_name)
-            removed_count = 0
+            # Buscar solo las entradas que coincidan (filtro en el router)
+            entries = await self.get_address_list(list_name, address, fields=(".id",))
+            # Probar con ambos formatos: 'id' y '.id'
+            entry_ids = [e.get("id") or e.get(".id") for e in entries]
+            entry_ids = [entry_id for entry_id in entry_ids if entry_id]
             
-            for entry in entries:
-                if entry.get("address") == address:
-                    # Probar con ambos formatos: 'id' y '.id'
-                    entry_id = entry.get("id") or entry.get(".id")
-                    if entry_id:
-                        try:
-                            self.remove_from_address_list(entry_id)
-                            removed_count += 1
-                            logger.info("address_list_entry_removed", 
-                                       list=list_name, 
-                                       address=address, 
-                                       id=entry_id)
-                        except Exception as e:
-                            logger.warning(f"No se pudo eliminar entrada {entry_id}: {e}")
+            # Los remove van en pipeline por la misma conexión
+            results = await asyncio.gather(
+                *(self.remove_from_address_list(entry_id) for entry_id in entry_ids),
+                return_exceptions=True
+            )
+            removed_count = 0
+            for entry_id, result in zip(entry_ids, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"No se pudo eliminar entrada {entry_id}: {result}")
+                    continue
+                removed_count += 1
+                logger.info("address_list_entry_removed", 
+                           list=list_name, 
+                           address=address, 
+                           id=entry_id)
             
             if removed_count > 0:
                 logger.info("address_list_cleanup_complete", 
@@ -201,15 +313,243 @@ class MikroTikAPIClient:
                         error=str(e))
             raise
     
-    def get_simple_queues(self) -> List[Dict]:
+    async def remove_from_address_lists_by_address(self, list_names: Sequence[str], address: str) -> Dict[str, int]:
+        """Elimina una dirección de varias listas a la vez (en pipeline)
+        
+        Returns:
+            Dict[str, int]: entradas eliminadas por lista
+        """
+        counts = await asyncio.gather(
+            *(self.remove_from_address_list_by_address(name, address) for name in list_names)
+        )
+        return dict(zip(list_names, counts))
+
+    async def move_to_address_list(
+        self,
+        address: str,
+        target_list: str,
+        list_names: Sequence[str],
+        comment: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Deja la dirección únicamente en target_list dentro de list_names
+
+        Una lectura (?address= y ?list= con OR) y luego, enviados juntos en
+        pipeline, el remove de todas las entradas sobrantes (un solo comando
+        con los .id separados por coma) y el add en la lista objetivo. Si la
+        dirección ya está en target_list se conserva esa entrada (actualizando
+        el comentario) en lugar de borrarla y recrearla, así el remove y el add
+        nunca compiten por la misma entrada.
+
+        Returns:
+            {"status": "added" | "kept", "id": *ID en target_list,
+             "removed": {lista: entradas eliminadas}}
+        """
+        path = "/ip/firewall/address-list"
+        entries = await self.execute(
+            path, "get",
+            queries={"address": address, "list": list(list_names)},
+            proplist=(".id", "list")
+        )
+
+        keep_id = None
+        remove_ids = []
+        removed: Dict[str, int] = {}
+        for entry in entries:
+            entry_id = entry.get("id") or entry.get(".id")
+            if not entry_id:
+                continue
+            if entry.get("list") == target_list and keep_id is None:
+                keep_id = entry_id
+                continue
+            remove_ids.append(entry_id)
+            removed[entry.get("list")] = removed.get(entry.get("list"), 0) + 1
+
+        commands = []
+        if remove_ids:
+            commands.append({"path": path, "method": "remove", "params": {"id": ",".join(remove_ids)}})
+        if keep_id is None:
+            params = {"list": target_list, "address": address}
+            if comment:
+                params["comment"] = comment
+            commands.append({"path": path, "method": "add", "params": params})
+        elif comment:
+            commands.append({"path": path, "method": "set", "params": {"id": keep_id, "comment": comment}})
+
+        outcomes = await self.execute_many(commands)
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+
+        if keep_id is None:
+            result = {"status": "added", "id": outcomes[-1][0].get("ret") if outcomes[-1] else None}
+        else:
+            result = {"status": "kept", "id": keep_id}
+        result["removed"] = removed
+
+        logger.info(
+            "address_list_moved",
+            address=address,
+            list=target_list,
+            status=result["status"],
+            removed=removed
+        )
+        return result
+
+    async def apply_address_list_changes(
+        self,
+        additions: Sequence[Dict[str, Any]] = (),
+        removals: Sequence[Dict[str, Any]] = ()
+    ) -> List[Dict[str, Any]]:
+        """Aplica en lote altas y bajas de address-list
+
+        additions: dicts con list, address y comment opcional.
+        removals: dicts con list y address.
+
+        Se hace una sola lectura de las listas implicadas (.id, list, address) y
+        luego los remove y los add van en pipeline, primero las bajas y después
+        las altas. Devuelve un resultado por elemento (bajas y luego altas) con
+        status removed / not_found / added / already_exists / error.
+        """
+        path = "/ip/firewall/address-list"
+        list_names = sorted({item["list"] for item in [*additions, *removals]})
+        if not list_names:
+            return []
+
+        entries = await self.execute(
+            path, "get", queries={"list": list_names}, proplist=(".id", "list", "address")
+        )
+        existing: Dict[tuple, List[str]] = {}
+        for entry in entries:
+            entry_id = entry.get("id") or entry.get(".id")
+            if entry_id:
+                existing.setdefault((entry.get("list"), entry.get("address")), []).append(entry_id)
+
+        results: List[Dict[str, Any]] = []
+
+        # Bajas: un remove por (lista, dirección) con todos sus .id
+        commands = []
+        pending = []
+        for item in removals:
+            result = {"action": "remove", "list": item["list"], "address": item["address"]}
+            results.append(result)
+            entry_ids = existing.pop((item["list"], item["address"]), None)
+            if not entry_ids:
+                result["status"] = "not_found"
+                continue
+            result["removed"] = len(entry_ids)
+            commands.append({"path": path, "method": "remove", "params": {"id": ",".join(entry_ids)}})
+            pending.append(result)
+
+        for result, outcome in zip(pending, await self.execute_many(commands)):
+            if isinstance(outcome, Exception):
+                result.update(status="error", removed=0, error=str(outcome))
+            else:
+                result["status"] = "removed"
+
+        # Altas: se omiten las que ya existen en el router
+        pending = []
+        for item in additions:
+            key = (item["list"], item["address"])
+            if key in existing:
+                results.append({
+                    "action": "add", "list": item["list"], "address": item["address"], "status": "already_exists"
+                })
+                continue
+            existing[key] = []
+            pending.append(item)
+        results.extend(await self._add_address_list_entries(pending))
+
+        logger.info(
+            "address_list_bulk_applied",
+            additions=len(additions),
+            removals=len(removals),
+            errors=sum(1 for r in results if r["status"] == "error")
+        )
+        return results
+
+    async def _add_address_list_entries(self, additions: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Altas de address-list en pipeline con resultado por elemento (added / already_exists / error)"""
+        path = "/ip/firewall/address-list"
+        commands = []
+        results = []
+        for item in additions:
+            results.append({"action": "add", "list": item["list"], "address": item["address"]})
+            params = {"list": item["list"], "address": item["address"]}
+            if item.get("comment"):
+                params["comment"] = item["comment"]
+            commands.append({"path": path, "method": "add", "params": params})
+
+        for result, outcome in zip(results, await self.execute_many(commands)):
+            if isinstance(outcome, Exception):
+                message = str(outcome)
+                if "already have" in message.lower() or "duplicate" in message.lower():
+                    result["status"] = "already_exists"
+                else:
+                    result.update(status="error", error=message)
+            else:
+                result["status"] = "added"
+                result["id"] = outcome[0].get("ret") if outcome else None
+        return results
+
+    async def apply_address_list_diff(
+        self,
+        removals: Sequence[Dict[str, Any]] = (),
+        additions: Sequence[Dict[str, Any]] = ()
+    ) -> List[Dict[str, Any]]:
+        """Aplica altas y bajas ya calculadas (reconciliación) sin releer las listas
+
+        removals: dicts con .id, list y address. Las bajas van por .id en
+        bloques de RECONCILE_REMOVE_CHUNK (un remove con los .id separados por
+        coma); si un bloque falla, p.ej. porque alguien borró una entrada
+        entretanto, ese bloque se reintenta entrada por entrada.
+        additions: como en apply_address_list_changes, sin comprobar existencia.
+        """
+        path = "/ip/firewall/address-list"
+        chunks = [
+            removals[i:i + RECONCILE_REMOVE_CHUNK]
+            for i in range(0, len(removals), RECONCILE_REMOVE_CHUNK)
+        ]
+        outcomes = await self.execute_many([
+            {"path": path, "method": "remove", "params": {"id": ",".join(item[".id"] for item in chunk)}}
+            for chunk in chunks
+        ])
+
+        results: List[Dict[str, Any]] = []
+        retry = []
+        for chunk, outcome in zip(chunks, outcomes):
+            if isinstance(outcome, Exception):
+                retry.extend(chunk)
+                continue
+            results.extend(
+                {"action": "remove", "list": item["list"], "address": item["address"], "status": "removed"}
+                for item in chunk
+            )
+
+        outcomes = await self.execute_many([
+            {"path": path, "method": "remove", "params": {"id": item[".id"]}} for item in retry
+        ])
+        for item, outcome in zip(retry, outcomes):
+            result = {"action": "remove", "list": item["list"], "address": item["address"], "status": "removed"}
+            if isinstance(outcome, Exception):
+                if "no such item" in str(outcome).lower():
+                    result["status"] = "not_found"
+                else:
+                    result.update(status="error", error=str(outcome))
+            results.append(result)
+
+        results.extend(await self._add_address_list_entries(additions))
+        return results
+
+    async def get_simple_queues(self, fields: Optional[Sequence[str]] = None) -> List[SimpleQueue]:
         """Obtiene simple queues"""
         try:
-            return self.execute("/queue/simple", "get")
+            rows = await self.execute("/queue/simple", "get", proplist=fields)
+            return SimpleQueue.from_rows(rows)
         except Exception as e:
             logger.error("get_simple_queues_error", error=str(e))
             raise
     
-    def add_simple_queue(
+    async def add_simple_queue(
         self,
         name: str,
         target: str,
@@ -238,37 +578,148 @@ class MikroTikAPIClient:
             if comment:
                 params["comment"] = comment
             
-            result = self.execute("/queue/simple", "add", params)
+            result = await self.execute("/queue/simple", "add", params)
             logger.info("simple_queue_added", name=name, target=target)
             return result
         except Exception as e:
             logger.error("add_simple_queue_error", name=name, error=str(e))
             raise
     
-    def remove_simple_queue(self, queue_id: str) -> bool:
+    async def update_simple_queue(self, queue_id: str, **fields) -> bool:
+        """Actualiza una simple queue (claves con guion bajo → guion: max_limit → max-limit)"""
+        try:
+            params = {"id": queue_id}
+            for key, value in fields.items():
+                if value is not None:
+                    params[key.replace("_", "-")] = value
+            
+            await self.execute("/queue/simple", "set", params)
+            logger.info("simple_queue_updated", id=queue_id)
+            return True
+        except Exception as e:
+            logger.error("update_simple_queue_error", id=queue_id, error=str(e))
+            raise
+    
+    async def remove_simple_queue(self, queue_id: str) -> bool:
         """Elimina una simple queue"""
         try:
-            self.execute("/queue/simple", "remove", {"id": queue_id})
+            await self.execute("/queue/simple", "remove", {"id": queue_id})
             logger.info("simple_queue_removed", id=queue_id)
             return True
         except Exception as e:
             logger.error("remove_simple_queue_error", id=queue_id, error=str(e))
             raise
     
-    def get_system_resource(self) -> Dict:
+    async def apply_simple_queue_changes(
+        self,
+        creates: Sequence[Dict[str, Any]] = (),
+        updates: Sequence[Dict[str, Any]] = (),
+        removals: Sequence[str] = ()
+    ) -> List[Dict[str, Any]]:
+        """Altas, cambios y bajas de simple queues en pipeline
+
+        creates: parámetros de RouterOS (name, target, max-limit, comment...).
+        updates: id más los campos a cambiar. removals: .id a eliminar.
+        Devuelve, en el mismo orden (altas, cambios, bajas), status ok / error
+        y el .id creado en las altas.
+        """
+        path = "/queue/simple"
+        commands = [
+            *({"path": path, "method": "add", "params": dict(item)} for item in creates),
+            *({"path": path, "method": "set", "params": dict(item)} for item in updates),
+            *({"path": path, "method": "remove", "params": {"id": queue_id}} for queue_id in removals),
+        ]
+        results = []
+        for command, outcome in zip(commands, await self.execute_many(commands)):
+            if isinstance(outcome, Exception):
+                results.append({"status": "error", "error": str(outcome)})
+            elif command["method"] == "add":
+                results.append({"status": "ok", "id": outcome[0].get("ret") if outcome else None})
+            else:
+                results.append({"status": "ok"})
+        logger.info(
+            "simple_queue_bulk_applied",
+            creates=len(creates),
+            updates=len(updates),
+            removals=len(removals),
+            errors=sum(1 for r in results if r["status"] == "error")
+        )
+        return results
+
+    async def ensure_entries(
+        self,
+        path: str,
+        key: str,
+        desired: Sequence[Dict[str, str]],
+        place_before: Optional[Dict[str, str]] = None
+    ) -> Dict[str, str]:
+        """Crea o corrige entradas identificadas por el campo key (name, comment...)
+
+        Una lectura filtrada por los valores de key; luego, en pipeline, un add
+        por cada entrada que falta y un set con solo los campos que difieren.
+        Con place_before (filtro, p.ej. {"chain": "forward"}) las altas se
+        insertan, en orden, antes de la primera entrada que lo cumple.
+        Devuelve {valor de key: .id}.
+        """
+        existing = await self.execute(path, "get", queries={key: [item[key] for item in desired]})
+        by_key = {row.get(key): row for row in existing}
+        anchor = None
+        if place_before and any(item[key] not in by_key for item in desired):
+            first = await self.execute(path, "get", queries=place_before, proplist=[".id"])
+            anchor = next((row.get(".id") for row in first if row.get(".id")), None)
+
+        ids: Dict[str, str] = {}
+        commands = []
+        pending = []
+        for item in desired:
+            row = by_key.get(item[key])
+            if row is None:
+                params = dict(item)
+                if anchor:
+                    params["place-before"] = anchor
+                commands.append({"path": path, "method": "add", "params": params})
+                pending.append(item[key])
+                continue
+            ids[item[key]] = row.get(".id") or row.get("id")
+            changed = {field: value for field, value in item.items() if row.get(field) != value}
+            if changed:
+                commands.append({"path": path, "method": "set", "params": {"id": ids[item[key]], **changed}})
+
+        outcomes = await self.execute_many(commands)
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+        added = [o for c, o in zip(commands, outcomes) if c["method"] == "add"]
+        for value, outcome in zip(pending, added):
+            ids[value] = outcome[0].get("ret") if outcome else None
+        logger.info("entries_ensured", path=path, added=len(pending), updated=len(commands) - len(pending))
+        return ids
+
+    async def remove_entries(self, path: str, key: str, values: Sequence[str]) -> int:
+        """Elimina las entradas cuyo campo key está en values (un print y un remove)"""
+        if not values:
+            return 0
+        existing = await self.execute(path, "get", queries={key: list(values)}, proplist=[".id"])
+        ids = [row.get(".id") for row in existing if row.get(".id")]
+        if ids:
+            await self.execute(path, "remove", {"id": ",".join(ids)})
+        logger.info("entries_removed", path=path, removed=len(ids))
+        return len(ids)
+
+    async def get_system_resource(self, fields: Optional[Sequence[str]] = None) -> Dict:
         """Obtiene recursos del sistema (uptime, version, etc)"""
         try:
-            result = self.execute("/system/resource", "get")
+            result = await self.execute("/system/resource", "get", proplist=fields)
             return result[0] if result else {}
         except Exception as e:
             logger.error("get_system_resource_error", error=str(e))
             raise
     
-    def __enter__(self):
+    async def __aenter__(self):
         """Context manager entry"""
-        self.connect()
+        await self.connect()
         return self
     
-    def __exit__(self, exc_type, exc_val, exc_tb):
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
-        self.disconnect()
+        await self.disconnect()
@@ -0,0 +1,300 @@
+"""Circuit breaker API → SSH compartido por router
+
+El estado vive en un registro del proceso (clave: Router.id o host:puerto)
+para que todas las peticiones al mismo router lo compartan. Las transiciones
+se guardan en la tabla circuit_breaker_states: sobreviven a reinicios y, con
+WORKERS > 1, cada worker sincroniza periódicamente el estado de los demás.
+
+Mientras el breaker está abierto las peticiones van directo a SSH; una tarea
+de fondo prueba la API (conexión + ping) y cierra el breaker cuando responde,
+sin que ninguna petición de usuario pague el timeout.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Dict, Hashable, Optional
+from app.core.logging import get_logger
+from app.core.config import settings
+
+logger = get_logger(__name__)
+
+
+class CircuitState(Enum):
+    """Estados del circuit breaker"""
+    CLOSED = "closed"  # API funcionando normal
+    OPEN = "open"  # API falló, usando SSH
+    HALF_OPEN = "half_open"  # Probando reconexión a API
+
+
+class CircuitBreaker:
+    """Circuit Breaker para API → SSH fallback"""
+
+    def __init__(
+        self,
+        key: Hashable = None,
+        failure_threshold: int = 3,
+        timeout_seconds: int = 300,
+        half_open_max_calls: int = 1
+    ):
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.timeout_seconds = timeout_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.failure_count = 0
+        self.state = CircuitState.CLOSED
+        self.opened_at: Optional[datetime] = None
+        self.half_open_calls = 0
+
+        # Marca del último cambio de estado (para sincronizar entre workers)
+        self.changed_at = datetime.utcnow()
+        # Parámetros de conexión para el sondeo de fondo
+        self.probe_config: Optional[Dict[str, Any]] = None
+        self.last_probe: Optional[datetime] = None
+
+    def _set_state(self, state: CircuitState):
+        self.state = state
+        self.changed_at = datetime.utcnow()
+
+    def record_success(self) -> bool:
+        """Registra éxito (reset); devuelve True si el estado cambió"""
+        changed = self.state != CircuitState.CLOSED
+        self.failure_count = 0
+        self.opened_at = None
+        self.half_open_calls = 0
+        if changed:
+            self._set_state(CircuitState.CLOSED)
+            logger.info("circuit_breaker_closed", key=self.key)
+        return changed
+
+    def record_failure(self) -> bool:
+        """Registra fallo; devuelve True si el breaker se abrió"""
+        self.failure_count += 1
+        logger.warning("circuit_breaker_failure", key=self.key, count=self.failure_count)
+
+        if self.state == CircuitState.HALF_OPEN or (
+            self.state == CircuitState.CLOSED and self.failure_count >= self.failure_threshold
+        ):
+            self.opened_at = datetime.utcnow()
+            self._set_state(CircuitState.OPEN)
+            logger.error("circuit_breaker_opened", key=self.key, failures=self.failure_count)
+            return True
+        return False
+
+    def can_attempt_api(self) -> bool:
+        """Determina si se puede intentar API"""
+        if self.state == CircuitState.CLOSED:
+            return True
+
+        if self.state == CircuitState.OPEN:
+            # Sin sondeo de fondo: pasar a half-open cuando vence el timeout
+            if self.opened_at and datetime.utcnow() - self.opened_at > timedelta(seconds=self.timeout_seconds):
+                self._set_state(CircuitState.HALF_OPEN)
+                self.half_open_calls = 0
+                logger.info("circuit_breaker_half_open", key=self.key)
+            else:
+                return False
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self.half_open_calls < self.half_open_max_calls:
+                self.half_open_calls += 1
+                return True
+            return False
+
+        return False
+
+    def release_half_open(self):
+        """Devuelve el turno de half-open de un intento que terminó sin veredicto
+
+        (recortado por el deadline o cancelado): sin esto el breaker quedaría en
+        HALF_OPEN sin turnos libres y el router solo se atendería por SSH.
+        """
+        if self.state == CircuitState.HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state.value,
+            "failure_count": self.failure_count,
+            "opened_at": self.opened_at,
+            "changed_at": self.changed_at,
+        }
+
+    def apply(self, snapshot: Dict[str, Any]):
+        """Adopta un estado persistido si es más reciente que el local"""
+        if snapshot["changed_at"] is None or snapshot["changed_at"] <= self.changed_at:
+            return
+        state = CircuitState(snapshot["state"])
+        if state != self.state:
+            logger.info("circuit_breaker_synced", key=self.key, state=state.value)
+        self.state = state
+        self.failure_count = snapshot["failure_count"] or 0
+        self.opened_at = snapshot["opened_at"]
+        self.changed_at = snapshot["changed_at"]
+        self.half_open_calls = 0
+
+
+def _store_key(key: Hashable) -> str:
+    return str(key)
+
+
+def _save(key: str, snapshot: Dict[str, Any]):
+    from app.db.database import SessionLocal
+    from app.db.models import CircuitBreakerState
+
+    db = SessionLocal()
+    try:
+        row = db.get(CircuitBreakerState, key)
+        if row is None:
+            row = CircuitBreakerState(key=key)
+            db.add(row)
+        row.state = snapshot["state"]
+        row.failure_count = snapshot["failure_count"]
+        row.opened_at = snapshot["opened_at"]
+        row.changed_at = snapshot["changed_at"]
+        db.commit()
+    finally:
+        db.close()
+
+
+def _load_all() -> Dict[str, Dict[str, Any]]:
+    from app.db.database import SessionLocal
+    from app.db.models import CircuitBreakerState
+
+    db = SessionLocal()
+    try:
+        return {
+            row.key: {
+                "state": row.state,
+                "failure_count": row.failure_count,
+                "opened_at": row.opened_at,
+                "changed_at": row.changed_at,
+            }
+            for row in db.query(CircuitBreakerState).all()
+        }
+    finally:
+        db.close()
+
+
+def _delete(key: str):
+    from app.db.database import SessionLocal
+    from app.db.models import CircuitBreakerState
+
+    db = SessionLocal()
+    try:
+        db.query(CircuitBreakerState).filter(CircuitBreakerState.key == key).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+class CircuitBreakerRegistry:
+    """Breakers por router compartidos por todas las peticiones del proceso"""
+
+    def __init__(self):
+        self._breakers: Dict[Hashable, CircuitBreaker] = {}
+        self._persisted: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, key: Hashable) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                key=key,
+                failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+                timeout_seconds=settings.CIRCUIT_TIMEOUT_SECONDS,
+                half_open_max_calls=settings.CIRCUIT_HALF_OPEN_MAX_CALLS
+            )
+            snapshot = self._persisted.get(_store_key(key))
+            if snapshot:
+                breaker.apply(snapshot)
+            self._breakers[key] = breaker
+        return breaker
+
+    async def persist(self, breaker: CircuitBreaker):
+        """Guarda una transición de estado (errores de DB solo se registran)"""
+        try:
+            await asyncio.to_thread(_save, _store_key(breaker.key), breaker.snapshot())
+        except Exception as e:
+            logger.warning("circuit_breaker_persist_failed", key=breaker.key, error=str(e))
+
+    async def load(self):
+        """Carga el estado persistido (arranque y sincronización entre workers)"""
+        self._persisted = await asyncio.to_thread(_load_all)
+        for key, breaker in self._breakers.items():
+            snapshot = self._persisted.get(_store_key(key))
+            if snapshot:
+                breaker.apply(snapshot)
+
+    async def invalidate(self, key: Hashable):
+        """Olvida el breaker de un router (p.ej. al borrarlo)"""
+        self._breakers.pop(key, None)
+        self._persisted.pop(_store_key(key), None)
+        try:
+            await asyncio.to_thread(_delete, _store_key(key))
+        except Exception as e:
+            logger.warning("circuit_breaker_delete_failed", key=key, error=str(e))
+
+    async def _probe(self, breaker: CircuitBreaker):
+        from app.mikrotik.api_client import MikroTikAPIClient
+
+        breaker.last_probe = datetime.utcnow()
+        client = MikroTikAPIClient(**breaker.probe_config)
+        try:
+            await client.connect()
+            healthy = await client.ping()
+        except Exception as e:
+            logger.info("circuit_breaker_probe_failed", key=breaker.key, error=str(e))
+            healthy = False
+        finally:
+            await client.disconnect()
+
+        if breaker.state == CircuitState.CLOSED:
+            return
+        if healthy:
+            breaker.record_success()
+        else:
+            # Sigue caída: reiniciar la ventana del timeout de half-open
+            breaker.opened_at = datetime.utcnow()
+            breaker._set_state(CircuitState.OPEN)
+        await self.persist(breaker)
+
+    async def probe(self):
+        """Sondea la API de los routers con el breaker abierto"""
+        now = datetime.utcnow()
+        interval = timedelta(seconds=settings.CIRCUIT_PROBE_INTERVAL_SECONDS)
+        due = [
+            breaker for breaker in self._breakers.values()
+            if breaker.state != CircuitState.CLOSED
+            and breaker.probe_config is not None
+            and (breaker.last_probe is None or now - breaker.last_probe >= interval)
+        ]
+        if due:
+            await asyncio.gather(*(self._probe(b) for b in due))
+
+    async def probe_forever(self):
+        """Sondeo de fondo de la API de los routers con el breaker abierto"""
+        while True:
+            await asyncio.sleep(settings.CIRCUIT_PROBE_INTERVAL_SECONDS)
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.warning("circuit_probe_failed", error=str(e))
+
+    async def sync_forever(self):
+        """Adopta los cambios de estado hechos por otros workers (WORKERS > 1)"""
+        while True:
+            await asyncio.sleep(settings.CIRCUIT_SYNC_INTERVAL_SECONDS)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.warning("circuit_sync_failed", error=str(e))
+
+    def stats(self) -> Dict[Hashable, Dict[str, Any]]:
+        return {
+            key: {"state": b.state.value, "failure_count": b.failure_count, "opened_at": b.opened_at}
+            for key, b in self._breakers.items()
+        }
+
+
+# Registro global del proceso
+breaker_registry = CircuitBreakerRegistry()
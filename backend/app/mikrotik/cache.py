@@ -0,0 +1,289 @@
+"""Caché de lecturas MikroTik por router y ruta (read-through)
+
+- TTL configurable; pasado el TTL y dentro de la ventana stale se devuelve
+  el valor viejo y se refresca en segundo plano (stale-while-revalidate).
+- Tamaño acotado con expulsión LRU.
+- Las escrituras invalidan solo las entradas de esa ruta cuyos filtros
+  pueden coincidir con las filas escritas; una lectura que estaba en curso
+  durante la escritura no guarda su resultado.
+- Con WORKERS > 1 cada escritura sube una versión por router y ruta en la
+  tabla mikrotik_cache_versions y las lecturas la comparan antes de usar la
+  caché (como mucho una consulta por router y ruta cada
+  MT_CACHE_VERSION_CHECK_SECONDS): una escritura hecha por otro worker
+  descarta las entradas de esa ruta.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Sequence, Tuple
+from app.core.deadline import set_deadline
+from app.core.logging import get_logger
+from app.core.config import settings
+
+logger = get_logger(__name__)
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(str(v) for v in value))
+    return value
+
+
+def copy_rows(value: Any) -> Any:
+    """Copia filas (listas de dicts o dict) para que el llamador no altere la caché
+
+    Los registros tipados (records.py) son de solo lectura y se comparten.
+    """
+    if isinstance(value, list):
+        return [dict(row) if isinstance(row, dict) else row for row in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+def affects(queries: Optional[Dict[str, Any]], row: Dict[str, Any]) -> bool:
+    """¿Puede una fila escrita cambiar el resultado de una lectura con estos filtros?
+
+    Solo se descarta la lectura si algún filtro sobre un campo conocido de la
+    fila no coincide (p.ej. escribir en INET_BLOQUEADO no afecta a ?list=INET_PERMITIDO).
+    """
+    for key, value in (queries or {}).items():
+        if key not in row:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            if str(row[key]) not in {str(v) for v in value}:
+                return False
+        elif str(row[key]) != str(value):
+            return False
+    return True
+
+
+def _version_key(router_key: Hashable, path: str) -> str:
+    return f"{router_key}|{path}"
+
+
+def _load_version(key: str) -> int:
+    from app.db.database import SessionLocal
+    from app.db.models import CacheVersion
+
+    db = SessionLocal()
+    try:
+        row = db.get(CacheVersion, key)
+        return row.version if row is not None else 0
+    finally:
+        db.close()
+
+
+def _bump_version(key: str):
+    from sqlalchemy.exc import IntegrityError
+    from app.db.database import SessionLocal
+    from app.db.models import CacheVersion
+
+    db = SessionLocal()
+    try:
+        # UPDATE atómico: dos workers que escriben a la vez suman ambos
+        updated = db.query(CacheVersion).filter(CacheVersion.key == key).update(
+            {CacheVersion.version: CacheVersion.version + 1}, synchronize_session=False
+        )
+        if not updated:
+            db.add(CacheVersion(key=key, version=1))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Otro worker creó la fila entre el UPDATE y el INSERT
+            db.rollback()
+            db.query(CacheVersion).filter(CacheVersion.key == key).update(
+                {CacheVersion.version: CacheVersion.version + 1}, synchronize_session=False
+            )
+            db.commit()
+    finally:
+        db.close()
+
+
+def read_key(router_key: Hashable, path: str, variant: str, queries, fields) -> Tuple:
+    """Clave de una lectura: router, ruta, tipo, filtros y columnas"""
+    return (router_key, path, variant, _freeze(queries or {}), tuple(fields or ()))
+
+
+class _Entry:
+    __slots__ = ("value", "loaded_at", "queries")
+
+    def __init__(self, value: Any, queries: Optional[Dict[str, Any]]):
+        self.value = value
+        self.loaded_at = time.monotonic()
+        self.queries = queries
+
+
+class ReadCache:
+    """Caché LRU de lecturas con TTL y stale-while-revalidate"""
+
+    def __init__(
+        self,
+        ttl: float = 5,
+        stale: float = 30,
+        max_entries: int = 1024,
+        shared: bool = False,
+        version_check_seconds: float = 1
+    ):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._generations: Dict[Tuple[Hashable, str], int] = {}
+        self._refreshing: Dict[Tuple, asyncio.Task] = {}
+        # Versión compartida (tabla) vista por última vez para cada router y ruta
+        self.shared = shared
+        self._seen_versions: Dict[Tuple[Hashable, str], int] = {}
+        # Última consulta de esa versión (monotonic): no se pregunta a la DB en cada lectura
+        self.version_check_seconds = version_check_seconds
+        self._checked_at: Dict[Tuple[Hashable, str], float] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _store(self, key: Tuple, generation: int, value: Any, queries):
+        if self._generations.get(key[:2], 0) != generation:
+            # Hubo una escritura mientras se leía: el resultado puede estar viejo
+            return
+        self._entries[key] = _Entry(value, queries)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _load(self, key: Tuple, queries, loader: Callable[[], Awaitable[Any]]) -> Any:
+        generation = self._generations.get(key[:2], 0)
+        value = await loader()
+        self._store(key, generation, value, queries)
+        return value
+
+    def _refresh(self, key: Tuple, queries, loader: Callable[[], Awaitable[Any]]):
+        if key in self._refreshing:
+            return
+
+        async def run():
+            # El refresco sigue aunque la petición que lo disparó ya respondió
+            set_deadline(None)
+            try:
+                await self._load(key, queries, loader)
+            except Exception as e:
+                logger.warning("mikrotik_cache_refresh_failed", path=key[1], error=str(e))
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(run())
+
+    async def get(
+        self,
+        router_key: Hashable,
+        path: str,
+        variant: str,
+        loader: Callable[[], Awaitable[Any]],
+        queries: Optional[Dict[str, Any]] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Any:
+        """Devuelve la lectura cacheada o la carga con loader()"""
+        value, cached = await self.lookup(router_key, path, variant, loader, queries, fields)
+        return value
+
+    async def lookup(
+        self,
+        router_key: Hashable,
+        path: str,
+        variant: str,
+        loader: Callable[[], Awaitable[Any]],
+        queries: Optional[Dict[str, Any]] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Tuple[Any, bool]:
+        """Como get, pero devuelve (valor, cached): cached=False si esta llamada ejecutó loader()"""
+        key = read_key(router_key, path, variant, queries, fields)
+        if self.shared:
+            try:
+                await self._sync_version(router_key, path)
+            except Exception as e:
+                # Sin la versión compartida la caché podría estar vieja: se lee del router
+                logger.warning("mikrotik_cache_version_failed", path=path, error=str(e))
+                self.misses += 1
+                return copy_rows(await loader()), False
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.loaded_at
+            if age <= self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return copy_rows(entry.value), True
+            if age <= self.ttl + self.stale:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._refresh(key, queries, loader)
+                return copy_rows(entry.value), True
+
+        self.misses += 1
+        value = await self._load(key, queries, loader)
+        return copy_rows(value), False
+
+    async def _sync_version(self, router_key: Hashable, path: str):
+        """Descarta la ruta si otro worker escribió en ella desde la última consulta"""
+        scope = (router_key, path)
+        now = time.monotonic()
+        if now - self._checked_at.get(scope, float("-inf")) < self.version_check_seconds:
+            return
+        version = await asyncio.to_thread(_load_version, _version_key(router_key, path))
+        self._checked_at[scope] = now
+        if self._seen_versions.get(scope) != version:
+            self._seen_versions[scope] = version
+            self.invalidate(router_key, path)
+
+    async def publish(self, router_key: Hashable, path: str):
+        """Anuncia a los demás workers una escritura en la ruta (solo con shared)"""
+        if not self.shared:
+            return
+        try:
+            await asyncio.to_thread(_bump_version, _version_key(router_key, path))
+        except Exception as e:
+            logger.warning("mikrotik_cache_publish_failed", path=path, error=str(e))
+
+    def invalidate(self, router_key: Hashable, path: str, rows: Optional[Iterable[Dict[str, Any]]] = None):
+        """Descarta las lecturas de la ruta afectadas por las filas escritas
+
+        Sin rows (p.ej. borrado por .id) se descarta toda la ruta del router.
+        """
+        scope = (router_key, path)
+        self._generations[scope] = self._generations.get(scope, 0) + 1
+        rows = list(rows) if rows is not None else None
+        for key in [k for k in self._entries if k[:2] == scope]:
+            entry = self._entries[key]
+            if rows is None or any(affects(entry.queries, row) for row in rows):
+                del self._entries[key]
+
+    def clear(self, router_key: Optional[Hashable] = None):
+        if router_key is None:
+            self._entries.clear()
+            self._seen_versions.clear()
+            self._checked_at.clear()
+            return
+        for key in [k for k in self._entries if k[0] == router_key]:
+            del self._entries[key]
+        for scope in [s for s in self._seen_versions if s[0] == router_key]:
+            del self._seen_versions[scope]
+        for scope in [s for s in self._checked_at if s[0] == router_key]:
+            del self._checked_at[scope]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+
+# Caché global del proceso
+read_cache = ReadCache(
+    ttl=settings.MT_CACHE_TTL_SECONDS,
+    stale=settings.MT_CACHE_STALE_SECONDS,
+    max_entries=settings.MT_CACHE_MAX_ENTRIES,
+    shared=settings.WORKERS > 1,
+    version_check_seconds=settings.MT_CACHE_VERSION_CHECK_SECONDS
+)
@@ -1,79 +1,28 @@
 """Orquestador de clientes MikroTik con Circuit Breaker"""
-from enum import Enum
-from typing import Optional, Any, Callable
-from datetime import datetime, timedelta
-from app.mikrotik.api_client import MikroTikAPIClient
+import asyncio
+import time
+from typing import Optional, Any, Callable, Sequence
+from app.mikrotik.breaker import CircuitBreaker, CircuitState, breaker_registry
+from app.mikrotik.mirror import TableMirror, mirror_registry
+from app.mikrotik.cache import read_cache, read_key
+from app.mikrotik.latency import latency_registry
+from app.mikrotik.pool import pool_registry
+from app.mikrotik.queue_index import QueueIndex, queue_index_registry
+from app.mikrotik.scheduler import INTERACTIVE, scheduler_registry
+from app.mikrotik.singleflight import single_flight
+from app.mikrotik.protocol import RouterOSTrapError
 from app.mikrotik.ssh_client import MikroTikSSHClient
+from app.mikrotik.ssh_pool import ssh_registry
+from app.core.deadline import DeadlineExceeded, budget
 from app.core.logging import get_logger
 from app.core.config import settings
 
 logger = get_logger(__name__)
 
-
-class CircuitState(Enum):
-    """Estados del circuit breaker"""
-    CLOSED = "closed"  # API funcionando normal
-    OPEN = "open"  # API falló, usando SSH
-    HALF_OPEN = "half_open"  # Probando reconexión a API
-
-
-class CircuitBreaker:
-    """Circuit Breaker para API → SSH fallback"""
-    
-    def __init__(
-        self,
-        failure_threshold: int = 3,
-        timeout_seconds: int = 300,
-        half_open_max_calls: int = 1
-    ):
-        self.failure_threshold = failure_threshold
-        self.timeout_seconds = timeout_seconds
-        self.half_open_max_calls = half_open_max_calls
-        
-        self.failure_count = 0
-        self.state = CircuitState.CLOSED
-        self.opened_at: Optional[datetime] = None
-        self.half_open_calls = 0
-    
-    def record_success(self):
-        """Registra éxito (reset)"""
-        self.failure_count = 0
-        self.state = CircuitState.CLOSED
-        self.opened_at = None
-        self.half_open_calls = 0
-        logger.info("circuit_breaker_closed")
-    
-    def record_failure(self):
-        """Registra fallo"""
-        self.failure_count += 1
-        logger.warning("circuit_breaker_failure", count=self.failure_count)
-        
-        if self.failure_count >= self.failure_threshold:
-            self.state = CircuitState.OPEN
-            self.opened_at = datetime.utcnow()
-            logger.error("circuit_breaker_opened", failures=self.failure_count)
-    
-    def can_attempt_api(self) -> bool:
-        """Determina si se puede intentar API"""
-        if self.state == CircuitState.CLOSED:
-            return True
-        
-        if self.state == CircuitState.OPEN:
-            # Verificar si pasó el timeout
-            if self.opened_at and datetime.utcnow() - self.opened_at > timedelta(seconds=self.timeout_seconds):
-                self.state = CircuitState.HALF_OPEN
-                self.half_open_calls = 0
-                logger.info("circuit_breaker_half_open")
-                return True
-            return False
-        
-        if self.state == CircuitState.HALF_OPEN:
-            if self.half_open_calls < self.half_open_max_calls:
-                self.half_open_calls += 1
-                return True
-            return False
-        
-        return False
+DHCP_LEASE_PATH = "/ip/dhcp-server/lease"
+ADDRESS_LIST_PATH = "/ip/firewall/address-list"
+SIMPLE_QUEUE_PATH = "/queue/simple"
+QUEUE_INDEX_FIELDS = (".id", "target")
 
 
 class MikroTikClient:
@@ -88,8 +37,11 @@ class MikroTikClient:
         ssh_port: int = 22,
         use_ssl: bool = False,
         ssl_verify: bool = False,
-        timeout: int = 10
+        timeout: int = 10,
+        router_id: Optional[int] = None,
+        priority: int = INTERACTIVE
     ):
+        self.router_id = router_id
         self.host = host
         self.username = username
         self.password = password
@@ -98,151 +50,520 @@ class MikroTikClient:
         self.use_ssl = use_ssl
         self.ssl_verify = ssl_verify
         self.timeout = timeout
+        # Carril del planificador del router (interactive, bulk o background)
+        self.priority = priority
         
-        # Circuit breaker
-        self.circuit_breaker = CircuitBreaker(
-            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
-            timeout_seconds=settings.CIRCUIT_TIMEOUT_SECONDS,
-            half_open_max_calls=settings.CIRCUIT_HALF_OPEN_MAX_CALLS
-        )
+        # Circuit breaker compartido por todas las peticiones a este router.
+        # Los datos de sondeo se fijan siempre: un breaker abierto por otro
+        # worker (sync_forever) también tiene que poder sondearse aquí
+        self.circuit_breaker = breaker_registry.get(self.pool_key)
+        self.circuit_breaker.probe_config = self.api_config()
         
-        # Clientes
-        self.api_client: Optional[MikroTikAPIClient] = None
+        # Clientes (la conexión API se toma prestada del pool del router)
         self.ssh_client: Optional[MikroTikSSHClient] = None
         self.method_used: str = "UNKNOWN"
     
-    def _execute_with_fallback(self, api_func: Callable, ssh_func: Optional[Callable] = None) -> Any:
-        """Ejecuta función con fallback API → SSH"""
+    @classmethod
+    def from_router(cls, router_obj, priority: int = INTERACTIVE) -> "MikroTikClient":
+        """Crea el cliente a partir de un modelo Router"""
+        return cls(
+            host=router_obj.host,
+            username=router_obj.username,
+            password=router_obj.password,
+            api_port=router_obj.api_port,
+            ssh_port=router_obj.ssh_port,
+            use_ssl=router_obj.use_ssl,
+            ssl_verify=router_obj.ssl_verify,
+            timeout=router_obj.timeout,
+            router_id=router_obj.id,
+            priority=priority
+        )
+    
+    @property
+    def pool_key(self):
+        """Clave del pool: Router.id, o host:puerto para clientes ad-hoc"""
+        if self.router_id is not None:
+            return self.router_id
+        return f"{self.host}:{self.api_port}"
+    
+    def api_config(self) -> dict:
+        """Parámetros de MikroTikAPIClient para este router"""
+        return {
+            "host": self.host,
+            "username": self.username,
+            "password": self.password,
+            "port": self.api_port,
+            "use_ssl": self.use_ssl,
+            "ssl_verify": self.ssl_verify,
+            "timeout": self.timeout
+        }
+    
+    async def _get_pool(self):
+        return await pool_registry.get_pool(self.pool_key, self.api_config())
+    
+    def _mirror_table(self, path: str) -> Optional[TableMirror]:
+        """Tabla espejada y sincronizada de este router (None = leer del router)"""
+        if self.router_id is None:
+            return None
+        table = mirror_registry.table(self.router_id, path)
+        if table is not None:
+            self.method_used = "MIRROR"
+        return table
+    
+    async def _api_call(self, api_func: Callable) -> Any:
+        # Un error de conexión o timeout descarta la conexión; un !trap la devuelve al pool
+        pool = await self._get_pool()
+        async with pool.connection() as api_client:
+            return await api_func(api_client)
+    
+    async def _execute_with_fallback(
+        self,
+        api_func: Callable,
+        ssh_func: Optional[Callable] = None,
+        operation: Optional[str] = None
+    ) -> Any:
+        """Ejecuta con fallback API → SSH dentro de un turno del planificador del router"""
+        async with scheduler_registry.get(self.pool_key).slot(self.priority):
+            return await self._call_with_fallback(api_func, ssh_func, operation)
+    
+    async def _call_with_fallback(
+        self,
+        api_func: Callable,
+        ssh_func: Optional[Callable] = None,
+        operation: Optional[str] = None
+    ) -> Any:
+        """Ejecuta función con fallback API → SSH
+
+        api_func recibe un MikroTikAPIClient y devuelve una corrutina; ssh_func
+        es bloqueante (paramiko) y se ejecuta en un hilo para no frenar el event loop.
+
+        Con operation (lecturas) el timeout de la API se adapta a la latencia
+        observada de esa operación en este router. Cada intento se recorta
+        además al tiempo que le queda a la petición HTTP (deadline), de modo
+        que API + fallback nunca superan su presupuesto.
+        """
         
         # Intentar API si circuit breaker lo permite
         if self.circuit_breaker.can_attempt_api():
+            # Sin veredicto (deadline o cancelación) se libera el turno de half-open
+            verdict = False
             try:
-                if not self.api_client:
-                    self.api_client = MikroTikAPIClient(
-                        host=self.host,
-                        username=self.username,
-                        password=self.password,
-                        port=self.api_port,
-                        use_ssl=self.use_ssl,
-                        ssl_verify=self.ssl_verify,
-                        timeout=self.timeout
-                    )
-                    self.api_client.connect()
-                
-                result = api_func(self.api_client)
-                self.circuit_breaker.record_success()
+                timeout = self.timeout
+                if operation is not None:
+                    timeout = latency_registry.timeout(self.pool_key, operation, self.timeout)
+                attempt_timeout = budget(timeout)
+                started = time.monotonic()
+                result = await asyncio.wait_for(self._api_call(api_func), attempt_timeout)
+                verdict = True
+                if operation is not None:
+                    latency_registry.observe(self.pool_key, operation, time.monotonic() - started)
+                if self.circuit_breaker.record_success():
+                    await breaker_registry.persist(self.circuit_breaker)
                 self.method_used = "API"
                 return result
                 
+            except RouterOSTrapError as e:
+                # El router respondió: error del comando, la API está sana.
+                # Repetirlo por SSH daría el mismo rechazo (o aplicaría dos veces)
+                verdict = True
+                logger.warning("api_execution_failed", error=str(e))
+                if self.circuit_breaker.record_success():
+                    await breaker_registry.persist(self.circuit_breaker)
+                self.method_used = "API"
+                raise
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "api_execution_timeout",
+                    host=self.host,
+                    operation=operation,
+                    timeout=round(attempt_timeout, 2)
+                )
+                if operation is not None:
+                    # Tardó al menos eso: la próxima vez el timeout adaptativo será más holgado
+                    latency_registry.observe(self.pool_key, operation, attempt_timeout)
+                # Agotar el timeout del intento (adaptativo o Router.timeout) cuenta
+                # como falla; si lo recortó el deadline de la petición no hay veredicto
+                if attempt_timeout >= timeout:
+                    verdict = True
+                    if self.circuit_breaker.record_failure():
+                        await breaker_registry.persist(self.circuit_breaker)
+            except DeadlineExceeded:
+                raise
             except Exception as e:
+                verdict = True
                 logger.warning("api_execution_failed", error=str(e))
-                self.circuit_breaker.record_failure()
-                
-                # Limpiar cliente API fallido
-                if self.api_client:
-                    try:
-                        self.api_client.disconnect()
-                    except:
-                        pass
-                    self.api_client = None
+                if self.circuit_breaker.record_failure():
+                    await breaker_registry.persist(self.circuit_breaker)
+            finally:
+                if not verdict:
+                    self.circuit_breaker.release_half_open()
         
         # Fallback a SSH
         if ssh_func:
             try:
                 logger.info("using_ssh_fallback", host=self.host)
+                ssh_timeout = budget(self.timeout)
                 
-                if not self.ssh_client:
-                    self.ssh_client = MikroTikSSHClient(
-                        host=self.host,
-                        username=self.username,
-                        password=self.password,
-                        port=self.ssh_port,
-                        timeout=self.timeout
-                    )
-                    self.ssh_client.connect()
+                async def ssh_call():
+                    # Sesión SSH persistente del router (compartida por el proceso)
+                    self.ssh_client = await ssh_registry.get(self.pool_key, {
+                        "host": self.host,
+                        "username": self.username,
+                        "password": self.password,
+                        "port": self.ssh_port,
+                        "timeout": self.timeout
+                    })
+                    return await asyncio.to_thread(ssh_func, self.ssh_client)
                 
-                result = ssh_func(self.ssh_client)
+                # El hilo de paramiko no se puede interrumpir: al vencer el
+                # plazo se deja terminar en segundo plano y se responde ya
+                result = await asyncio.wait_for(ssh_call(), ssh_timeout)
                 self.method_used = "SSH"
                 return result
                 
+            except asyncio.TimeoutError:
+                logger.error("ssh_execution_timeout", host=self.host, operation=operation)
+                if ssh_timeout < self.timeout:
+                    raise DeadlineExceeded("Se agotó el tiempo de la petición esperando al router")
+                raise Exception(f"Timeout SSH tras {self.timeout}s")
             except Exception as e:
                 logger.error("ssh_execution_failed", error=str(e))
+                if self.ssh_client is not None and not self.ssh_client.is_connected:
+                    await ssh_registry.invalidate(self.pool_key, self.ssh_client)
                 raise
         else:
             raise Exception("API falló y no hay función SSH de fallback")
     
-    def get_dhcp_leases(self, status: Optional[str] = None):
-        """Obtiene leases DHCP"""
-        return self._execute_with_fallback(
-            lambda client: client.get_dhcp_leases(status),
-            None  # SSH no soportado para leases en MVP
+    async def execute_many(self, commands: Sequence[dict]):
+        """Ejecuta comandos API en pipeline por una sola conexión (sin fallback SSH)
+        
+        Devuelve por comando su resultado o la excepción correspondiente.
+        """
+        return await self._execute_with_fallback(
+            lambda client: client.execute_many(commands),
+            None
         )
     
-    def get_address_list(self, list_name: Optional[str] = None):
-        """Obtiene address-list"""
-        return self._execute_with_fallback(
-            lambda client: client.get_address_list(list_name),
-            None
+    async def _cached_read(
+        self,
+        path: str,
+        variant: str,
+        queries: Optional[dict],
+        fields: Optional[Sequence[str]],
+        api_func: Callable,
+        ssh_func: Optional[Callable]
+    ) -> Any:
+        """Lectura a través de la caché del router (si está habilitada)
+
+        Las lecturas idénticas concurrentes comparten una sola llamada al router.
+        """
+        key = read_key(self.pool_key, path, variant, queries, fields)
+        # Una consulta filtrada trae pocas filas y la tabla completa puede traer
+        # decenas de miles: cada forma tiene su propia latencia aprendida
+        operation = f"{path}:{variant}:{'filtered' if queries else 'full'}"
+        loader = lambda: single_flight.do(
+            key,
+            lambda: self._execute_with_fallback(api_func, ssh_func, operation=operation)
+        )
+        if not settings.MT_CACHE_ENABLED:
+            if key in single_flight:
+                # Se une a una lectura idéntica en curso de otra petición
+                self.method_used = "COALESCED"
+            return await loader()
+        coalesced = key in single_flight
+        value, cached = await read_cache.lookup(self.pool_key, path, variant, loader, queries, fields)
+        if cached:
+            # Resuelta desde caché: no pasó por _execute_with_fallback
+            self.method_used = "CACHE"
+        elif coalesced:
+            self.method_used = "COALESCED"
+        return value
+    
+    async def _write(
+        self,
+        path: str,
+        rows: Optional[Sequence[dict]],
+        api_func: Callable,
+        ssh_func: Optional[Callable]
+    ) -> Any:
+        """Escritura que invalida las lecturas cacheadas afectadas (rows=None: toda la ruta)"""
+        try:
+            return await self._execute_with_fallback(api_func, ssh_func)
+        finally:
+            read_cache.invalidate(self.pool_key, path, rows)
+            single_flight.forget(self.pool_key, path)
+            if self.router_id is not None:
+                mirror_registry.note_write(self.router_id, path)
+            await read_cache.publish(self.pool_key, path)
+    
+    async def count(self, path: str, queries: Optional[dict] = None) -> int:
+        """Cuenta filas de una tabla del router (count-only) con filtro opcional"""
+        table = self._mirror_table(path)
+        if table is not None:
+            return table.count(queries)
+        return await self._cached_read(
+            path, "count", queries, None,
+            lambda client: client.count(path, queries),
+            lambda client: client.count(path, queries)
+        )
+    
+    async def get_dhcp_leases(
+        self,
+        status: Optional[str] = None,
+        address: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ):
+        """Obtiene leases DHCP (fields: columnas a traer, None = todas)"""
+        queries = {}
+        if status:
+            queries["status"] = status
+        if address:
+            queries["address"] = address
+        table = self._mirror_table(DHCP_LEASE_PATH)
+        if table is not None:
+            return table.select(queries, fields)
+        return await self._cached_read(
+            DHCP_LEASE_PATH, "rows", queries, fields,
+            lambda client: client.get_dhcp_leases(status, address, fields),
+            lambda client: client.get_dhcp_leases(status, address, fields)
         )
     
-    def add_to_address_list(self, list_name: str, address: str, comment: Optional[str] = None):
+    async def get_address_list(
+        self,
+        list_name: Optional[str] = None,
+        address: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ):
+        """Obtiene address-list (fields: columnas a traer, None = todas)"""
+        queries = {}
+        if list_name:
+            queries["list"] = list_name
+        if address:
+            queries["address"] = address
+        table = self._mirror_table(ADDRESS_LIST_PATH)
+        if table is not None:
+            return table.select(queries, fields)
+        return await self._cached_read(
+            ADDRESS_LIST_PATH, "rows", queries, fields,
+            lambda client: client.get_address_list(list_name, address, fields),
+            lambda client: client.get_address_list(list_name, address, fields)
+        )
+    
+    async def add_to_address_list(self, list_name: str, address: str, comment: Optional[str] = None):
         """Agrega a address-list"""
-        return self._execute_with_fallback(
+        return await self._write(
+            ADDRESS_LIST_PATH, [{"list": list_name, "address": address}],
             lambda client: client.add_to_address_list(list_name, address, comment),
             lambda client: client.add_to_address_list(list_name, address, comment)
         )
     
-    def remove_from_address_list(self, list_name: str, address: str):
+    async def remove_from_address_list(self, list_name: str, address: str):
         """Elimina de address-list por nombre de lista y dirección"""
-        return self._execute_with_fallback(
+        return await self._write(
+            ADDRESS_LIST_PATH, [{"list": list_name, "address": address}],
             lambda client: client.remove_from_address_list_by_address(list_name, address),
             lambda client: client.remove_from_address_list(list_name, address) if hasattr(client, 'remove_from_address_list') else 0
         )
     
-    def get_simple_queues(self):
+    async def remove_from_address_lists(self, list_names: Sequence[str], address: str) -> dict:
+        """Elimina una dirección de varias listas; devuelve entradas eliminadas por lista"""
+        def ssh_remove(client):
+            # Todas las bajas en un solo canal SSH (modo lote)
+            results = client.apply_address_list_changes(
+                removals=[{"list": name, "address": address} for name in list_names]
+            )
+            return {r["list"]: r.get("removed", 0) for r in results}
+        
+        return await self._write(
+            ADDRESS_LIST_PATH, [{"list": name, "address": address} for name in list_names],
+            lambda client: client.remove_from_address_lists_by_address(list_names, address),
+            ssh_remove
+        )
+    
+    async def move_to_address_list(
+        self,
+        address: str,
+        target_list: str,
+        list_names: Sequence[str],
+        comment: Optional[str] = None
+    ) -> dict:
+        """Deja la dirección solo en target_list (de entre list_names) en una operación"""
+        def ssh_move(client):
+            client.move_to_address_list(address, target_list, list_names, comment)
+            # El CLI no informa cuántas entradas eliminó
+            return {"status": "added", "id": None, "removed": {}}
+        
+        return await self._write(
+            ADDRESS_LIST_PATH, [{"list": name, "address": address} for name in list_names],
+            lambda client: client.move_to_address_list(address, target_list, list_names, comment),
+            ssh_move
+        )
+    
+    async def apply_address_list_changes(
+        self,
+        additions: Sequence[dict] = (),
+        removals: Sequence[dict] = ()
+    ) -> list:
+        """Altas y bajas masivas de address-list con resultado por elemento"""
+        return await self._write(
+            ADDRESS_LIST_PATH,
+            [{"list": item["list"], "address": item["address"]} for item in [*additions, *removals]],
+            lambda client: client.apply_address_list_changes(additions, removals),
+            lambda client: client.apply_address_list_changes(additions, removals)
+        )
+    
+    async def apply_address_list_diff(
+        self,
+        removals: Sequence[dict] = (),
+        additions: Sequence[dict] = ()
+    ) -> list:
+        """Aplica un diff ya calculado (bajas por .id, altas) sin releer las listas"""
+        def ssh_apply(client):
+            # Con .id (show-ids) la baja es exacta; sin él va por (lista, dirección),
+            # y una copia duplicada borrada así se vuelve a dar de alta
+            by_id = [item for item in removals if item.get(".id")]
+            keys = {(item["list"], item["address"]): item.get("duplicate") for item in removals if not item.get(".id")}
+            return client.apply_address_list_changes(
+                [*additions, *({"list": name, "address": address} for (name, address), dup in keys.items() if dup)],
+                [*by_id, *({"list": name, "address": address} for name, address in keys)]
+            )
+        
+        return await self._write(
+            ADDRESS_LIST_PATH, None,
+            lambda client: client.apply_address_list_diff(removals, additions),
+            ssh_apply
+        )
+    
+    async def get_simple_queues(self, fields: Optional[Sequence[str]] = None):
         """Obtiene simple queues"""
-        return self._execute_with_fallback(
-            lambda client: client.get_simple_queues(),
-            None
+        table = self._mirror_table(SIMPLE_QUEUE_PATH)
+        if table is not None:
+            return table.select(None, fields)
+        return await self._cached_read(
+            SIMPLE_QUEUE_PATH, "rows", None, fields,
+            lambda client: client.get_simple_queues(fields),
+            lambda client: client.get_simple_queues(fields)
         )
     
-    def add_simple_queue(self, **kwargs):
+    async def find_simple_queue(self, address: str) -> Optional[str]:
+        """.id de la simple queue cuyo target es exactamente address (IP o prefijo)"""
+        return (await self.simple_queue_index()).lookup(address)
+    
+    async def simple_queue_index(self) -> QueueIndex:
+        """Índice target → .id de las simple queues (la tabla se lee solo si cambió o venció)"""
+        table = self._mirror_table(SIMPLE_QUEUE_PATH)
+        version = (id(table), table.version) if table is not None else None
+        index = queue_index_registry.get(self.pool_key, version)
+        if index is None:
+            if table is not None:
+                rows = table.select(None, QUEUE_INDEX_FIELDS)
+            else:
+                rows = await self.get_simple_queues(QUEUE_INDEX_FIELDS)
+                if any(not row.get(".id") for row in rows):
+                    # CLI sin show-ids (RouterOS anterior a 7): no se puede identificar la queue
+                    raise Exception("Simple queues leídas sin .id; no se puede buscar la queue")
+            index = queue_index_registry.store(self.pool_key, QueueIndex.build(rows, version))
+        return index
+    
+    async def add_simple_queue(self, **kwargs):
         """Crea simple queue"""
-        return self._execute_with_fallback(
+        result = await self._write(
+            SIMPLE_QUEUE_PATH, None,
             lambda client: client.add_simple_queue(**kwargs),
             None
         )
+        index = queue_index_registry.peek(self.pool_key)
+        queue_id = result[0].get("ret") if result else None
+        if index is not None and queue_id:
+            index.put(queue_id, kwargs.get("target"))
+        return result
+    
+    async def update_simple_queue(self, queue_id: str, **kwargs):
+        """Actualiza simple queue"""
+        result = await self._write(
+            SIMPLE_QUEUE_PATH, None,
+            lambda client: client.update_simple_queue(queue_id, **kwargs),
+            None
+        )
+        index = queue_index_registry.peek(self.pool_key)
+        if index is not None and kwargs.get("target") is not None:
+            index.put(queue_id, kwargs["target"])
+        return result
     
-    def remove_simple_queue(self, queue_id: str):
+    async def remove_simple_queue(self, queue_id: str):
         """Elimina simple queue"""
-        return self._execute_with_fallback(
+        result = await self._write(
+            SIMPLE_QUEUE_PATH, None,
             lambda client: client.remove_simple_queue(queue_id),
             None
         )
+        index = queue_index_registry.peek(self.pool_key)
+        if index is not None:
+            index.discard(queue_id)
+        return result
     
-    def get_system_resource(self):
-        """Obtiene recursos del sistema"""
-        return self._execute_with_fallback(
-            lambda client: client.get_system_resource(),
+    async def apply_simple_queue_changes(
+        self,
+        creates: Sequence[dict] = (),
+        updates: Sequence[dict] = (),
+        removals: Sequence[str] = ()
+    ) -> list:
+        """Altas, cambios y bajas masivas de simple queues en pipeline (resultado por elemento)"""
+        results = await self._write(
+            SIMPLE_QUEUE_PATH, None,
+            lambda client: client.apply_simple_queue_changes(creates, updates, removals),
             None
         )
+        index = queue_index_registry.peek(self.pool_key)
+        if index is not None:
+            for item, result in zip([*creates, *updates], results):
+                queue_id = result.get("id") or item.get("id")
+                if result["status"] == "ok" and queue_id and item.get("target") is not None:
+                    index.put(queue_id, item["target"])
+            for queue_id, result in zip(removals, results[len(creates) + len(updates):]):
+                if result["status"] == "ok":
+                    index.discard(queue_id)
+        return results
     
-    def disconnect(self):
-        """Desconecta todos los clientes"""
-        if self.api_client:
-            try:
-                self.api_client.disconnect()
-            except:
-                pass
-        
-        if self.ssh_client:
-            try:
-                self.ssh_client.disconnect()
-            except:
-                pass
+    async def ensure_entries(
+        self,
+        path: str,
+        key: str,
+        desired: Sequence[dict],
+        place_before: Optional[dict] = None
+    ) -> dict:
+        """Crea o corrige entradas de configuración (colas, reglas) identificadas por key
+
+        place_before: las altas van antes de la primera entrada que cumple ese filtro.
+        """
+        return await self._write(
+            path, None,
+            lambda client: client.ensure_entries(path, key, desired, place_before),
+            None
+        )
+    
+    async def remove_entries(self, path: str, key: str, values: Sequence[str]) -> int:
+        """Elimina entradas de configuración identificadas por key; devuelve cuántas"""
+        return await self._write(
+            path, None,
+            lambda client: client.remove_entries(path, key, values),
+            None
+        )
+    
+    async def get_system_resource(self, fields: Optional[Sequence[str]] = None):
+        """Obtiene recursos del sistema (sin caché: se usa para probar la conexión)"""
+        return await self._execute_with_fallback(
+            lambda client: client.get_system_resource(fields),
+            lambda client: client.get_system_resource(fields),
+            operation="/system/resource"
+        )
+    
+    async def disconnect(self):
+        """Suelta los clientes (la conexión API vuelve al pool y la sesión SSH sigue abierta)"""
+        self.ssh_client = None
     
-    def __enter__(self):
+    async def __aenter__(self):
         return self
     
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.disconnect()
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.disconnect()
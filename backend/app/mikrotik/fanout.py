@@ -0,0 +1,79 @@
+"""Ejecución de una operación contra varios routers en paralelo
+
+fan_out() lanza la misma operación sobre cada router con concurrencia
+acotada y un timeout por router, y devuelve un resultado por router (valor o
+error) en lugar de fallar entero: la latencia total sigue al router más
+lento, no a la suma de todos, y un router caído solo deja su hueco.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+from app.core.deadline import budget
+from app.core.logging import get_logger
+from app.core.config import settings
+
+logger = get_logger(__name__)
+
+
+class FanOutResult:
+    """Resultado de la operación en un router"""
+
+    __slots__ = ("router_id", "value", "error", "elapsed_ms", "method")
+
+    def __init__(self, router_id: Any, value: Any = None, error: Optional[str] = None,
+                 elapsed_ms: float = 0.0, method: Optional[str] = None):
+        self.router_id = router_id
+        self.value = value
+        self.error = error
+        self.elapsed_ms = elapsed_ms
+        self.method = method
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def fan_out(
+    routers: Iterable[Any],
+    operation: Callable[[Any], Awaitable[Any]],
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None
+) -> List[FanOutResult]:
+    """Ejecuta operation(client) en cada router (modelos Router) de forma concurrente
+
+    Args:
+        routers: Routers destino
+        operation: Corrutina que recibe un MikroTikClient del router
+        concurrency: Routers en curso a la vez (por defecto MT_FANOUT_CONCURRENCY)
+        timeout: Tiempo máximo por router (por defecto su Router.timeout),
+            recortado al deadline de la petición
+
+    Returns:
+        Un FanOutResult por router, en el mismo orden
+    """
+    from app.mikrotik.client import MikroTikClient
+
+    semaphore = asyncio.Semaphore(concurrency or settings.MT_FANOUT_CONCURRENCY)
+
+    async def run(router_obj) -> FanOutResult:
+        async with semaphore:
+            started = time.monotonic()
+            client = MikroTikClient.from_router(router_obj)
+            try:
+                value = await asyncio.wait_for(operation(client), budget(timeout or router_obj.timeout))
+                return FanOutResult(
+                    router_obj.id, value,
+                    elapsed_ms=round((time.monotonic() - started) * 1000, 1),
+                    method=client.method_used
+                )
+            except Exception as e:
+                error = "timeout" if isinstance(e, asyncio.TimeoutError) else str(e)
+                logger.warning("mikrotik_fanout_router_failed", router_id=router_obj.id, error=error)
+                return FanOutResult(
+                    router_obj.id, error=error,
+                    elapsed_ms=round((time.monotonic() - started) * 1000, 1)
+                )
+            finally:
+                await client.disconnect()
+
+    return await asyncio.gather(*(run(r) for r in routers))
@@ -0,0 +1,149 @@
+"""Sondeo de salud de routers en segundo plano
+
+Cada ciclo reparte las pruebas de todos los routers a lo largo del
+intervalo (escalonadas) con concurrencia acotada, mide la latencia,
+actualiza Router.status / Router.last_seen y, al ir por el pool, mantiene
+calientes sus conexiones API. Así GET /routers muestra la salud actual sin
+que ninguna petición espere a un router.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.mikrotik.scheduler import BACKGROUND
+from app.core.logging import get_logger
+from app.core.config import settings
+
+logger = get_logger(__name__)
+
+
+class RouterHealth:
+    """Resultado del último sondeo de un router"""
+
+    __slots__ = ("status", "latency_ms", "method", "checked_at", "error")
+
+    def __init__(self, status: str, latency_ms: Optional[float], method: Optional[str], error: Optional[str] = None):
+        self.status = status
+        self.latency_ms = latency_ms
+        self.method = method
+        self.checked_at = datetime.utcnow()
+        self.error = error
+
+    def as_dict(self) -> Dict:
+        return {
+            "status": self.status,
+            "latency_ms": self.latency_ms,
+            "method": self.method,
+            "checked_at": self.checked_at,
+            "error": self.error,
+        }
+
+
+def _load_routers() -> List:
+    from app.db.database import SessionLocal
+    from app.db.models import Router
+
+    db = SessionLocal()
+    try:
+        routers = db.query(Router).filter(Router.status != "inactive").all()
+        db.expunge_all()
+        return routers
+    finally:
+        db.close()
+
+
+def _record(router_id: int, ok: bool, seen_at: datetime):
+    from app.db.database import SessionLocal
+    from app.db.models import Router
+
+    db = SessionLocal()
+    try:
+        router_obj = db.get(Router, router_id)
+        # Un router desactivado a mano mientras se sondeaba no se toca
+        if router_obj is None or router_obj.status == "inactive":
+            return
+        router_obj.status = "active" if ok else "error"
+        if ok:
+            router_obj.last_seen = seen_at
+        db.commit()
+    finally:
+        db.close()
+
+
+class HealthProber:
+    """Sondea todos los routers y guarda el último resultado de cada uno"""
+
+    def __init__(self):
+        self._health: Dict[int, RouterHealth] = {}
+
+    def get(self, router_id: int) -> Optional[RouterHealth]:
+        return self._health.get(router_id)
+
+    def forget(self, router_id: int):
+        self._health.pop(router_id, None)
+
+    async def probe(self, router_obj) -> RouterHealth:
+        """Prueba un router (API con fallback SSH) y persiste el resultado"""
+        from app.mikrotik.client import MikroTikClient
+
+        client = MikroTikClient.from_router(router_obj, priority=BACKGROUND)
+        start = time.perf_counter()
+        try:
+            await client.get_system_resource(("uptime",))
+            health = RouterHealth("active", round((time.perf_counter() - start) * 1000, 1), client.method_used)
+        except Exception as e:
+            health = RouterHealth("error", None, None, str(e))
+        finally:
+            await client.disconnect()
+
+        previous = self._health.get(router_obj.id)
+        self._health[router_obj.id] = health
+        if previous is None or previous.status != health.status:
+            logger.info(
+                "router_health_changed",
+                router_id=router_obj.id,
+                status=health.status,
+                latency_ms=health.latency_ms,
+                error=health.error
+            )
+        try:
+            await asyncio.to_thread(_record, router_obj.id, health.status == "active", health.checked_at)
+        except Exception as e:
+            logger.warning("router_health_record_failed", router_id=router_obj.id, error=str(e))
+        return health
+
+    async def run_cycle(self, interval: float):
+        """Un ciclo completo: las pruebas se escalonan a lo largo de interval"""
+        routers = await asyncio.to_thread(_load_routers)
+        active_ids = {r.id for r in routers}
+        for router_id in [k for k in self._health if k not in active_ids]:
+            self.forget(router_id)
+        if not routers:
+            await asyncio.sleep(interval)
+            return
+
+        step = interval / len(routers)
+        semaphore = asyncio.Semaphore(settings.MT_HEALTH_CONCURRENCY)
+
+        async def scheduled(index: int, router_obj):
+            await asyncio.sleep(index * step)
+            async with semaphore:
+                await self.probe(router_obj)
+
+        started = time.monotonic()
+        await asyncio.gather(*(scheduled(i, r) for i, r in enumerate(routers)))
+        # Si las pruebas terminaron antes, completar el intervalo
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    async def run_forever(self):
+        """Sondeo escalonado de la salud de todos los routers (tarea de fondo)"""
+        while True:
+            try:
+                await self.run_cycle(settings.MT_HEALTH_INTERVAL_SECONDS)
+            except Exception as e:
+                logger.warning("health_probe_cycle_failed", error=str(e))
+                await asyncio.sleep(settings.MT_HEALTH_INTERVAL_SECONDS)
+
+
+# Sondeador global del proceso
+health_prober = HealthProber()
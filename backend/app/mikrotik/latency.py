@@ -0,0 +1,103 @@
+"""Latencia observada por router y operación, y timeouts adaptativos
+
+Por cada router y operación (ruta, tipo de lectura y forma de la consulta:
+filtrada o tabla completa) se mantiene una media móvil exponencial (EWMA) de
+la latencia y de su desviación, más una ventana de muestras recientes para
+percentiles. Con eso el timeout de un comando deja de ser el Router.timeout
+fijo: un router de LAN rápido falla en poco tiempo y uno de WAN lento
+conserva margen, siempre dentro de [MT_TIMEOUT_MIN_SECONDS, Router.timeout].
+Vencer el timeout adaptativo cuenta como falla para el circuit breaker (solo
+no la cuenta el recorte por el deadline de la petición); la muestra observada
+ensancha el timeout del siguiente intento.
+"""
+import math
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Optional
+from app.core.config import settings
+
+# Pesos de la EWMA (los mismos que usa TCP para el RTO)
+ALPHA = 0.125
+BETA = 0.25
+WINDOW = 200
+
+
+class LatencyStats:
+    """Estadísticas de latencia de un router (segundos)"""
+
+    __slots__ = ("srtt", "rttvar", "samples", "count")
+
+    def __init__(self):
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.samples: Deque[float] = deque(maxlen=WINDOW)
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.samples.append(seconds)
+        if self.srtt is None:
+            self.srtt = seconds
+            self.rttvar = seconds / 2
+            return
+        self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - seconds)
+        self.srtt = (1 - ALPHA) * self.srtt + ALPHA * seconds
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def timeout(self, ceiling: float) -> float:
+        """Timeout adaptativo acotado por ceiling (el Router.timeout configurado)"""
+        if self.count < settings.MT_TIMEOUT_MIN_SAMPLES or self.srtt is None:
+            return ceiling
+        candidate = max(
+            self.srtt + 4 * self.rttvar,
+            self.percentile(99) * settings.MT_TIMEOUT_P99_MULTIPLIER
+        )
+        return min(ceiling, max(settings.MT_TIMEOUT_MIN_SECONDS, candidate))
+
+    def as_dict(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "samples": self.count,
+            "ewma_ms": ms(self.srtt),
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+        }
+
+
+class LatencyRegistry:
+    """Latencias por router (clave: Router.id o host:puerto) y operación"""
+
+    def __init__(self):
+        self._stats: Dict[Hashable, Dict[str, LatencyStats]] = {}
+
+    def observe(self, key: Hashable, operation: str, seconds: float):
+        operations = self._stats.setdefault(key, {})
+        stats = operations.get(operation)
+        if stats is None:
+            stats = operations[operation] = LatencyStats()
+        stats.observe(seconds)
+
+    def timeout(self, key: Hashable, operation: str, ceiling: float) -> float:
+        """Timeout para la operación; sin historial suficiente, ceiling"""
+        if not settings.MT_ADAPTIVE_TIMEOUT_ENABLED:
+            return ceiling
+        stats = self._stats.get(key, {}).get(operation)
+        return stats.timeout(ceiling) if stats is not None else ceiling
+
+    def invalidate(self, key: Hashable):
+        self._stats.pop(key, None)
+
+    def stats(self, key: Hashable) -> Dict[str, Dict[str, Any]]:
+        return {operation: s.as_dict() for operation, s in self._stats.get(key, {}).items()}
+
+
+# Registro global del proceso
+latency_registry = LatencyRegistry()
@@ -0,0 +1,317 @@
+"""Espejo en memoria del estado del router mantenido por suscripciones listen
+
+Por cada router se abre una conexión API dedicada que se suscribe con
+listen a las tablas espejadas, carga una foto inicial con print y después
+aplica los eventos que empuja el router. Las lecturas de esas tablas se
+resuelven en memoria mientras el espejo esté sincronizado; si la conexión
+se cae el espejo deja de usarse hasta que se vuelve a cargar.
+
+Las filas se guardan como registros tipados (records.py), igual que las que
+devuelven las lecturas al router. Los eventos de listen llegan después de que
+la escritura responde: tras una escritura propia la tabla se salta (lectura
+al router) durante MT_MIRROR_WRITE_BYPASS_SECONDS.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Type
+from app.mikrotik.api_client import MikroTikAPIClient
+from app.mikrotik.pool import RouterConnectionPool
+from app.mikrotik.records import AddressListItem, DhcpLease, RouterOSRecord, SimpleQueue
+from app.core.logging import get_logger
+from app.core.config import settings
+
+logger = get_logger(__name__)
+
+# Tablas que se mantienen espejadas y el registro tipado de sus filas
+MIRRORED_TABLES = {
+    "/ip/dhcp-server/lease": DhcpLease,
+    "/ip/firewall/address-list": AddressListItem,
+    "/queue/simple": SimpleQueue,
+}
+MIRRORED_PATHS = tuple(MIRRORED_TABLES)
+
+RECONNECT_MAX_SECONDS = 60
+
+
+def matches(row: Mapping, queries: Optional[Dict[str, Any]]) -> bool:
+    """Evalúa en local los mismos filtros que build_query (AND entre claves, OR en listas)"""
+    for key, value in (queries or {}).items():
+        if key == "id":
+            key = ".id"
+        if isinstance(value, (list, tuple, set)):
+            if row.get(key) not in {str(v) for v in value}:
+                return False
+        elif row.get(key) != str(value):
+            return False
+    return True
+
+
+def project(row: RouterOSRecord, fields: Optional[Sequence[str]]) -> RouterOSRecord:
+    """Aplica la proyección de .proplist a una fila (los registros se comparten: son de solo lectura)"""
+    if not fields:
+        return row
+    return type(row).from_row({k: row[k] for k in fields if k in row})
+
+
+class TableMirror:
+    """Filas de una tabla indexadas por .id"""
+
+    __slots__ = ("path", "record", "rows", "ready", "events", "version", "bypass_until")
+
+    def __init__(self, path: str, record: Type[RouterOSRecord] = RouterOSRecord):
+        self.path = path
+        self.record = record
+        self.rows: Dict[str, RouterOSRecord] = {}
+        self.ready = False
+        self.events = 0
+        # Cambia con cada carga o evento (para índices derivados de la tabla)
+        self.version = 0
+        # Hasta cuándo se lee del router tras una escritura propia (monotonic)
+        self.bypass_until = 0.0
+
+    @property
+    def usable(self) -> bool:
+        return self.ready and time.monotonic() >= self.bypass_until
+
+    def note_write(self):
+        """Escritura propia aún no reflejada por listen: leer del router un momento"""
+        self.bypass_until = time.monotonic() + settings.MT_MIRROR_WRITE_BYPASS_SECONDS
+
+    def load(self, rows: Iterable[Dict[str, str]]):
+        """Reemplaza las filas con la foto inicial de print"""
+        self.rows = {row[".id"]: self.record.from_row(row) for row in rows if row.get(".id")}
+        self.version += 1
+
+    def apply(self, event: Dict[str, str]):
+        """Aplica un evento de listen (fila nueva/cambiada o .dead)"""
+        entry_id = event.get(".id")
+        if not entry_id:
+            return
+        self.events += 1
+        self.version += 1
+        if event.get(".dead") == "true":
+            self.rows.pop(entry_id, None)
+            return
+        current = self.rows.get(entry_id)
+        row = dict(current) if current is not None else {}
+        row.update(event)
+        self.rows[entry_id] = self.record.from_row(row)
+
+    def select(self, queries: Optional[Dict[str, Any]] = None, fields: Optional[Sequence[str]] = None) -> List[RouterOSRecord]:
+        return [project(row, fields) for row in self.rows.values() if matches(row, queries)]
+
+    def count(self, queries: Optional[Dict[str, Any]] = None) -> int:
+        if not queries:
+            return len(self.rows)
+        return sum(1 for row in self.rows.values() if matches(row, queries))
+
+
+class RouterMirror:
+    """Espejo de las tablas de un router con su tarea de suscripción"""
+
+    def __init__(self, key: Hashable, config: Dict[str, Any], paths: Iterable[str] = MIRRORED_PATHS):
+        self.key = key
+        self.config = dict(config)
+        self.fingerprint = RouterConnectionPool.make_fingerprint(config)
+        self.tables: Dict[str, TableMirror] = {
+            path: TableMirror(path, MIRRORED_TABLES.get(path, RouterOSRecord)) for path in paths
+        }
+        self.synced_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[MikroTikAPIClient] = None
+
+    def table(self, path: str) -> Optional[TableMirror]:
+        """Tabla espejada lista para leer (None si no se espeja o no está sincronizada)"""
+        table = self.tables.get(path.rstrip("/"))
+        if table is None or not table.usable:
+            return None
+        return table
+
+    def note_write(self, path: str):
+        table = self.tables.get(path.rstrip("/"))
+        if table is not None:
+            table.note_write()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+        self._set_ready(False)
+
+    def _set_ready(self, ready: bool):
+        for table in self.tables.values():
+            table.ready = ready
+
+    async def _run(self):
+        delay = 1
+        while True:
+            started = time.monotonic()
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("mikrotik_mirror_disconnected", key=self.key, error=str(e), retry_in=delay)
+            finally:
+                self._set_ready(False)
+                if self._client is not None:
+                    await self._client.disconnect()
+                    self._client = None
+            # Una sesión que duró tiempo reinicia el backoff
+            if time.monotonic() - started > RECONNECT_MAX_SECONDS:
+                delay = 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    async def _session(self):
+        """Suscribe, carga la foto inicial y vigila la conexión hasta que falle"""
+        self._client = MikroTikAPIClient(**self.config)
+        await self._client.connect()
+        connection = self._client.connection
+
+        # Los eventos que llegan durante la carga inicial se guardan y se
+        # aplican después, para no perder cambios entre print y listen
+        buffered: Dict[str, List[Dict[str, str]]] = {path: [] for path in self.tables}
+        handlers = {path: events.append for path, events in buffered.items()}
+        listeners = []
+        for path, table in self.tables.items():
+            table.rows = {}
+            tag, future = connection.send(
+                [f"{path}/listen"],
+                on_row=lambda event, path=path: handlers[path](event)
+            )
+            listeners.append(future)
+        await connection.drain()
+
+        # La foto inicial de tablas grandes tarda más que Router.timeout
+        self._client.timeout = max(self._client.timeout, settings.MT_MIRROR_SNAPSHOT_TIMEOUT_SECONDS)
+        try:
+            for path, table in self.tables.items():
+                table.load(await self._client.execute(path, "get"))
+        finally:
+            self._client.timeout = self.config.get("timeout", 10)
+
+        for path, table in self.tables.items():
+            for event in buffered[path]:
+                table.apply(event)
+            handlers[path] = table.apply
+        self._set_ready(True)
+        self.synced_at = time.monotonic()
+        logger.info(
+            "mikrotik_mirror_synced",
+            key=self.key,
+            rows={path: len(t.rows) for path, t in self.tables.items()}
+        )
+
+        # Un listen que termina (trap o conexión caída) invalida el espejo;
+        # el ping periódico detecta conexiones muertas sin RST
+        watch = asyncio.gather(*listeners)
+        try:
+            while True:
+                done, _ = await asyncio.wait({watch}, timeout=settings.MT_MIRROR_PING_SECONDS)
+                if done:
+                    watch.result()
+                    raise Exception("Suscripción listen finalizada")
+                if not await self._client.ping():
+                    raise Exception("El router no responde al ping")
+        finally:
+            watch.cancel()
+            # Recuperar el resultado para que asyncio no avise de excepciones sin leer
+            watch.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tables": {
+                path: {"ready": t.ready, "usable": t.usable, "rows": len(t.rows), "events": t.events}
+                for path, t in self.tables.items()
+            },
+            "synced_seconds_ago": None if self.synced_at is None else round(time.monotonic() - self.synced_at),
+        }
+
+
+def _router_configs() -> Dict[Hashable, Dict[str, Any]]:
+    """Parámetros API de todos los routers registrados (clave: Router.id)"""
+    from app.db.database import SessionLocal
+    from app.db.models import Router
+    from app.mikrotik.client import MikroTikClient
+
+    db = SessionLocal()
+    try:
+        return {r.id: MikroTikClient.from_router(r).api_config() for r in db.query(Router).all()}
+    finally:
+        db.close()
+
+
+class MirrorRegistry:
+    """Espejos por router (clave: Router.id)"""
+
+    def __init__(self):
+        self._mirrors: Dict[Hashable, RouterMirror] = {}
+
+    def get(self, key: Hashable) -> Optional[RouterMirror]:
+        return self._mirrors.get(key)
+
+    def table(self, key: Hashable, path: str) -> Optional[TableMirror]:
+        """Tabla espejada y sincronizada del router, o None para ir al router"""
+        mirror = self._mirrors.get(key)
+        return mirror.table(path) if mirror is not None else None
+
+    def note_write(self, key: Hashable, path: str):
+        """Marca una escritura local en la tabla del router (ver TableMirror.note_write)"""
+        mirror = self._mirrors.get(key)
+        if mirror is not None:
+            mirror.note_write(path)
+
+    async def ensure(self, key: Hashable, config: Dict[str, Any]):
+        """Arranca el espejo del router o lo reinicia si cambiaron las credenciales"""
+        mirror = self._mirrors.get(key)
+        if mirror is not None and mirror.fingerprint != RouterConnectionPool.make_fingerprint(config):
+            await self.invalidate(key)
+            mirror = None
+        if mirror is None:
+            mirror = RouterMirror(key, config)
+            self._mirrors[key] = mirror
+            logger.info("mikrotik_mirror_started", key=key)
+        mirror.start()
+
+    async def sync(self, configs: Dict[Hashable, Dict[str, Any]]):
+        """Deja un espejo por cada router indicado y detiene el resto"""
+        for key in list(self._mirrors):
+            if key not in configs:
+                await self.invalidate(key)
+        for key, config in configs.items():
+            await self.ensure(key, config)
+
+    async def invalidate(self, key: Hashable):
+        mirror = self._mirrors.pop(key, None)
+        if mirror is not None:
+            await mirror.stop()
+            logger.info("mikrotik_mirror_stopped", key=key)
+
+    async def close_all(self):
+        for key in list(self._mirrors):
+            await self.invalidate(key)
+
+    async def supervise_forever(self):
+        """Mantiene un espejo por router registrado (altas, bajas y cambios de credenciales)"""
+        while True:
+            try:
+                await self.sync(await asyncio.to_thread(_router_configs))
+            except Exception as e:
+                logger.warning("mirror_supervisor_failed", error=str(e))
+            await asyncio.sleep(settings.MT_MIRROR_SYNC_INTERVAL_SECONDS)
+
+    def stats(self) -> Dict[Hashable, Dict[str, Any]]:
+        return {key: mirror.stats() for key, mirror in self._mirrors.items()}
+
+
+# Registro global del proceso
+mirror_registry = MirrorRegistry()
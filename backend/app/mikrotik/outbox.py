@@ -0,0 +1,378 @@
+"""Outbox duradero de cambios en routers
+
+Los endpoints que modifican un router registran la intención en la tabla
+router_mutations y responden enseguida; un worker de fondo la aplica con
+reintentos y backoff exponencial. Así un router que se cae a mitad de un
+cambio no deja la DB y el router desalineados: el cambio queda pendiente y
+se reintenta hasta aplicarse (o agotar MT_OUTBOX_MAX_ATTEMPTS).
+
+- Idempotencia: una Idempotency-Key repetida devuelve la mutación existente,
+  y los handlers aplican estados absolutos (reintentar no duplica).
+- Coalescencia: una mutación nueva con la misma coalesce_key (tipo + objetivo,
+  p.ej. la IP) reemplaza a la pendiente anterior, que queda superseded
+  (bloquear y luego desbloquear la misma IP aplica solo lo último).
+- Orden: nunca hay dos mutaciones de la misma coalesce_key en curso a la vez.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.mikrotik.protocol import RouterOSTrapError
+from app.mikrotik.records import to_plain
+from app.mikrotik.scheduler import INTERACTIVE
+from app.core.logging import get_logger
+from app.core.config import settings
+
+logger = get_logger(__name__)
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+SUPERSEDED = "superseded"
+FINISHED = (DONE, FAILED, SUPERSEDED)
+
+# Cada cuánto se consulta la mutación mientras una petición espera su resultado
+WAIT_POLL_SECONDS = 0.2
+
+
+class MutationHandler:
+    """Cómo aplicar un tipo de mutación en el router y reflejarla en la DB"""
+
+    __slots__ = ("apply", "commit", "priority")
+
+    def __init__(
+        self,
+        apply: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        commit: Optional[Callable[[Session, int, Dict[str, Any], Any], None]] = None,
+        priority: int = INTERACTIVE
+    ):
+        self.apply = apply
+        self.commit = commit
+        self.priority = priority
+
+
+_handlers: Dict[str, MutationHandler] = {}
+
+
+def register_handler(
+    kind: str,
+    apply: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+    commit: Optional[Callable[[Session, int, Dict[str, Any], Any], None]] = None,
+    priority: int = INTERACTIVE
+):
+    """Registra un tipo de mutación
+
+    apply(client, payload) aplica el cambio en el router (debe ser idempotente);
+    commit(db, router_id, payload, result) refleja el resultado en la DB en la
+    misma transacción que marca la mutación como done.
+    """
+    _handlers[kind] = MutationHandler(apply, commit, priority)
+
+
+def enqueue(
+    db: Session,
+    router_id: int,
+    kind: str,
+    target: str,
+    payload: Dict[str, Any],
+    idempotency_key: Optional[str] = None,
+    created_by: Optional[str] = None
+):
+    """Registra una mutación pendiente (reemplaza a la pendiente del mismo objetivo)"""
+    from app.db.models import RouterMutation
+
+    if idempotency_key:
+        existing = db.query(RouterMutation).filter(
+            RouterMutation.router_id == router_id,
+            RouterMutation.idempotency_key == idempotency_key
+        ).first()
+        if existing is not None:
+            return existing
+
+    now = datetime.utcnow()
+    coalesce_key = f"{kind}:{target}"
+    superseded = db.query(RouterMutation).filter(
+        RouterMutation.router_id == router_id,
+        RouterMutation.coalesce_key == coalesce_key,
+        RouterMutation.status == PENDING
+    ).update({"status": SUPERSEDED, "completed_at": now}, synchronize_session=False)
+
+    mutation = RouterMutation(
+        router_id=router_id,
+        kind=kind,
+        coalesce_key=coalesce_key,
+        idempotency_key=idempotency_key,
+        payload=payload,
+        status=PENDING,
+        attempts=0,
+        next_attempt_at=now,
+        created_by=created_by
+    )
+    db.add(mutation)
+    try:
+        db.commit()
+    except IntegrityError:
+        # La misma Idempotency-Key llegó a la vez por otra petición
+        db.rollback()
+        return db.query(RouterMutation).filter(
+            RouterMutation.router_id == router_id,
+            RouterMutation.idempotency_key == idempotency_key
+        ).one()
+    db.refresh(mutation)
+    logger.info(
+        "router_mutation_enqueued",
+        mutation_id=mutation.id,
+        router_id=router_id,
+        kind=kind,
+        superseded=superseded
+    )
+    return mutation
+
+
+def _claim(limit: int) -> List[Dict[str, Any]]:
+    """Marca como en curso las mutaciones vencidas (sin otra del mismo objetivo en curso)"""
+    from app.db.database import SessionLocal
+    from app.db.models import RouterMutation
+
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        # Las que quedaron en curso por un worker caído vuelven a pendientes
+        db.query(RouterMutation).filter(
+            RouterMutation.status == IN_PROGRESS,
+            RouterMutation.claimed_at < now - timedelta(seconds=settings.MT_OUTBOX_CLAIM_TIMEOUT_SECONDS)
+        ).update({"status": PENDING}, synchronize_session=False)
+
+        busy = {
+            (router_id, key) for router_id, key in db.query(
+                RouterMutation.router_id, RouterMutation.coalesce_key
+            ).filter(RouterMutation.status == IN_PROGRESS)
+        }
+        rows = db.query(RouterMutation).filter(
+            RouterMutation.status == PENDING,
+            RouterMutation.next_attempt_at <= now
+        ).order_by(RouterMutation.id).limit(limit).all()
+
+        claimed = []
+        for row in rows:
+            if (row.router_id, row.coalesce_key) in busy:
+                continue
+            # Update condicional: con varios workers solo uno se queda la mutación
+            taken = db.query(RouterMutation).filter(
+                RouterMutation.id == row.id,
+                RouterMutation.status == PENDING
+            ).update({"status": IN_PROGRESS, "claimed_at": now}, synchronize_session=False)
+            if taken:
+                busy.add((row.router_id, row.coalesce_key))
+                claimed.append({
+                    "id": row.id,
+                    "router_id": row.router_id,
+                    "kind": row.kind,
+                    "payload": row.payload,
+                    "attempts": row.attempts or 0,
+                })
+        db.commit()
+        return claimed
+    finally:
+        db.close()
+
+
+def _complete(mutation: Dict[str, Any], result: Any, handler: MutationHandler):
+    from app.db.database import SessionLocal
+    from app.db.models import RouterMutation
+
+    db = SessionLocal()
+    try:
+        row = db.get(RouterMutation, mutation["id"])
+        if row is None:
+            return
+        if handler.commit is not None:
+            handler.commit(db, mutation["router_id"], mutation["payload"], result)
+        row.status = DONE
+        row.result = to_plain(result)
+        row.last_error = None
+        row.attempts = mutation["attempts"] + 1
+        row.completed_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+def _fail(mutation: Dict[str, Any], error: str, permanent: bool = False) -> str:
+    """Registra un intento fallido: reprograma con backoff o marca failed"""
+    from app.db.database import SessionLocal
+    from app.db.models import RouterMutation
+
+    db = SessionLocal()
+    try:
+        row = db.get(RouterMutation, mutation["id"])
+        if row is None:
+            return FAILED
+        attempts = mutation["attempts"] + 1
+        row.attempts = attempts
+        row.last_error = error
+        if permanent or attempts >= settings.MT_OUTBOX_MAX_ATTEMPTS:
+            row.status = FAILED
+            row.completed_at = datetime.utcnow()
+        else:
+            delay = min(
+                settings.MT_OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1),
+                settings.MT_OUTBOX_BACKOFF_MAX_SECONDS
+            )
+            row.status = PENDING
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        db.commit()
+        return row.status
+    finally:
+        db.close()
+
+
+def _release(mutation_ids: List[int]):
+    """Devuelve a pendientes mutaciones reclamadas que no se llegaron a intentar"""
+    from app.db.database import SessionLocal
+    from app.db.models import RouterMutation
+
+    if not mutation_ids:
+        return
+    db = SessionLocal()
+    try:
+        db.query(RouterMutation).filter(
+            RouterMutation.id.in_(mutation_ids),
+            RouterMutation.status == IN_PROGRESS
+        ).update({"status": PENDING}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _load_router(router_id: int):
+    from app.db.database import SessionLocal
+    from app.db.models import Router
+
+    db = SessionLocal()
+    try:
+        router_obj = db.get(Router, router_id)
+        if router_obj is not None:
+            db.expunge(router_obj)
+        return router_obj
+    finally:
+        db.close()
+
+
+def _mutation_state(mutation_id: int) -> Optional[Dict[str, Any]]:
+    from app.db.database import SessionLocal
+    from app.db.models import RouterMutation
+
+    db = SessionLocal()
+    try:
+        row = db.get(RouterMutation, mutation_id)
+        if row is None:
+            return None
+        return {
+            "status": row.status,
+            "attempts": row.attempts or 0,
+            "last_error": row.last_error,
+            "result": row.result,
+        }
+    finally:
+        db.close()
+
+
+async def wait_for_mutation(mutation_id: int, timeout: float) -> Optional[Dict[str, Any]]:
+    """Espera hasta timeout segundos a que la mutación termine (done, failed o superseded)
+
+    Devuelve el último estado leído (status, attempts, last_error, result): si
+    sigue pending o in_progress, el worker la seguirá aplicando en segundo plano.
+    Consulta la tabla, así funciona aunque la aplique el worker de otro proceso.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(timeout, 0)
+    while True:
+        state = await asyncio.to_thread(_mutation_state, mutation_id)
+        if state is None or state["status"] in FINISHED:
+            return state
+        left = deadline - loop.time()
+        if left <= 0:
+            return state
+        await asyncio.sleep(min(WAIT_POLL_SECONDS, left))
+
+
+class OutboxWorker:
+    """Aplica las mutaciones pendientes: routers en paralelo, cada router en orden"""
+
+    def __init__(self):
+        self._wake = asyncio.Event()
+
+    def notify(self):
+        """Despierta al worker (hay una mutación nueva)"""
+        self._wake.set()
+
+    async def run_forever(self):
+        while True:
+            try:
+                processed = await self.run_once()
+            except Exception as e:
+                logger.warning("router_outbox_cycle_failed", error=str(e))
+                processed = 0
+            if processed:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.MT_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def run_once(self) -> int:
+        """Un ciclo: reclama las mutaciones vencidas y las aplica; devuelve cuántas"""
+        claimed = await asyncio.to_thread(_claim, settings.MT_OUTBOX_BATCH_SIZE)
+        by_router: Dict[int, List[Dict[str, Any]]] = {}
+        for mutation in claimed:
+            by_router.setdefault(mutation["router_id"], []).append(mutation)
+        await asyncio.gather(*(self._run_router(rid, items) for rid, items in by_router.items()))
+        return len(claimed)
+
+    async def _run_router(self, router_id: int, mutations: List[Dict[str, Any]]):
+        from app.mikrotik.client import MikroTikClient
+
+        pending = [m["id"] for m in mutations]
+        try:
+            router_obj = await asyncio.to_thread(_load_router, router_id)
+            for mutation in mutations:
+                pending.remove(mutation["id"])
+                handler = _handlers.get(mutation["kind"])
+                if router_obj is None or handler is None:
+                    error = "Router no encontrado" if router_obj is None else f"Tipo de mutación desconocido: {mutation['kind']}"
+                    await asyncio.to_thread(_fail, mutation, error, True)
+                    continue
+
+                client = MikroTikClient.from_router(router_obj, priority=handler.priority)
+                try:
+                    result = await handler.apply(client, mutation["payload"])
+                except RouterOSTrapError as e:
+                    # El router rechazó el comando: reintentar no lo arregla
+                    status = await asyncio.to_thread(_fail, mutation, str(e), True)
+                    logger.warning("router_mutation_rejected", mutation_id=mutation["id"], error=str(e), status=status)
+                    continue
+                except Exception as e:
+                    status = await asyncio.to_thread(_fail, mutation, str(e))
+                    logger.warning("router_mutation_failed", mutation_id=mutation["id"], error=str(e), status=status)
+                    # Router inalcanzable: el resto de su lote espera al siguiente ciclo
+                    await asyncio.to_thread(_release, pending)
+                    pending = []
+                    return
+                finally:
+                    await client.disconnect()
+
+                await asyncio.to_thread(_complete, mutation, result, handler)
+                logger.info("router_mutation_applied", mutation_id=mutation["id"], router_id=router_id)
+        except asyncio.CancelledError:
+            # Apagado: lo no intentado queda pendiente para el próximo arranque
+            # (protegido para que la liberación termine aunque se cancele de nuevo)
+            await asyncio.shield(asyncio.to_thread(_release, pending))
+            raise
+
+
+# Worker global del proceso
+outbox_worker = OutboxWorker()
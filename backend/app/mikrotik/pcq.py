@@ -0,0 +1,147 @@
+"""Planes PCQ: una cola PCQ y un par de queue tree por plan
+
+Con planes de tipo simple_queue cada dispositivo tiene su /queue/simple, y
+RouterOS las recorre en orden para cada paquete: el costo de reenvío crece
+con la cantidad de clientes. Un plan de tipo pcq se aprovisiona una sola vez
+por router:
+
+- /queue/type: dos colas PCQ (bajada por dst-address, subida por
+  src-address) con pcq-rate = límite del plan por dispositivo.
+- /ip/firewall/mangle: dos reglas que marcan los paquetes cuyo destino u
+  origen está en la address-list del plan. Se agregan antes de la primera
+  regla de chain=forward para que ningún accept previo las saltee. Las
+  conexiones con fasttrack no pasan por mangle ni queue tree: la regla
+  fasttrack-connection de /ip/firewall/filter debe excluir esas address-lists.
+- /queue/tree: bajada y subida colgando de global con esas marcas y colas.
+
+Asignar el plan a un dispositivo es entonces agregar su IP a la
+address-list del plan (y quitarla de las de otros planes PCQ). Al eliminar
+el plan, deprovision() quita esas entradas y la address-list del router
+(solo necesita el id del plan: sirve también después de borrar la fila).
+"""
+from typing import Dict, Hashable, List, Optional, Tuple
+
+SIMPLE_QUEUE = "simple_queue"
+PCQ = "pcq"
+PLAN_TYPES = (SIMPLE_QUEUE, PCQ)
+
+PLAN_LIST_PREFIX = "SMARTBJ_PLAN_"
+PCQ_COMMENT = "SmartBJPortal PCQ"
+
+ADDRESS_LIST_PATH = "/ip/firewall/address-list"
+
+# Orden de aprovisionamiento: el queue tree referencia colas y marcas
+# (ruta, campo que identifica la entrada)
+PCQ_PATHS = (
+    ("/queue/type", "name"),
+    ("/ip/firewall/mangle", "comment"),
+    ("/queue/tree", "name"),
+)
+# Las altas en estas rutas van antes de la primera regla que cumple el filtro
+PLACE_BEFORE = {
+    "/ip/firewall/mangle": {"chain": "forward"},
+}
+# Sentido, clasificador PCQ y campo de address-list de la regla mangle
+DIRECTIONS = (
+    ("down", "dst-address", "dst-address-list"),
+    ("up", "src-address", "src-address-list"),
+)
+
+
+def plan_list_name(plan_id: int) -> str:
+    """Address-list con las IPs de los dispositivos del plan"""
+    return f"{PLAN_LIST_PREFIX}{plan_id}"
+
+
+def pcq_rate(limit: Optional[str]) -> str:
+    """Límite del plan → pcq-rate ('unlimited' o vacío = 0, sin límite)"""
+    limit = (limit or "").strip()
+    return "0" if not limit or limit.lower() == "unlimited" else limit
+
+
+def plan_object_keys(plan_id: int) -> Dict[str, List[str]]:
+    """Valor del campo identificador de cada entrada del plan, por ruta"""
+    keys: Dict[str, List[str]] = {path: [] for path, _ in PCQ_PATHS}
+    for direction, _, _ in DIRECTIONS:
+        name = f"plan-{plan_id}-{direction}"
+        keys["/queue/type"].append(f"pcq-{name}")
+        keys["/ip/firewall/mangle"].append(f"{PCQ_COMMENT} {name}")
+        keys["/queue/tree"].append(name)
+    return keys
+
+
+def plan_objects(plan) -> Dict[str, List[Dict[str, str]]]:
+    """Entradas de RouterOS que implementan el plan, por ruta"""
+    list_name = plan_list_name(plan.id)
+    objects: Dict[str, List[Dict[str, str]]] = {path: [] for path, _ in PCQ_PATHS}
+    limits = {"down": plan.download_limit, "up": plan.upload_limit}
+    for direction, classifier, list_field in DIRECTIONS:
+        limit = limits[direction]
+        name = f"plan-{plan.id}-{direction}"
+        objects["/queue/type"].append({
+            "name": f"pcq-{name}",
+            "kind": "pcq",
+            "pcq-rate": pcq_rate(limit),
+            "pcq-classifier": classifier,
+        })
+        objects["/ip/firewall/mangle"].append({
+            "comment": f"{PCQ_COMMENT} {name}",
+            "chain": "forward",
+            "action": "mark-packet",
+            list_field: list_name,
+            "new-packet-mark": name,
+            "passthrough": "false",
+        })
+        objects["/queue/tree"].append({
+            "name": name,
+            "parent": "global",
+            "packet-mark": name,
+            "queue": f"pcq-{name}",
+            "priority": str(plan.priority or 8),
+        })
+    return objects
+
+
+def _signature(objects: Dict[str, List[Dict[str, str]]]) -> Tuple:
+    return tuple(
+        (path, tuple(tuple(sorted(item.items())) for item in items))
+        for path, items in sorted(objects.items())
+    )
+
+
+class PcqRegistry:
+    """Planes PCQ ya aprovisionados por router (evita releer el router en cada asignación)"""
+
+    def __init__(self):
+        self._provisioned: Dict[Tuple[Hashable, int], Tuple] = {}
+
+    async def ensure(self, client, plan) -> bool:
+        """Crea o corrige las colas, reglas y queue tree del plan; True si tocó el router"""
+        objects = plan_objects(plan)
+        signature = _signature(objects)
+        key = (client.pool_key, plan.id)
+        if self._provisioned.get(key) == signature:
+            return False
+        for path, field in PCQ_PATHS:
+            await client.ensure_entries(path, field, objects[path], place_before=PLACE_BEFORE.get(path))
+        self._provisioned[key] = signature
+        return True
+
+    async def deprovision(self, client, plan_id: int) -> int:
+        """Quita del router el queue tree, las reglas, las colas y la address-list del plan"""
+        keys = plan_object_keys(plan_id)
+        removed = 0
+        # Orden inverso: el queue tree referencia las colas y las marcas
+        for path, field in reversed(PCQ_PATHS):
+            removed += await client.remove_entries(path, field, keys[path])
+        removed += await client.remove_entries(ADDRESS_LIST_PATH, "list", [plan_list_name(plan_id)])
+        self._provisioned.pop((client.pool_key, plan_id), None)
+        return removed
+
+    def invalidate(self, router_key: Hashable, plan_id: Optional[int] = None):
+        for key in [k for k in self._provisioned if k[0] == router_key and plan_id in (None, k[1])]:
+            del self._provisioned[key]
+
+
+# Registro global del proceso
+pcq_registry = PcqRegistry()
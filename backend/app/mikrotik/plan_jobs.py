@@ -0,0 +1,650 @@
+"""Asignación masiva de planes a dispositivos y despliegue de cambios de plan
+
+Un trabajo recibe un plan y una selección de dispositivos ya resuelta y se
+ejecuta en segundo plano: los routers en paralelo y, dentro de cada router,
+el índice de simple queues se lee una sola vez, se calculan altas y cambios
+(o, en planes PCQ, altas en la address-list del plan) y se aplican en lotes
+en pipeline con prioridad bulk. Tras cada lote se registran las asignaciones
+en la DB y el progreso del trabajo (plan_assignment_jobs).
+
+Un trabajo rollout (al cambiar los límites de un plan) recorre los
+dispositivos ya asignados y reescribe max-limit y burst de sus queues (solo
+set: una queue que ya no existe se informa, no se crea); en planes PCQ
+basta con reaprovisionar las colas PCQ de cada router. Entre varios workers
+gana el rollout más reciente del plan: al tomarlo (UPDATE condicional sobre
+pending) se marcan reemplazados los anteriores, y estos dejan de trabajar en
+el siguiente lote porque su registro de progreso exige status running.
+
+Mientras corre, el trabajo actualiza heartbeat_at; uno pendiente o en curso
+sin latido durante MT_PLAN_JOB_STALE_SECONDS (el proceso se detuvo) se marca
+fallido en el barrido periódico de PlanJobRunner.run_forever().
+"""
+import asyncio
+import ipaddress
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.mikrotik.pcq import PCQ, pcq_registry, plan_list_name
+from app.mikrotik.scheduler import BULK
+from app.core.logging import get_logger
+from app.core.config import settings
+
+logger = get_logger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+ASSIGN = "assign"
+ROLLOUT = "rollout"
+SUPERSEDED_MESSAGE = "Reemplazado por un despliegue más reciente del plan"
+INTERRUPTED_MESSAGE = "Interrumpido: el proceso que lo ejecutaba se detuvo"
+
+# Dispositivos por lote (un lote = una escritura en pipeline + un registro en DB)
+PLAN_JOB_BATCH_SIZE = 500
+# Errores por dispositivo que se guardan en el trabajo
+MAX_JOB_ERRORS = 100
+
+
+def _pair(value: Optional[str], default: str) -> str:
+    """'10M' → '10M/10M'; los valores 'subida/bajada' quedan igual"""
+    value = (value or "").strip() or default
+    return value if "/" in value else f"{value}/{value}"
+
+
+def queue_limits(plan) -> Dict[str, str]:
+    """max-limit, burst y prioridad de la simple queue de un plan
+
+    Sin burst completo (límite, umbral y tiempo) se envían ceros, así un
+    plan al que se le quita el burst también lo quita de las queues.
+    """
+    limits = {
+        "max-limit": f"{plan.upload_limit}/{plan.download_limit}",
+        "priority": _pair(str(plan.priority or 8), "8"),
+        "burst-limit": "0/0",
+        "burst-threshold": "0/0",
+        "burst-time": "0s/0s",
+    }
+    if plan.burst_upload and plan.burst_download and plan.burst_threshold and plan.burst_time:
+        limits["burst-limit"] = f"{plan.burst_upload}/{plan.burst_download}"
+        limits["burst-threshold"] = _pair(plan.burst_threshold, "0")
+        limits["burst-time"] = _pair(plan.burst_time, "0s")
+    return limits
+
+
+def select_devices(
+    db: Session,
+    device_ids: Optional[List[int]] = None,
+    router_id: Optional[int] = None,
+    subnet: Optional[str] = None
+):
+    """Dispositivos que cumplen todos los filtros dados (ids, router, subred)"""
+    from app.db.models import Device
+
+    network = ipaddress.ip_network(subnet, strict=False) if subnet else None
+    query = db.query(Device)
+    if device_ids:
+        query = query.filter(Device.id.in_(device_ids))
+    if router_id is not None:
+        query = query.filter(Device.router_id == router_id)
+    if network is not None:
+        # La subred se filtra aquí: la IP se guarda como texto
+        query = query.filter(Device.ip.isnot(None))
+
+    devices = []
+    for device in query.order_by(Device.id):
+        if network is not None:
+            try:
+                if ipaddress.ip_address(device.ip) not in network:
+                    continue
+            except ValueError:
+                continue
+        devices.append(device)
+    return devices
+
+
+def create_job(
+    db: Session,
+    plan_id: int,
+    device_ids: List[int],
+    kind: str = ASSIGN,
+    selection: Optional[Dict[str, Any]] = None,
+    skipped: int = 0,
+    current_user: Optional[Dict[str, Any]] = None
+):
+    """Registra un trabajo pendiente y lo lanza en segundo plano"""
+    from app.db.models import PlanAssignmentJob
+
+    job = PlanAssignmentJob(
+        plan_id=plan_id,
+        kind=kind,
+        selection=selection,
+        device_ids=device_ids,
+        status=PENDING,
+        heartbeat_at=datetime.utcnow(),
+        total=len(device_ids),
+        skipped=skipped,
+        created_by=(current_user or {}).get("sub"),
+        created_by_user_id=(current_user or {}).get("user_id")
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    plan_job_runner.start(job.id, plan_id if kind == ROLLOUT else None)
+    return job
+
+
+def rollout_plan(db: Session, plan, current_user: Optional[Dict[str, Any]] = None):
+    """Despliega los límites actuales del plan a todos sus dispositivos (None si no tiene)"""
+    from app.db.models import Device, PlanAssignment
+
+    rows = db.query(PlanAssignment.device_id, Device.ip).join(
+        Device, Device.id == PlanAssignment.device_id
+    ).filter(PlanAssignment.plan_id == plan.id).order_by(PlanAssignment.device_id).all()
+    if not rows:
+        return None
+    device_ids = [device_id for device_id, ip in rows if ip]
+    return create_job(
+        db, plan.id, device_ids, ROLLOUT,
+        selection={"plan_id": plan.id},
+        skipped=len(rows) - len(device_ids),
+        current_user=current_user
+    )
+
+
+class JobProgress:
+    """Progreso en memoria de un trabajo; cada lote persiste una instantánea"""
+
+    def __init__(self):
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.summary: Dict[str, int] = {}
+        self.errors: List[Dict[str, Any]] = []
+        self.lock = asyncio.Lock()
+
+    def add(self, results: List[Dict[str, Any]]):
+        for result in results:
+            self.processed += 1
+            if result["status"] == "ok":
+                self.succeeded += 1
+                self.summary[result["action"]] = self.summary.get(result["action"], 0) + 1
+            else:
+                self.failed += 1
+                if len(self.errors) < MAX_JOB_ERRORS:
+                    self.errors.append({"device_id": result["device_id"], "error": result.get("error")})
+
+
+class JobSuperseded(Exception):
+    """El trabajo dejó de estar en curso en la DB (otro rollout del plan lo reemplazó)"""
+
+
+def _supersede_rollouts(db: Session, job) -> List[int]:
+    """Marca fallidos los rollouts anteriores del plan aún pendientes o en curso"""
+    from app.db.models import PlanAssignmentJob
+
+    older = db.query(PlanAssignmentJob).filter(
+        PlanAssignmentJob.plan_id == job.plan_id,
+        PlanAssignmentJob.kind == ROLLOUT,
+        PlanAssignmentJob.id < job.id,
+        PlanAssignmentJob.status.in_((PENDING, RUNNING))
+    ).all()
+    for previous in older:
+        previous.status = FAILED
+        previous.completed_at = datetime.utcnow()
+        previous.errors = [*(previous.errors or []), {"device_id": None, "error": SUPERSEDED_MESSAGE}]
+    return [previous.id for previous in older]
+
+
+def _load_job(job_id: int):
+    """Toma el trabajo (solo si sigue pendiente) y carga plan, routers y dispositivos"""
+    from app.db.database import SessionLocal
+    from app.db.models import Device, Plan, PlanAssignment, PlanAssignmentJob, Router
+
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        # UPDATE condicional: un trabajo reemplazado o ya tomado no se ejecuta
+        claimed = db.query(PlanAssignmentJob).filter(
+            PlanAssignmentJob.id == job_id,
+            PlanAssignmentJob.status == PENDING
+        ).update({"status": RUNNING, "started_at": now, "heartbeat_at": now}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return None
+        job = db.get(PlanAssignmentJob, job_id)
+        if job.kind == ROLLOUT:
+            superseded = _supersede_rollouts(db, job)
+            db.commit()
+            if superseded:
+                logger.info("plan_rollouts_superseded", job_id=job_id, superseded=superseded)
+        plan = db.get(Plan, job.plan_id)
+        previous = {
+            device_id: plan_type for device_id, plan_type in db.query(
+                PlanAssignment.device_id, Plan.type
+            ).join(Plan, Plan.id == PlanAssignment.plan_id).filter(
+                PlanAssignment.device_id.in_(job.device_ids)
+            )
+        }
+        devices: Dict[int, List[Dict[str, Any]]] = {}
+        for device in db.query(Device).filter(Device.id.in_(job.device_ids), Device.ip.isnot(None)):
+            devices.setdefault(device.router_id, []).append({
+                "device_id": device.id,
+                "ip": device.ip,
+                "name": device.hostname or device.mac,
+                "previous_type": previous.get(device.id),
+            })
+        routers = db.query(Router).filter(Router.id.in_(list(devices))).all()
+        pcq_lists = [plan_list_name(plan_id) for (plan_id,) in db.query(Plan.id).filter(Plan.type == PCQ)]
+        context = {
+            "kind": job.kind or ASSIGN,
+            "plan": plan,
+            "routers": routers,
+            "devices": devices,
+            "pcq_lists": pcq_lists,
+            "user_id": job.created_by_user_id,
+        }
+        db.expunge_all()
+        return context
+    finally:
+        db.close()
+
+
+def _record_batch(
+    job_id: int,
+    router_id: int,
+    plan_id: int,
+    user_id: Optional[int],
+    results: List[Dict[str, Any]],
+    progress: JobProgress
+):
+    """Registra las asignaciones del lote y el progreso del trabajo
+
+    Lanza JobSuperseded (sin registrar nada) si el trabajo ya no está en curso.
+    """
+    from app.db.database import SessionLocal
+    from app.db.models import PlanAssignment, PlanAssignmentJob
+
+    ok = {r["device_id"]: r for r in results if r["status"] == "ok"}
+    db = SessionLocal()
+    try:
+        running = db.query(PlanAssignmentJob).filter(
+            PlanAssignmentJob.id == job_id,
+            PlanAssignmentJob.status == RUNNING
+        ).update({
+            "processed": progress.processed,
+            "succeeded": progress.succeeded,
+            "failed": progress.failed,
+            "summary": dict(progress.summary),
+            "errors": list(progress.errors),
+            "heartbeat_at": datetime.utcnow(),
+        }, synchronize_session=False)
+        if not running:
+            db.rollback()
+            raise JobSuperseded(SUPERSEDED_MESSAGE)
+        existing = {
+            a.device_id: a for a in db.query(PlanAssignment).filter(PlanAssignment.device_id.in_(list(ok)))
+        }
+        for device_id, result in ok.items():
+            assignment = existing.get(device_id)
+            if assignment is None:
+                db.add(PlanAssignment(
+                    device_id=device_id,
+                    plan_id=plan_id,
+                    router_id=router_id,
+                    queue_mikrotik_id=result.get("queue_id"),
+                    target=result["target"],
+                    assigned_by_user_id=user_id
+                ))
+            else:
+                assignment.plan_id = plan_id
+                assignment.router_id = router_id
+                assignment.queue_mikrotik_id = result.get("queue_id")
+                assignment.target = result["target"]
+        db.commit()
+    finally:
+        db.close()
+
+
+def _finish(job_id: int, status: str, progress: Optional[JobProgress] = None, error: Optional[str] = None):
+    from app.db.database import SessionLocal
+    from app.db.models import PlanAssignmentJob
+
+    db = SessionLocal()
+    try:
+        job = db.get(PlanAssignmentJob, job_id)
+        if job is None or job.status not in (PENDING, RUNNING):
+            # Ya terminado (p.ej. reemplazado por otro worker): se conserva su estado
+            return
+        job.status = status
+        job.completed_at = datetime.utcnow()
+        if progress is not None:
+            job.processed = progress.processed
+            job.succeeded = progress.succeeded
+            job.failed = progress.failed
+            job.summary = dict(progress.summary)
+            job.errors = list(progress.errors)
+        if error:
+            job.errors = [*(job.errors or []), {"device_id": None, "error": error}]
+        db.commit()
+    finally:
+        db.close()
+
+
+def _heartbeat(job_id: int):
+    from app.db.database import SessionLocal
+    from app.db.models import PlanAssignmentJob
+
+    db = SessionLocal()
+    try:
+        db.query(PlanAssignmentJob).filter(PlanAssignmentJob.id == job_id).update(
+            {"heartbeat_at": datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _fail_stale_jobs() -> List[int]:
+    """Marca fallidos los trabajos pendientes o en curso sin latido reciente"""
+    from app.db.database import SessionLocal
+    from app.db.models import PlanAssignmentJob
+
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.MT_PLAN_JOB_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        stale = db.query(PlanAssignmentJob).filter(
+            PlanAssignmentJob.status.in_((PENDING, RUNNING)),
+            (PlanAssignmentJob.heartbeat_at.is_(None)) | (PlanAssignmentJob.heartbeat_at < cutoff)
+        ).all()
+        for job in stale:
+            job.status = FAILED
+            job.completed_at = datetime.utcnow()
+            job.errors = [*(job.errors or []), {"device_id": None, "error": INTERRUPTED_MESSAGE}]
+        db.commit()
+        return [job.id for job in stale]
+    finally:
+        db.close()
+
+
+async def _beat(job_id: int):
+    """Latido del trabajo mientras corre (un lote puede tardar más que el umbral)"""
+    while True:
+        await asyncio.sleep(settings.MT_PLAN_JOB_STALE_SECONDS / 4)
+        try:
+            await asyncio.to_thread(_heartbeat, job_id)
+        except Exception as e:
+            logger.warning("plan_job_heartbeat_failed", job_id=job_id, error=str(e))
+
+
+def _failed(batch: List[Dict[str, Any]], error: str) -> List[Dict[str, Any]]:
+    return [{"device_id": d["device_id"], "status": "error", "error": error} for d in batch]
+
+
+async def _apply_simple_queue_batch(client, plan, batch, index, pcq_lists) -> List[Dict[str, Any]]:
+    """Altas y cambios de simple queue del lote (y salida de listas PCQ si venían de uno)"""
+    comment = f"SmartBJPortal - Plan: {plan.name}"
+    limits = queue_limits(plan)
+
+    results: Dict[int, Dict[str, Any]] = {}
+    leaving = [d for d in batch if d["previous_type"] == PCQ]
+    if leaving and pcq_lists:
+        outcomes = await client.apply_address_list_changes(
+            removals=[{"list": name, "address": d["ip"]} for d in leaving for name in pcq_lists]
+        )
+        by_address = {r["address"]: r for r in outcomes if r["status"] == "error"}
+        for d in leaving:
+            if d["ip"] in by_address:
+                results[d["device_id"]] = _failed([d], by_address[d["ip"]].get("error"))[0]
+
+    creates, updates, pending = [], [], []
+    for d in batch:
+        if d["device_id"] in results:
+            continue
+        queue_id = index.lookup(d["ip"])
+        if queue_id:
+            updates.append({"id": queue_id, **limits, "comment": comment})
+            pending.append((d, "queue_updated", queue_id))
+        else:
+            creates.append({
+                "name": f"QoS-{d['name']}",
+                "target": f"{d['ip']}/32",
+                **limits,
+                "comment": comment,
+            })
+            pending.append((d, "queue_created", None))
+    # apply_simple_queue_changes responde altas y luego cambios
+    pending.sort(key=lambda item: item[1] != "queue_created")
+
+    outcomes = await client.apply_simple_queue_changes(creates, updates)
+    for (d, action, queue_id), outcome in zip(pending, outcomes):
+        if outcome["status"] != "ok":
+            results[d["device_id"]] = _failed([d], outcome.get("error"))[0]
+            continue
+        results[d["device_id"]] = {
+            "device_id": d["device_id"],
+            "status": "ok",
+            "action": action,
+            "queue_id": outcome.get("id") or queue_id,
+            "target": f"{d['ip']}/32",
+        }
+    return [results[d["device_id"]] for d in batch]
+
+
+async def _apply_simple_queue_rollout_batch(client, plan, batch, index, pcq_lists) -> List[Dict[str, Any]]:
+    """Rollout: nuevos límites en las queues existentes (solo set; una queue ausente es un error)"""
+    comment = f"SmartBJPortal - Plan: {plan.name}"
+    limits = queue_limits(plan)
+
+    results: Dict[int, Dict[str, Any]] = {}
+    updates, pending = [], []
+    for d in batch:
+        queue_id = index.lookup(d["ip"])
+        if queue_id:
+            updates.append({"id": queue_id, **limits, "comment": comment})
+            pending.append((d, queue_id))
+        else:
+            results[d["device_id"]] = _failed([d], "Queue no encontrada en el router; reasigne el plan")[0]
+
+    outcomes = await client.apply_simple_queue_changes(updates=updates) if updates else []
+    for (d, queue_id), outcome in zip(pending, outcomes):
+        if outcome["status"] != "ok":
+            results[d["device_id"]] = _failed([d], outcome.get("error"))[0]
+            continue
+        results[d["device_id"]] = {
+            "device_id": d["device_id"],
+            "status": "ok",
+            "action": "queue_updated",
+            "queue_id": queue_id,
+            "target": f"{d['ip']}/32",
+        }
+    return [results[d["device_id"]] for d in batch]
+
+
+async def _apply_pcq_batch(client, plan, batch, index, pcq_lists) -> List[Dict[str, Any]]:
+    """Alta de las IPs del lote en la address-list del plan (y salida de su plan anterior)"""
+    comment = f"SmartBJPortal - Plan: {plan.name}"
+    target_list = plan_list_name(plan.id)
+    others = [name for name in pcq_lists if name != target_list]
+
+    # Venían de un plan con simple queue: se elimina su queue
+    results: Dict[int, Dict[str, Any]] = {}
+    queues = [(d, index.lookup(d["ip"])) for d in batch if d["previous_type"] not in (None, PCQ)]
+    queues = [(d, queue_id) for d, queue_id in queues if queue_id]
+    if queues:
+        outcomes = await client.apply_simple_queue_changes(removals=[queue_id for _, queue_id in queues])
+        for (d, _), outcome in zip(queues, outcomes):
+            if outcome["status"] != "ok":
+                results[d["device_id"]] = _failed([d], outcome.get("error"))[0]
+
+    pending = [d for d in batch if d["device_id"] not in results]
+    additions = [{"list": target_list, "address": d["ip"], "comment": comment} for d in pending]
+    moving = [d for d in pending if d["previous_type"] == PCQ]
+    if moving and others:
+        # Cambio entre planes PCQ: una lectura de las listas y bajas + altas juntas
+        outcomes = await client.apply_address_list_changes(
+            additions, [{"list": name, "address": d["ip"]} for d in moving for name in others]
+        )
+    else:
+        # Solo altas: sin releer la lista del plan ("already have" = ya estaba)
+        outcomes = await client.apply_address_list_diff(additions=additions)
+    errors = {r["address"]: r.get("error") for r in outcomes if r["status"] == "error"}
+    for d in pending:
+        if d["ip"] in errors:
+            results[d["device_id"]] = _failed([d], errors[d["ip"]])[0]
+        else:
+            results[d["device_id"]] = {
+                "device_id": d["device_id"],
+                "status": "ok",
+                "action": "pcq",
+                "queue_id": None,
+                "target": d["ip"],
+            }
+    return [results[d["device_id"]] for d in batch]
+
+
+async def _apply_pcq_rollout_batch(client, plan, batch, index, pcq_lists) -> List[Dict[str, Any]]:
+    """Rollout PCQ: las colas ya se reaprovisionaron; las IPs siguen en la lista del plan"""
+    return [
+        {"device_id": d["device_id"], "status": "ok", "action": "pcq", "queue_id": None, "target": d["ip"]}
+        for d in batch
+    ]
+
+
+async def _run_router(job_id: int, context: Dict[str, Any], router_obj, progress: JobProgress):
+    from app.mikrotik.client import MikroTikClient
+
+    plan = context["plan"]
+    devices = context["devices"][router_obj.id]
+    if plan.type == PCQ:
+        apply = _apply_pcq_rollout_batch if context["kind"] == ROLLOUT else _apply_pcq_batch
+    else:
+        apply = _apply_simple_queue_rollout_batch if context["kind"] == ROLLOUT else _apply_simple_queue_batch
+    client = MikroTikClient.from_router(router_obj, priority=BULK)
+    done = 0
+    try:
+        if plan.type == PCQ:
+            await pcq_registry.ensure(client, plan)
+        # Simple queues del router: una lectura (o ninguna si el índice está vigente)
+        index = None
+        if plan.type != PCQ or any(d["previous_type"] not in (None, PCQ) for d in devices):
+            index = await client.simple_queue_index()
+
+        for start in range(0, len(devices), PLAN_JOB_BATCH_SIZE):
+            batch = devices[start:start + PLAN_JOB_BATCH_SIZE]
+            results = await apply(client, plan, batch, index, context["pcq_lists"])
+            done += len(batch)
+            async with progress.lock:
+                progress.add(results)
+                await asyncio.to_thread(
+                    _record_batch, job_id, router_obj.id, plan.id, context["user_id"], results, progress
+                )
+    except JobSuperseded:
+        raise
+    except Exception as e:
+        logger.error("plan_job_router_failed", job_id=job_id, router_id=router_obj.id, error=str(e))
+        async with progress.lock:
+            progress.add(_failed(devices[done:], str(e)))
+            await asyncio.to_thread(_record_batch, job_id, router_obj.id, plan.id, None, [], progress)
+    finally:
+        await client.disconnect()
+
+
+async def run_job(job_id: int):
+    """Ejecuta un trabajo de asignación masiva hasta el final"""
+    progress = JobProgress()
+    beat = asyncio.create_task(_beat(job_id))
+    try:
+        context = await asyncio.to_thread(_load_job, job_id)
+        if context is None:
+            return
+        missing = set(context["devices"]) - {r.id for r in context["routers"]}
+        for router_id in missing:
+            progress.add(_failed(context["devices"][router_id], "Router no encontrado"))
+
+        semaphore = asyncio.Semaphore(settings.MT_FANOUT_CONCURRENCY)
+
+        async def bounded(router_obj):
+            async with semaphore:
+                await _run_router(job_id, context, router_obj, progress)
+
+        outcomes = await asyncio.gather(*(bounded(r) for r in context["routers"]), return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        await asyncio.to_thread(_finish, job_id, DONE, progress)
+        logger.info(
+            "plan_job_completed",
+            job_id=job_id,
+            kind=context["kind"],
+            plan_id=context["plan"].id,
+            succeeded=progress.succeeded,
+            failed=progress.failed,
+            summary=progress.summary
+        )
+    except JobSuperseded:
+        logger.info("plan_job_superseded", job_id=job_id, processed=progress.processed)
+    except asyncio.CancelledError as e:
+        # Apagado o reemplazado: queda registrado hasta dónde llegó (reenviarlo es idempotente)
+        await asyncio.shield(asyncio.to_thread(_finish, job_id, FAILED, progress, str(e) or "Trabajo interrumpido"))
+        raise
+    except Exception as e:
+        logger.error("plan_job_failed", job_id=job_id, error=str(e))
+        await asyncio.to_thread(_finish, job_id, FAILED, progress, str(e))
+    finally:
+        beat.cancel()
+
+
+class PlanJobRunner:
+    """Trabajos de asignación masiva en ejecución en este proceso"""
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+        # Rollout en curso por plan: uno nuevo reemplaza al anterior
+        self._rollouts: Dict[int, Tuple[int, asyncio.Task]] = {}
+
+    def start(self, job_id: int, rollout_plan_id: Optional[int] = None) -> asyncio.Task:
+        if rollout_plan_id is not None:
+            previous_id, previous = self._rollouts.get(rollout_plan_id, (None, None))
+            if previous is not None and not previous.done():
+                # Sus límites ya no son los del plan; el nuevo rollout cubre a todos
+                previous.cancel(SUPERSEDED_MESSAGE)
+                # Por si se canceló antes de empezar (sin pasar por run_job)
+                self._track(asyncio.create_task(
+                    asyncio.to_thread(_finish, previous_id, FAILED, None, SUPERSEDED_MESSAGE)
+                ))
+        task = self._track(asyncio.create_task(run_job(job_id)))
+        if rollout_plan_id is not None:
+            self._rollouts[rollout_plan_id] = (job_id, task)
+            task.add_done_callback(lambda t: self._forget_rollout(rollout_plan_id, t))
+        return task
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _forget_rollout(self, plan_id: int, task: asyncio.Task):
+        if self._rollouts.get(plan_id, (None, None))[1] is task:
+            del self._rollouts[plan_id]
+
+    async def run_forever(self):
+        """Barrido periódico de trabajos huérfanos (también al arrancar, tras un reinicio)"""
+        while True:
+            try:
+                interrupted = await asyncio.to_thread(_fail_stale_jobs)
+                if interrupted:
+                    logger.warning("plan_jobs_interrupted", job_ids=interrupted)
+            except Exception as e:
+                logger.warning("plan_job_sweep_failed", error=str(e))
+            await asyncio.sleep(settings.MT_PLAN_JOB_STALE_SECONDS / 2)
+
+    async def cancel_all(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# Registro global del proceso
+plan_job_runner = PlanJobRunner()
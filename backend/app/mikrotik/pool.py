@@ -0,0 +1,277 @@
+"""Pool de conexiones API MikroTik por router (compartido por todo el proceso)
+
+Todas las operaciones corren en el event loop de la aplicación, por lo que
+las secciones sin await no necesitan locks.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Hashable, List, Tuple
+from app.mikrotik.api_client import MikroTikAPIClient
+from app.mikrotik.protocol import RouterOSConnectionError
+from app.core.logging import get_logger
+from app.core.config import settings
+
+logger = get_logger(__name__)
+
+# Errores que dejan el socket en estado desconocido: la conexión se descarta.
+# Un !trap (error del comando) u otro error de uso la deja sana y vuelve al pool.
+DISCARD_ERRORS = (
+    RouterOSConnectionError,
+    OSError,
+    EOFError,
+    asyncio.TimeoutError,
+    asyncio.CancelledError,
+)
+
+
+class _PooledConnection:
+    """Conexión API junto con sus marcas de tiempo de uso"""
+
+    __slots__ = ("client", "created_at", "last_used", "last_checked")
+
+    def __init__(self, client: MikroTikAPIClient):
+        now = time.monotonic()
+        self.client = client
+        self.created_at = now
+        self.last_used = now
+        self.last_checked = now
+
+
+class RouterConnectionPool:
+    """Pool de conexiones API para un único router"""
+
+    def __init__(
+        self,
+        key: Hashable,
+        config: Dict[str, Any],
+        min_idle: int = 1,
+        max_idle: int = 4,
+        max_size: int = 8,
+        idle_timeout: int = 300,
+        health_check_interval: int = 60
+    ):
+        self.key = key
+        self.config = dict(config)
+        self.fingerprint = self.make_fingerprint(config)
+        self.min_idle = min_idle
+        self.max_idle = max_idle
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle: List[_PooledConnection] = []
+        self._borrowed: Dict[int, _PooledConnection] = {}
+        self._in_use = 0
+        self._slots = asyncio.Semaphore(max_size)
+        self._closed = False
+
+    @staticmethod
+    def make_fingerprint(config: Dict[str, Any]) -> Tuple:
+        """Huella de los parámetros que obligan a reconstruir el pool si cambian"""
+        return (
+            config.get("host"),
+            config.get("port"),
+            config.get("username"),
+            config.get("password"),
+            config.get("use_ssl"),
+            config.get("ssl_verify"),
+        )
+
+    async def _open(self) -> _PooledConnection:
+        client = MikroTikAPIClient(**self.config)
+        await client.connect()
+        return _PooledConnection(client)
+
+    def _is_expired(self, conn: _PooledConnection, now: float) -> bool:
+        return now - conn.last_used > self.idle_timeout
+
+    async def _is_healthy(self, conn: _PooledConnection, now: float) -> bool:
+        """Verifica la conexión solo si lleva tiempo sin comprobarse"""
+        if not conn.client.is_connected:
+            return False
+        if now - conn.last_checked < self.health_check_interval:
+            return True
+        healthy = await conn.client.ping()
+        conn.last_checked = now
+        return healthy
+
+    async def acquire(self) -> MikroTikAPIClient:
+        """Toma una conexión del pool (o abre una nueva)
+
+        Si ya hay max_size conexiones prestadas espera a que se libere una,
+        como máximo el timeout configurado del router.
+        """
+        if self._closed:
+            raise Exception("Pool de conexiones cerrado")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.config.get("timeout", 10))
+        except asyncio.TimeoutError:
+            raise Exception(f"Pool de conexiones agotado ({self.max_size} en uso)")
+        self._in_use += 1
+
+        try:
+            while self._idle:
+                conn = self._idle.pop()
+                now = time.monotonic()
+                try:
+                    healthy = await self._is_healthy(conn, now)
+                except BaseException:
+                    await conn.client.disconnect()
+                    raise
+                if healthy:
+                    conn.last_used = now
+                    self._borrowed[id(conn.client)] = conn
+                    return conn.client
+
+                # Conexión rota: descartarla y probar con la siguiente
+                logger.info("mikrotik_pool_connection_discarded", key=self.key)
+                await conn.client.disconnect()
+
+            conn = await self._open()
+            logger.info("mikrotik_pool_connection_opened", key=self.key)
+            self._borrowed[id(conn.client)] = conn
+            return conn.client
+        except BaseException:
+            self._in_use -= 1
+            self._slots.release()
+            raise
+
+    async def release(self, client: MikroTikAPIClient, discard: bool = False):
+        """Devuelve una conexión al pool; se cierra si está rota o sobra"""
+        self._in_use -= 1
+        self._slots.release()
+        conn = self._borrowed.pop(id(client), None) or _PooledConnection(client)
+        conn.last_used = time.monotonic()
+        keep = (
+            not discard
+            and not self._closed
+            and client.is_connected
+            and len(self._idle) < self.max_idle
+        )
+        if keep:
+            self._idle.append(conn)
+        else:
+            await client.disconnect()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[MikroTikAPIClient]:
+        """Context manager que toma y devuelve una conexión"""
+        client = await self.acquire()
+        try:
+            yield client
+        except BaseException as e:
+            await self.release(client, discard=isinstance(e, DISCARD_ERRORS) or not isinstance(e, Exception))
+            raise
+        else:
+            await self.release(client)
+
+    async def maintain(self):
+        """Cierra conexiones inactivas y mantiene el mínimo de conexiones ociosas"""
+        if self._closed:
+            return
+        now = time.monotonic()
+        expired = [c for c in self._idle if self._is_expired(c, now)]
+        # Las más recientes se conservan para respetar min_idle
+        keep_expired = max(0, self.min_idle - (len(self._idle) - len(expired)))
+        expired.sort(key=lambda c: c.last_used)
+        to_close = expired[:max(0, len(expired) - keep_expired)]
+        self._idle = [c for c in self._idle if c not in to_close]
+        missing = self.min_idle - len(self._idle)
+        missing = min(missing, self.max_size - self._in_use - len(self._idle))
+
+        for conn in to_close:
+            await conn.client.disconnect()
+        if to_close:
+            logger.info("mikrotik_pool_idle_evicted", key=self.key, closed=len(to_close))
+
+        for _ in range(max(0, missing)):
+            try:
+                conn = await self._open()
+            except Exception as e:
+                logger.warning("mikrotik_pool_prewarm_failed", key=self.key, error=str(e))
+                break
+            if self._closed:
+                await conn.client.disconnect()
+                break
+            self._idle.append(conn)
+
+    async def close(self):
+        """Cierra todas las conexiones ociosas; las prestadas se cierran al devolverse"""
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.client.disconnect()
+
+    def stats(self) -> Dict[str, int]:
+        """Métricas básicas del pool"""
+        return {"idle": len(self._idle), "in_use": self._in_use, "max_size": self.max_size}
+
+
+class ConnectionPoolRegistry:
+    """Registro de pools por router (clave: Router.id)"""
+
+    def __init__(self):
+        self._pools: Dict[Hashable, RouterConnectionPool] = {}
+
+    async def get_pool(self, key: Hashable, config: Dict[str, Any]) -> RouterConnectionPool:
+        """Obtiene el pool del router; lo reconstruye si cambiaron las credenciales"""
+        fingerprint = RouterConnectionPool.make_fingerprint(config)
+        pool = self._pools.get(key)
+
+        if pool is not None and pool.fingerprint != fingerprint:
+            logger.info("mikrotik_pool_rebuilt", key=key)
+            del self._pools[key]
+            await pool.close()
+            pool = None
+
+        if pool is None:
+            pool = RouterConnectionPool(
+                key=key,
+                config=config,
+                min_idle=settings.MT_POOL_MIN_IDLE,
+                max_idle=settings.MT_POOL_MAX_IDLE,
+                max_size=settings.MT_POOL_MAX_SIZE,
+                idle_timeout=settings.MT_POOL_IDLE_TIMEOUT_SECONDS,
+                health_check_interval=settings.MT_POOL_HEALTH_CHECK_SECONDS
+            )
+            # Puede haberse creado otro mientras se cerraba el anterior
+            pool = self._pools.setdefault(key, pool)
+        else:
+            # Timeout u otros parámetros no críticos se actualizan en caliente
+            pool.config.update(config)
+        return pool
+
+    async def invalidate(self, key: Hashable):
+        """Elimina y cierra el pool de un router (p.ej. al borrarlo)"""
+        pool = self._pools.pop(key, None)
+        if pool is not None:
+            await pool.close()
+
+    async def maintain(self):
+        """Mantenimiento periódico de todos los pools"""
+        for pool in list(self._pools.values()):
+            await pool.maintain()
+
+    async def run_forever(self):
+        """Mantenimiento cada MT_POOL_MAINTENANCE_INTERVAL_SECONDS (tarea de fondo)"""
+        while True:
+            await asyncio.sleep(settings.MT_POOL_MAINTENANCE_INTERVAL_SECONDS)
+            try:
+                await self.maintain()
+            except Exception as e:
+                logger.warning("pool_maintenance_failed", error=str(e))
+
+    async def close_all(self):
+        """Cierra todos los pools (apagado de la aplicación)"""
+        pools = list(self._pools.values())
+        self._pools.clear()
+        for pool in pools:
+            await pool.close()
+
+    def stats(self) -> Dict[Hashable, Dict[str, int]]:
+        return {key: pool.stats() for key, pool in self._pools.items()}
+
+
+# Registro global del proceso
+pool_registry = ConnectionPoolRegistry()
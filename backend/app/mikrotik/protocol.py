@@ -0,0 +1,301 @@
+"""Protocolo API de RouterOS sobre asyncio
+
+Implementa el formato de palabras con prefijo de longitud, las sentencias
+!re / !done / !trap / !fatal y el login (plano y por challenge MD5).
+"""
+import asyncio
+import hashlib
+import ssl
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+ENCODING = "utf-8"
+
+
+class RouterOSError(Exception):
+    """Error base del protocolo API"""
+
+
+class RouterOSTrapError(RouterOSError):
+    """El router respondió !trap al comando"""
+
+    def __init__(self, message: str, category: Optional[str] = None):
+        super().__init__(message)
+        self.message = message
+        self.category = category
+
+
+class RouterOSConnectionError(RouterOSError):
+    """La conexión se cerró o el router respondió !fatal"""
+
+
+def encode_length(length: int) -> bytes:
+    """Codifica la longitud de una palabra según el protocolo API"""
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, "big")
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, "big")
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, "big")
+    return b"\xf0" + length.to_bytes(4, "big")
+
+
+def encode_word(word: str) -> bytes:
+    data = word.encode(ENCODING)
+    return encode_length(len(data)) + data
+
+
+def encode_sentence(words: Iterable[str]) -> bytes:
+    """Codifica una sentencia completa (terminada en palabra vacía)"""
+    return b"".join(encode_word(w) for w in words) + b"\x00"
+
+
+def parse_attribute(word: str) -> Tuple[str, str]:
+    """Separa una palabra '=clave=valor' en (clave, valor)"""
+    key, _, value = word[1:].partition("=")
+    return key, value
+
+
+class _PendingCommand:
+    """Comando enviado a la espera de su !done"""
+
+    __slots__ = ("future", "rows", "trap", "on_row")
+
+    def __init__(self, future: asyncio.Future, on_row: Optional[Callable[[Dict[str, str]], None]] = None):
+        self.future = future
+        self.rows: List[Dict[str, str]] = []
+        self.trap: Optional[RouterOSTrapError] = None
+        self.on_row = on_row
+
+
+class ApiConnection:
+    """Conexión TCP (o TLS) al servicio API de RouterOS
+
+    Cada comando se envía con una etiqueta .tag única y una tarea lectora
+    reparte las respuestas según esa etiqueta, de modo que varios comandos
+    pueden estar en curso a la vez sobre el mismo socket (pipelining).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 8728,
+        use_ssl: bool = False,
+        ssl_verify: bool = False,
+        timeout: float = 10
+    ):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.ssl_verify = ssl_verify
+        self.timeout = timeout
+        self.bytes_received = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[str, _PendingCommand] = {}
+        self._next_tag = 0
+
+    @property
+    def closed(self) -> bool:
+        return (
+            self._writer is None
+            or self._writer.is_closing()
+            or self._reader_task is None
+            or self._reader_task.done()
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Comandos enviados que aún no recibieron !done"""
+        return len(self._pending)
+
+    def _ssl_context(self) -> Optional[ssl.SSLContext]:
+        if not self.use_ssl:
+            return None
+        context = ssl.create_default_context()
+        if not self.ssl_verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    async def open(self):
+        """Abre el socket hacia el router e inicia la tarea lectora"""
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self._ssl_context()),
+            self.timeout
+        )
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def login(self, username: str, password: str):
+        """Login plano (RouterOS >= 6.43) con fallback a challenge MD5"""
+        _, done = await self.talk(["/login", f"=name={username}", f"=password={password}"])
+        challenge = done.get("ret")
+        if challenge:
+            digest = hashlib.md5(
+                b"\x00" + password.encode(ENCODING) + bytes.fromhex(challenge)
+            ).hexdigest()
+            await self.talk(["/login", f"=name={username}", f"=response=00{digest}"])
+
+    async def close(self):
+        """Cierra el socket y falla los comandos pendientes"""
+        writer, self._writer, self._reader = self._writer, None, None
+        task, self._reader_task = self._reader_task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        self._fail_pending(RouterOSConnectionError("Conexión API cerrada"))
+        if writer is None:
+            return
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception as e:
+            logger.debug("mikrotik_api_close_error", host=self.host, error=str(e))
+
+    def _fail_pending(self, error: Exception):
+        pending, self._pending = self._pending, {}
+        for command in pending.values():
+            if not command.future.done():
+                command.future.set_exception(error)
+
+    async def _read_length(self) -> int:
+        reader = self._reader
+        first = (await reader.readexactly(1))[0]
+        if first < 0x80:
+            return first
+        if first < 0xC0:
+            rest = await reader.readexactly(1)
+            return ((first & 0x3F) << 8) | rest[0]
+        if first < 0xE0:
+            rest = await reader.readexactly(2)
+            return ((first & 0x1F) << 16) | int.from_bytes(rest, "big")
+        if first < 0xF0:
+            rest = await reader.readexactly(3)
+            return ((first & 0x0F) << 24) | int.from_bytes(rest, "big")
+        if first == 0xF0:
+            return int.from_bytes(await reader.readexactly(4), "big")
+        raise RouterOSConnectionError(f"Byte de control no soportado: {first:#x}")
+
+    async def read_sentence(self) -> List[str]:
+        """Lee una sentencia completa del socket"""
+        words = []
+        while True:
+            length = await self._read_length()
+            if length == 0:
+                return words
+            data = await self._reader.readexactly(length)
+            self.bytes_received += length
+            words.append(data.decode(ENCODING, errors="replace"))
+
+    async def _read_loop(self):
+        """Lee sentencias y las entrega al comando dueño de la etiqueta"""
+        error: Exception = RouterOSConnectionError("Conexión API cerrada")
+        try:
+            while True:
+                sentence = await self.read_sentence()
+                if sentence:
+                    self._dispatch(sentence)
+        except asyncio.CancelledError:
+            raise
+        except RouterOSConnectionError as e:
+            error = e
+        except Exception as e:
+            error = RouterOSConnectionError(str(e) or type(e).__name__)
+        finally:
+            self._fail_pending(error)
+
+        # Socket inservible: cerrarlo para que el pool lo descarte
+        await self.close()
+
+    def _dispatch(self, sentence: List[str]):
+        reply = sentence[0]
+        tag = None
+        attributes = {}
+        for word in sentence[1:]:
+            if word.startswith("="):
+                key, value = parse_attribute(word)
+                attributes[key] = value
+            elif word.startswith(".tag="):
+                tag = word[5:]
+
+        if reply == "!fatal":
+            message = sentence[1] if len(sentence) > 1 else "fatal"
+            raise RouterOSConnectionError(message)
+
+        command = self._pending.get(tag)
+        if command is None:
+            return
+        if reply == "!re":
+            if command.on_row is not None:
+                command.on_row(attributes)
+            else:
+                command.rows.append(attributes)
+        elif reply == "!trap":
+            command.trap = RouterOSTrapError(attributes.get("message", "error"), attributes.get("category"))
+        elif reply == "!done":
+            del self._pending[tag]
+            if command.future.done():
+                return
+            if command.trap is not None:
+                command.future.set_exception(command.trap)
+            else:
+                command.future.set_result((command.rows, attributes))
+
+    def send(
+        self,
+        words: List[str],
+        on_row: Optional[Callable[[Dict[str, str]], None]] = None
+    ) -> Tuple[str, asyncio.Future]:
+        """Envía un comando etiquetado sin esperar respuesta
+
+        Con on_row cada !re se entrega al callback en lugar de acumularse
+        (comandos que no terminan, como listen o print follow).
+
+        Returns:
+            (etiqueta, future que se resuelve con (filas !re, atributos de !done))
+        """
+        if self.closed:
+            raise RouterOSConnectionError("No hay conexión API activa")
+
+        self._next_tag += 1
+        tag = str(self._next_tag)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = _PendingCommand(future, on_row)
+        self._writer.write(encode_sentence([*words, f".tag={tag}"]))
+        return tag, future
+
+    def cancel(self, tag: str):
+        """Pide al router abortar un comando en curso (su !done se descarta)"""
+        if not self.closed and tag in self._pending:
+            self._writer.write(encode_sentence(["/cancel", f"=tag={tag}"]))
+
+    async def drain(self):
+        """Espera a que el buffer de escritura se vacíe hacia el socket"""
+        if self._writer is not None:
+            await self._writer.drain()
+
+    async def wait(self, tag: str, future: asyncio.Future) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+        """Espera la respuesta de un comando enviado con send()
+
+        Si la espera se cancela (p.ej. por timeout) se envía /cancel y la
+        conexión sigue siendo utilizable para otros comandos.
+        """
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self.cancel(tag)
+            raise
+
+    async def talk(self, words: List[str]) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+        """Envía un comando y espera su respuesta completa
+
+        Returns:
+            (filas !re, atributos de !done)
+        """
+        tag, future = self.send(words)
+        await self.drain()
+        return await self.wait(tag, future)
@@ -0,0 +1,120 @@
+"""Índice exacto target → simple queue por router
+
+Buscar la queue de un dispositivo recorriendo todas las simple queues con
+`ip in target` es O(n) y además coincide por subcadena (10.0.0.1 dentro de
+10.0.0.12/32). El índice parsea cada target (lista separada por comas de
+direcciones o prefijos) a redes IP y las mapea al .id de su queue, de modo
+que la búsqueda es un acceso a dict con coincidencia exacta.
+
+El índice se reconstruye cuando cambia el espejo de /queue/simple o, sin
+espejo, cuando vence MT_QUEUE_INDEX_TTL_SECONDS; las escrituras hechas por
+este proceso lo actualizan en el momento.
+"""
+import ipaddress
+import time
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+from app.core.config import settings
+
+Network = Any  # ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+def parse_target(target: Optional[str]) -> Tuple[Network, ...]:
+    """'10.0.0.5/32,10.0.1.0/24' → redes; interfaces u otros valores se ignoran"""
+    networks = []
+    for part in (target or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(part, strict=False))
+        except ValueError:
+            continue
+    return tuple(networks)
+
+
+def address_key(address: str) -> Optional[Network]:
+    """Clave de búsqueda de una IP o prefijo (una IP suelta equivale a /32 o /128)"""
+    try:
+        return ipaddress.ip_network(address.strip(), strict=False)
+    except ValueError:
+        return None
+
+
+class QueueIndex:
+    """Redes de target → .id de la simple queue"""
+
+    __slots__ = ("by_network", "targets", "built_at", "version")
+
+    def __init__(self, version: Any = None):
+        self.by_network: Dict[Network, str] = {}
+        self.targets: Dict[str, Tuple[Network, ...]] = {}
+        self.built_at = time.monotonic()
+        self.version = version
+
+    @classmethod
+    def build(cls, rows: Iterable[Dict[str, str]], version: Any = None) -> "QueueIndex":
+        index = cls(version)
+        for row in rows:
+            queue_id = row.get(".id")
+            if queue_id:
+                index.put(queue_id, row.get("target"))
+        return index
+
+    def put(self, queue_id: str, target: Optional[str]):
+        self.discard(queue_id)
+        networks = parse_target(target)
+        self.targets[queue_id] = networks
+        for network in networks:
+            # Si dos queues comparten target gana la primera (la que RouterOS aplica)
+            self.by_network.setdefault(network, queue_id)
+
+    def discard(self, queue_id: str):
+        for network in self.targets.pop(queue_id, ()):
+            if self.by_network.get(network) == queue_id:
+                del self.by_network[network]
+
+    def lookup(self, address: str) -> Optional[str]:
+        key = address_key(address)
+        return self.by_network.get(key) if key is not None else None
+
+    def expired(self, ttl: float) -> bool:
+        return time.monotonic() - self.built_at > ttl
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+
+class QueueIndexRegistry:
+    """Índices de simple queues por router (clave: Router.id o host:puerto)"""
+
+    def __init__(self):
+        self._indexes: Dict[Hashable, QueueIndex] = {}
+
+    def get(self, key: Hashable, version: Any = None) -> Optional[QueueIndex]:
+        """Índice vigente del router, o None si hay que reconstruirlo
+
+        version identifica el estado del espejo; sin espejo manda el TTL.
+        """
+        index = self._indexes.get(key)
+        if index is None:
+            return None
+        if version is not None:
+            return index if index.version == version else None
+        if index.version is not None or index.expired(settings.MT_QUEUE_INDEX_TTL_SECONDS):
+            return None
+        return index
+
+    def peek(self, key: Hashable) -> Optional[QueueIndex]:
+        """Índice del router aunque esté vencido (para aplicarle escrituras)"""
+        return self._indexes.get(key)
+
+    def store(self, key: Hashable, index: QueueIndex) -> QueueIndex:
+        self._indexes[key] = index
+        return index
+
+    def invalidate(self, key: Hashable):
+        self._indexes.pop(key, None)
+
+
+# Registro global del proceso
+queue_index_registry = QueueIndexRegistry()
@@ -0,0 +1,380 @@
+"""Reconciliación de address-lists gestionadas: DB → router con diff mínimo
+
+AddressListEntry es el estado deseado; las listas del router se desalinean
+por ediciones manuales, reinicios que pierden entradas dinámicas o cambios
+fallidos. La reconciliación lee las listas del router una vez (o del espejo),
+calcula con aritmética de conjuntos sobre (lista, dirección) qué falta y qué
+sobra, y aplica solo eso en lotes: bajas por .id agrupadas en pocos comandos
+y altas en pipeline. En modo dry-run solo devuelve el diff.
+
+No se tocan direcciones con cambios pendientes en el outbox (los aplicará el
+worker) ni las que la DB tiene en más de una lista (conflicto a resolver a mano).
+Tras leer el router se vuelve a consultar el outbox: las direcciones con
+mutaciones creadas o terminadas desde que se leyó la DB también se omiten,
+porque la foto de la DB o la del router puede ser anterior a ese cambio.
+Las entradas dinámicas (timeout, scripts) no son del portal y no se tocan.
+
+La DB puede no conocer entradas creadas fuera del portal, así que un diff que
+vaciaría las listas (DB sin entradas) o eliminaría más de
+MT_RECONCILE_MAX_REMOVE_RATIO de las entradas del router no se aplica: se
+rechaza con ReconcileRefused para revisarlo antes con dry-run.
+"""
+import asyncio
+import time
+from datetime import datetime
+from itertools import chain
+from typing import Any, Collection, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+from app.mikrotik.scheduler import BACKGROUND, BULK
+from app.core.logging import get_logger
+from app.core.config import MANAGED_LISTS, settings
+
+logger = get_logger(__name__)
+
+# Columnas que se leen del router para calcular el diff
+RECONCILE_FIELDS = (".id", "list", "address", "dynamic")
+# Operaciones por llamada al router (cada lote ocupa un turno del planificador)
+RECONCILE_BATCH_SIZE = 1000
+
+Key = Tuple[str, str]  # (lista, dirección)
+
+
+class ReconcileRefused(Exception):
+    """El diff eliminaría demasiadas entradas del router para aplicarlo sin revisión"""
+
+
+def normalize_address(address: str) -> str:
+    """RouterOS muestra 10.0.0.5 aunque se haya dado de alta como 10.0.0.5/32"""
+    address = address.strip()
+    return address[:-3] if address.endswith("/32") else address
+
+
+class AddressListDiff:
+    """Diferencia entre el estado deseado y las entradas del router"""
+
+    __slots__ = ("add", "remove", "ids", "unchanged", "actual")
+
+    def __init__(self):
+        self.add: List[Key] = []
+        # Entradas a eliminar: .id (None si el CLI no lo dio), list, address, duplicate
+        self.remove: List[Dict[str, Any]] = []
+        # *ID en el router de cada entrada deseada que ya existe
+        self.ids: Dict[Key, Optional[str]] = {}
+        self.unchanged = 0
+        self.actual = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.add or self.remove)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "to_add": [{"list": name, "address": address} for name, address in self.add],
+            "to_remove": [
+                {"list": item["list"], "address": item["address"], "id": item[".id"], "duplicate": item["duplicate"]}
+                for item in self.remove
+            ],
+            "unchanged": self.unchanged,
+        }
+
+
+def diff_address_lists(
+    desired: Iterable[Key],
+    entries: Iterable[Mapping[str, Any]],
+    skip: Collection[str] = ()
+) -> AddressListDiff:
+    """Calcula altas y bajas mínimas para que entries coincida con desired
+
+    Las entradas repetidas de una dirección deseada se eliminan dejando la
+    primera; las direcciones en skip no se tocan en ninguna lista. Las
+    entradas dynamic=true no cuentan ni se eliminan.
+    """
+    wanted: Set[Key] = set()
+    for list_name, address in desired:
+        address = normalize_address(address)
+        if address not in skip:
+            wanted.add((list_name, address))
+
+    diff = AddressListDiff()
+    actual: Dict[Key, List[Optional[str]]] = {}
+    for entry in entries:
+        if entry.get("dynamic") == "true":
+            continue
+        diff.actual += 1
+        address = normalize_address(entry.get("address") or "")
+        if address in skip:
+            continue
+        actual.setdefault((entry.get("list"), address), []).append(entry.get(".id") or entry.get("id"))
+
+    diff.add = sorted(wanted - actual.keys())
+    for key in sorted(actual.keys() - wanted):
+        diff.remove.extend(
+            {".id": entry_id, "list": key[0], "address": key[1], "duplicate": False}
+            for entry_id in actual[key]
+        )
+    for key in sorted(wanted & actual.keys()):
+        entry_ids = actual[key]
+        diff.ids[key] = entry_ids[0]
+        diff.remove.extend(
+            {".id": entry_id, "list": key[0], "address": key[1], "duplicate": True}
+            for entry_id in entry_ids[1:]
+        )
+    diff.unchanged = len(diff.ids)
+    return diff
+
+
+def refusal_reason(desired_count: int, diff: AddressListDiff, max_remove_ratio: Optional[float]) -> Optional[str]:
+    """Motivo por el que no se debe aplicar el diff (None = seguro)
+
+    max_remove_ratio None omite el límite de proporción (forzado por un admin);
+    vaciar las listas del router con la DB sin entradas nunca se aplica.
+    """
+    if not diff.remove:
+        return None
+    if not desired_count:
+        return "La DB no tiene entradas para estas listas: aplicar vaciaría las listas del router"
+    if max_remove_ratio is not None and len(diff.remove) > max_remove_ratio * diff.actual:
+        return (
+            f"El diff eliminaría {len(diff.remove)} de {diff.actual} entradas del router "
+            f"(máximo {max_remove_ratio:.0%})"
+        )
+    return None
+
+
+def _outbox_mark(router_id: int) -> Tuple[int, datetime]:
+    """Última mutación del router y hora: desde dónde buscar cambios posteriores"""
+    from sqlalchemy import func
+    from app.db.database import SessionLocal
+    from app.db.models import RouterMutation
+
+    db = SessionLocal()
+    try:
+        last_id = db.query(func.max(RouterMutation.id)).filter(RouterMutation.router_id == router_id).scalar()
+        return last_id or 0, datetime.utcnow()
+    finally:
+        db.close()
+
+
+def _changed_since(router_id: int, mark: Tuple[int, datetime]) -> Set[str]:
+    """Objetivos de mutaciones creadas, en curso o terminadas desde mark"""
+    from sqlalchemy import or_
+    from app.db.database import SessionLocal
+    from app.db.models import RouterMutation
+    from app.mikrotik.outbox import IN_PROGRESS, PENDING
+
+    last_id, since = mark
+    db = SessionLocal()
+    try:
+        return {
+            key.split(":", 1)[-1] for (key,) in db.query(RouterMutation.coalesce_key).filter(
+                RouterMutation.router_id == router_id,
+                or_(
+                    RouterMutation.id > last_id,
+                    RouterMutation.status.in_((PENDING, IN_PROGRESS)),
+                    RouterMutation.completed_at >= since
+                )
+            )
+        }
+    finally:
+        db.close()
+
+
+def _load_desired(router_id: int, list_names: Sequence[str]):
+    """Estado deseado según la DB, direcciones a omitir y conflictos"""
+    from app.db.database import SessionLocal
+    from app.db.models import AddressListEntry, RouterMutation
+    from app.mikrotik.outbox import IN_PROGRESS, PENDING
+
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            AddressListEntry.list_name, AddressListEntry.address, AddressListEntry.comment
+        ).filter(
+            AddressListEntry.router_id == router_id,
+            AddressListEntry.list_name.in_(list_names)
+        ).all()
+        # Objetivo de los cambios que el outbox aún no aplicó (coalesce_key = tipo:objetivo)
+        pending = {
+            key.split(":", 1)[-1] for (key,) in db.query(RouterMutation.coalesce_key).filter(
+                RouterMutation.router_id == router_id,
+                RouterMutation.status.in_((PENDING, IN_PROGRESS))
+            )
+        }
+    finally:
+        db.close()
+
+    desired: Dict[Key, Optional[str]] = {}
+    lists_by_address: Dict[str, Set[str]] = {}
+    for list_name, address, comment in rows:
+        address = normalize_address(address)
+        desired[(list_name, address)] = comment
+        lists_by_address.setdefault(address, set()).add(list_name)
+    conflicts = {address: sorted(names) for address, names in lists_by_address.items() if len(names) > 1}
+    return desired, pending | conflicts.keys(), conflicts
+
+
+def _record(router_id: int, list_names: Sequence[str], diff: AddressListDiff, results: List[Dict[str, Any]]):
+    """Actualiza mikrotik_id y synced_at de las entradas de la DB tras aplicar"""
+    from app.db.database import SessionLocal
+    from app.db.models import AddressListEntry
+
+    ids = dict(diff.ids)
+    for result in results:
+        if result["action"] == "add" and result["status"] == "added":
+            ids[(result["list"], result["address"])] = result.get("id")
+
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        updates = []
+        for entry_id, list_name, address, mikrotik_id in db.query(
+            AddressListEntry.id, AddressListEntry.list_name, AddressListEntry.address, AddressListEntry.mikrotik_id
+        ).filter(
+            AddressListEntry.router_id == router_id,
+            AddressListEntry.list_name.in_(list_names)
+        ):
+            key = (list_name, normalize_address(address))
+            if key in ids and ids[key] and ids[key] != mikrotik_id:
+                updates.append({"id": entry_id, "mikrotik_id": ids[key]})
+        if updates:
+            db.bulk_update_mappings(AddressListEntry, updates)
+        db.query(AddressListEntry).filter(
+            AddressListEntry.router_id == router_id,
+            AddressListEntry.list_name.in_(list_names)
+        ).update({"synced_at": now}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _apply(client, diff: AddressListDiff, comments: Dict[Key, Optional[str]]) -> List[Dict[str, Any]]:
+    removals = [item for item in diff.remove if item[".id"]]
+    additions = [{"list": name, "address": address, "comment": comments.get((name, address))} for name, address in diff.add]
+
+    # Filas sin .id (CLI sin show-ids): bajas por (lista, dirección); eso borra también
+    # la copia que se conservaba de una duplicada, así que se vuelve a dar de alta
+    keyed = {(item["list"], item["address"]): item["duplicate"] for item in diff.remove if not item[".id"]}
+    results: List[Dict[str, Any]] = []
+    if keyed:
+        results.extend(await client.apply_address_list_changes(
+            [{"list": name, "address": address, "comment": comments.get((name, address))}
+             for (name, address), duplicate in keyed.items() if duplicate],
+            [{"list": name, "address": address} for name, address in keyed]
+        ))
+
+    while removals or additions:
+        batch_removals = removals[:RECONCILE_BATCH_SIZE]
+        batch_additions = additions[:RECONCILE_BATCH_SIZE - len(batch_removals)]
+        removals = removals[len(batch_removals):]
+        additions = additions[len(batch_additions):]
+        results.extend(await client.apply_address_list_diff(batch_removals, batch_additions))
+    return results
+
+
+async def reconcile_router(
+    router_obj,
+    list_names: Sequence[str],
+    dry_run: bool = False,
+    priority: int = BULK,
+    force: bool = False
+) -> Dict[str, Any]:
+    """Reconcilia las address-lists list_names de un router con la DB
+
+    force aplica aunque supere MT_RECONCILE_MAX_REMOVE_RATIO (tras revisar el
+    dry-run); con la DB sin entradas se rechaza igual.
+    """
+    from app.mikrotik.client import MikroTikClient
+
+    started = time.perf_counter()
+    # La marca va antes de leer la DB: todo lo que cambie después se detecta
+    mark = await asyncio.to_thread(_outbox_mark, router_obj.id)
+    desired, skip, conflicts = await asyncio.to_thread(_load_desired, router_obj.id, list_names)
+
+    client = MikroTikClient.from_router(router_obj, priority=priority)
+    try:
+        entries = await asyncio.gather(*(
+            client.get_address_list(name, fields=RECONCILE_FIELDS) for name in list_names
+        ))
+        # Un cambio del outbox entre la lectura de la DB y la del router deja
+        # una de las dos fotos vieja para esa dirección: se omite esta vez
+        changed = await asyncio.to_thread(_changed_since, router_obj.id, mark)
+        skip = skip | {normalize_address(target) for target in changed}
+        diff = diff_address_lists(desired, chain.from_iterable(entries), skip)
+        refused = refusal_reason(len(desired), diff, None if force else settings.MT_RECONCILE_MAX_REMOVE_RATIO)
+        if refused and not dry_run:
+            logger.warning(
+                "address_list_reconcile_refused",
+                router_id=router_obj.id,
+                to_remove=len(diff.remove),
+                actual=diff.actual,
+                desired=len(desired),
+                reason=refused
+            )
+            raise ReconcileRefused(refused)
+
+        results: List[Dict[str, Any]] = []
+        if diff and not dry_run:
+            results = await _apply(client, diff, desired)
+        if not dry_run:
+            await asyncio.to_thread(_record, router_obj.id, list_names, diff, results)
+    finally:
+        await client.disconnect()
+
+    summary: Dict[str, int] = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    report = {
+        "router_id": router_obj.id,
+        "dry_run": dry_run,
+        "lists": list(list_names),
+        "desired": len(desired),
+        "actual": diff.actual,
+        **diff.as_dict(),
+        "skipped": sorted(skip),
+        "conflicts": conflicts,
+        "refused": refused,
+        "applied": summary,
+        "errors": [r for r in results if r["status"] == "error"],
+        "method_used": client.method_used,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    logger.info(
+        "address_lists_reconciled",
+        router_id=router_obj.id,
+        dry_run=dry_run,
+        to_add=len(diff.add),
+        to_remove=len(diff.remove),
+        unchanged=diff.unchanged,
+        skipped=len(skip),
+        applied=summary,
+        elapsed_ms=report["elapsed_ms"]
+    )
+    return report
+
+
+def _active_routers() -> List:
+    from app.db.database import SessionLocal
+    from app.db.models import Router
+
+    db = SessionLocal()
+    try:
+        routers = db.query(Router).filter(Router.status != "inactive").all()
+        db.expunge_all()
+        return routers
+    finally:
+        db.close()
+
+
+async def reconcile_forever():
+    """Reconcilia cada MT_RECONCILE_INTERVAL_SECONDS las listas gestionadas de cada router"""
+    while True:
+        await asyncio.sleep(settings.MT_RECONCILE_INTERVAL_SECONDS)
+        try:
+            for router_obj in await asyncio.to_thread(_active_routers):
+                try:
+                    await reconcile_router(router_obj, MANAGED_LISTS, priority=BACKGROUND)
+                except ReconcileRefused:
+                    # Ya registrado: queda para revisión manual (dry-run y force)
+                    continue
+                except Exception as e:
+                    logger.warning("address_list_reconcile_failed", router_id=router_obj.id, error=str(e))
+        except Exception as e:
+            logger.warning("address_list_reconcile_cycle_failed", error=str(e))
@@ -0,0 +1,276 @@
+"""Registros tipados y compactos para filas de RouterOS
+
+Las filas de leases, address-lists y simple queues llegan como dicts de
+claves con guiones y valores str. En routers con decenas de miles de filas
+eso es mucha memoria y trabajo para el GC por petición. Estos registros
+usan __slots__ y guardan cada campo ya convertido una sola vez:
+
+- IPv4 y MAC como int, velocidades y contadores "subida/bajada" como tuplas
+  de int y flags como bool.
+- Valores que se repiten en muchas filas (server, status, list...) internados.
+
+Siguen comportándose como un Mapping de solo lectura con las claves de
+RouterOS (lease.get("mac-address"), dict(lease)), por lo que el código que
+trabaja con dicts no cambia; los atributos dan el valor tipado
+(lease.mac_address, queue.max_limit). No son dicts: json.dumps y las columnas
+JSON los rechazan, así que se pasan por to_plain() (o record._asdict())
+antes de serializarlos; las respuestas de FastAPI los convierten solas.
+"""
+import socket
+import sys
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+RATE_UNITS = {"k": 1_000, "M": 1_000_000, "G": 1_000_000_000}
+SHARED_PAIRS_MAX = 4096
+
+
+class _Codec:
+    """Conversión de un campo: str de RouterOS → valor tipado → str (format None: ya es str)"""
+
+    __slots__ = ("parse", "format")
+
+    def __init__(self, parse: Callable[[str], Any], format: Optional[Callable[[Any], str]] = None):
+        self.parse = parse
+        self.format = format
+
+
+def _parse_ipv4(value: str) -> Any:
+    if value.count(".") == 3 and "/" not in value:
+        try:
+            return int.from_bytes(socket.inet_aton(value), "big")
+        except OSError:
+            pass
+    # Rangos, redes o nombres de host se conservan como texto
+    return value
+
+
+def _format_ipv4(value: Any) -> str:
+    if isinstance(value, int):
+        return socket.inet_ntoa(value.to_bytes(4, "big"))
+    return value
+
+
+def _parse_mac(value: str) -> Any:
+    if len(value) == 17 and value.count(":") == 5:
+        try:
+            return int(value.replace(":", ""), 16)
+        except ValueError:
+            pass
+    return value
+
+
+def _format_mac(value: Any) -> str:
+    if isinstance(value, int):
+        digits = f"{value:012X}"
+        return ":".join(digits[i:i + 2] for i in range(0, 12, 2))
+    return value
+
+
+def parse_rate(value: str) -> int:
+    """'10M' → 10000000 (bits/s); acepta el número plano que devuelve la API"""
+    value = value.strip()
+    if value and value[-1] in RATE_UNITS:
+        return int(float(value[:-1]) * RATE_UNITS[value[-1]])
+    return int(value or 0)
+
+
+def _parse_pair(value: str) -> Any:
+    """'subida/bajada' → (int, int) (max-limit, bytes, rate...)"""
+    upload, sep, download = value.partition("/")
+    try:
+        return (parse_rate(upload), parse_rate(download)) if sep else value
+    except ValueError:
+        return value
+
+
+_shared_pairs: Dict[str, Any] = {}
+
+
+def _parse_shared_pair(value: str) -> Any:
+    """Como _parse_pair, pero comparte la tupla entre filas (límites de plan: pocos valores distintos)"""
+    pair = _shared_pairs.get(value)
+    if pair is None:
+        pair = _parse_pair(value)
+        if len(_shared_pairs) < SHARED_PAIRS_MAX:
+            _shared_pairs[value] = pair
+    return pair
+
+
+def _format_pair(value: Any) -> str:
+    if isinstance(value, tuple):
+        return f"{value[0]}/{value[1]}"
+    return value
+
+
+TEXT = _Codec(str)
+INTERNED = _Codec(sys.intern)
+BOOL = _Codec(lambda v: v == "true", lambda v: "true" if v else "false")
+IPV4 = _Codec(_parse_ipv4, _format_ipv4)
+MAC = _Codec(_parse_mac, _format_mac)
+PAIR = _Codec(_parse_pair, _format_pair)
+LIMIT = _Codec(_parse_shared_pair, _format_pair)
+
+
+def _spec(fields: Dict[str, _Codec]) -> Dict[str, Tuple[str, _Codec]]:
+    """Clave de RouterOS → (atributo, codec): '.id' → id, 'mac-address' → mac_address"""
+    return {key: (key.lstrip(".").replace("-", "_"), codec) for key, codec in fields.items()}
+
+
+class RouterOSRecord(Mapping):
+    """Base de los registros: Mapping de solo lectura sobre atributos tipados"""
+
+    __slots__ = ("_extra",)
+
+    # Clave de RouterOS → (atributo, codec); lo define cada subclase
+    SPEC: Dict[str, Tuple[str, _Codec]] = {}
+
+    @classmethod
+    def from_row(cls, row: Dict[str, str]) -> "RouterOSRecord":
+        """Convierte una fila (dict de str) en registro; claves desconocidas van a _extra"""
+        record = cls.__new__(cls)
+        for attr, _ in cls.SPEC.values():
+            setattr(record, attr, None)
+        extra = None
+        spec = cls.SPEC
+        for key, value in row.items():
+            field = spec.get(key)
+            if field is None:
+                if extra is None:
+                    extra = {}
+                extra[sys.intern(key)] = value
+            else:
+                setattr(record, field[0], field[1].parse(value))
+        record._extra = extra
+        return record
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, str]]) -> List["RouterOSRecord"]:
+        return [cls.from_row(row) for row in rows]
+
+    def __getitem__(self, key: str) -> str:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # Sobrescribe Mapping.get (try/except KeyError) por ser el acceso más habitual
+        field = self.SPEC.get(key)
+        if field is None:
+            if self._extra is not None:
+                return self._extra.get(key, default)
+            return default
+        value = getattr(self, field[0])
+        if value is None:
+            return default
+        format = field[1].format
+        return value if format is None else format(value)
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for key, (attr, _) in self.SPEC.items():
+            if getattr(self, attr) is not None:
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        count = sum(1 for attr, _ in self.SPEC.values() if getattr(self, attr) is not None)
+        return count + (len(self._extra) if self._extra is not None else 0)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def _asdict(self) -> Dict[str, str]:
+        """Copia como dict de str con las claves de RouterOS (serializable a JSON)"""
+        return dict(self)
+
+
+def to_plain(value: Any) -> Any:
+    """Reemplaza los registros (también dentro de listas y dicts) por dicts para JSON"""
+    if isinstance(value, RouterOSRecord):
+        return value._asdict()
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    return value
+
+
+class DhcpLease(RouterOSRecord):
+    """Lease de /ip/dhcp-server/lease"""
+
+    SPEC = _spec({
+        ".id": TEXT,
+        "address": IPV4,
+        "mac-address": MAC,
+        "client-id": TEXT,
+        "host-name": TEXT,
+        "server": INTERNED,
+        "status": INTERNED,
+        "active-address": IPV4,
+        "active-mac-address": MAC,
+        "active-client-id": TEXT,
+        "active-server": INTERNED,
+        "expires-after": TEXT,
+        "last-seen": TEXT,
+        "lease-time": INTERNED,
+        "address-lists": INTERNED,
+        "comment": TEXT,
+        "blocked": BOOL,
+        "radius": BOOL,
+        "dynamic": BOOL,
+        "disabled": BOOL,
+    })
+    __slots__ = tuple(attr for attr, _ in SPEC.values())
+
+
+class AddressListItem(RouterOSRecord):
+    """Entrada de /ip/firewall/address-list"""
+
+    SPEC = _spec({
+        ".id": TEXT,
+        "list": INTERNED,
+        "address": IPV4,
+        "comment": TEXT,
+        "timeout": TEXT,
+        "creation-time": TEXT,
+        "dynamic": BOOL,
+        "disabled": BOOL,
+    })
+    __slots__ = tuple(attr for attr, _ in SPEC.values())
+
+
+class SimpleQueue(RouterOSRecord):
+    """Queue de /queue/simple (velocidades y contadores como (subida, bajada))"""
+
+    SPEC = _spec({
+        ".id": TEXT,
+        "name": TEXT,
+        "target": TEXT,
+        "dst": TEXT,
+        "parent": INTERNED,
+        "queue": INTERNED,
+        "priority": INTERNED,
+        "max-limit": LIMIT,
+        "limit-at": LIMIT,
+        "burst-limit": LIMIT,
+        "burst-threshold": LIMIT,
+        "burst-time": INTERNED,
+        "packet-marks": INTERNED,
+        "bytes": PAIR,
+        "packets": PAIR,
+        "rate": PAIR,
+        "packet-rate": PAIR,
+        "queued-bytes": PAIR,
+        "queued-packets": PAIR,
+        "dropped": PAIR,
+        "comment": INTERNED,
+        "invalid": BOOL,
+        "dynamic": BOOL,
+        "disabled": BOOL,
+    })
+    __slots__ = tuple(attr for attr, _ in SPEC.values())
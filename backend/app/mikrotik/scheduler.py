@@ -0,0 +1,149 @@
+"""Planificador de comandos por router con carriles de prioridad
+
+Cada llamada de MikroTikClient que llega al router ocupa un turno del
+planificador de ese router. Hay un máximo de turnos simultáneos (protege la
+CPU de RouterOS) y, cuando no hay turno libre, las llamadas esperan en tres
+carriles: interactive (clics de operadores) > bulk (cambios masivos,
+sincronizaciones) > background (sondeos, tareas periódicas). Dentro de un
+carril se respeta el orden de llegada, y un turno queda reservado para
+interactive, así una sincronización grande nunca deja detrás un desbloqueo.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Hashable, List, Tuple
+from app.core.deadline import DeadlineExceeded, remaining
+from app.core.config import settings
+
+# Carriles (menor valor = más prioridad)
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", BACKGROUND: "background"}
+
+
+class RouterScheduler:
+    """Turnos de ejecución de un router"""
+
+    def __init__(self, key: Hashable, max_concurrent: int = 4, interactive_reserved: int = 1):
+        self.key = key
+        self.max_concurrent = max(1, max_concurrent)
+        self.interactive_reserved = interactive_reserved
+        self._running = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self.executed = {priority: 0 for priority in PRIORITY_NAMES}
+        self.queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self.max_wait = {priority: 0.0 for priority in PRIORITY_NAMES}
+
+    def _limit(self, priority: int) -> int:
+        if priority == INTERACTIVE:
+            return self.max_concurrent
+        return max(1, self.max_concurrent - self.interactive_reserved)
+
+    def _wake(self):
+        """Cede los turnos libres a los que esperan, por prioridad y orden de llegada"""
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self._running >= self._limit(priority):
+                # El primero no cabe y los demás tienen igual o menos prioridad
+                return
+            heapq.heappop(self._waiters)
+            self._running += 1
+            future.set_result(None)
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        """Espera un turno; la espera cuenta contra el deadline de la petición"""
+        # Sin nadie de igual o mayor prioridad esperando, entra directo si hay turno
+        ahead = self._waiters and self._waiters[0][0] <= priority
+        if not ahead and self._running < self._limit(priority):
+            self._running += 1
+            self.executed[priority] += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self.queued[priority] += 1
+        started = time.monotonic()
+        try:
+            left = remaining()
+            if left is None:
+                await future
+            else:
+                await asyncio.wait_for(future, max(0.0, left))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Se agotó el tiempo de la petición esperando turno en el router")
+        except BaseException:
+            # Cancelado justo después de recibir el turno: devolverlo
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if not future.done() or future.cancelled():
+                self._waiters = [w for w in self._waiters if w[2] is not future]
+                heapq.heapify(self._waiters)
+        self.executed[priority] += 1
+        self.max_wait[priority] = max(self.max_wait[priority], time.monotonic() - started)
+
+    def release(self):
+        self._running -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def depth(self) -> Dict[str, int]:
+        """Llamadas esperando turno por carril"""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[PRIORITY_NAMES[priority]] += 1
+        return depth
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "max_concurrent": self.max_concurrent,
+            "waiting": self.depth(),
+            "executed": {PRIORITY_NAMES[p]: n for p, n in self.executed.items()},
+            "queued": {PRIORITY_NAMES[p]: n for p, n in self.queued.items()},
+            "max_wait_ms": {PRIORITY_NAMES[p]: round(w * 1000, 1) for p, w in self.max_wait.items()},
+        }
+
+
+class SchedulerRegistry:
+    """Planificadores por router (clave: Router.id o host:puerto)"""
+
+    def __init__(self):
+        self._schedulers: Dict[Hashable, RouterScheduler] = {}
+
+    def get(self, key: Hashable) -> RouterScheduler:
+        scheduler = self._schedulers.get(key)
+        if scheduler is None:
+            scheduler = RouterScheduler(
+                key,
+                max_concurrent=settings.MT_SCHEDULER_MAX_CONCURRENT,
+                interactive_reserved=settings.MT_SCHEDULER_INTERACTIVE_RESERVED
+            )
+            self._schedulers[key] = scheduler
+        return scheduler
+
+    def invalidate(self, key: Hashable):
+        self._schedulers.pop(key, None)
+
+    def stats(self) -> Dict[Hashable, Dict[str, Any]]:
+        return {key: s.stats() for key, s in self._schedulers.items()}
+
+
+# Registro global del proceso
+scheduler_registry = SchedulerRegistry()
@@ -0,0 +1,55 @@
+"""Coalescencia de lecturas idénticas concurrentes (single-flight)
+
+Si varias peticiones piden a la vez la misma lectura (mismo router, ruta,
+filtros y columnas) solo la primera llega al router; las demás esperan esa
+misma llamada y reciben una copia de su resultado o su error.
+
+La llamada corre en su propia tarea: si la petición que la inició se cancela
+(cliente desconectado) las que esperan siguen recibiendo el resultado.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from app.mikrotik.cache import copy_rows
+
+
+class SingleFlight:
+    """Lecturas en vuelo por clave (ver cache.read_key)"""
+
+    def __init__(self):
+        self._flights: Dict[Tuple, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Tuple, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Devuelve el resultado de loader(), compartido con las llamadas idénticas en curso"""
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = asyncio.ensure_future(loader())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda f, key=key: self._done(key, f))
+        else:
+            self.coalesced += 1
+        return copy_rows(await asyncio.shield(flight))
+
+    def __contains__(self, key: Tuple) -> bool:
+        return key in self._flights
+
+    def _done(self, key: Tuple, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Evita el aviso de excepción no recuperada si nadie quedó esperando
+        if not flight.cancelled():
+            flight.exception()
+
+    def forget(self, router_key: Hashable, path: str):
+        """Tras una escritura, las lecturas nuevas no se unen a las que ya estaban en vuelo"""
+        for key in [k for k in self._flights if k[:2] == (router_key, path)]:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._flights), "calls": self.calls, "coalesced": self.coalesced}
+
+
+# Instancia global del proceso
+single_flight = SingleFlight()
@@ -1,10 +1,30 @@
 """Cliente SSH MikroTik usando paramiko"""
+import re
+import time
+import uuid
 import paramiko
-from typing import Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.mikrotik.records import AddressListItem, DhcpLease, SimpleQueue
+from app.mikrotik.terse import iter_terse, parse_key_values
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 
+# *ID de RouterOS (único valor que va sin comillas en un filtro)
+ID_RE = re.compile(r"^\*[0-9A-Fa-f]+$")
+# Caracteres con significado dentro de una cadena CLI entre comillas
+CLI_ESCAPES = (
+    ("\\", "\\\\"),
+    ('"', '\\"'),
+    ("$", "\\$"),
+    ("?", "\\?"),
+    ("\n", "\\n"),
+    ("\r", "\\r"),
+    ("\t", "\\t"),
+)
+# Salida de un alta en lote cuando la entrada ya existe (find antes de add)
+EXISTS_MARK = "__SC_EXISTS"
+
 
 class MikroTikSSHClient:
     """Cliente SSH para MikroTik RouterOS como fallback"""
@@ -15,14 +35,22 @@ class MikroTikSSHClient:
         username: str,
         password: str,
         port: int = 22,
-        timeout: int = 10
+        timeout: int = 10,
+        keepalive: int = 0
     ):
         self.host = host
         self.username = username
         self.password = password
         self.port = port
         self.timeout = timeout
+        self.keepalive = keepalive
         self.client: Optional[paramiko.SSHClient] = None
+        self.last_used = time.monotonic()
+    
+    @property
+    def is_connected(self) -> bool:
+        transport = self.client.get_transport() if self.client else None
+        return transport is not None and transport.is_active()
     
     def connect(self) -> bool:
         """Conecta vía SSH"""
@@ -41,6 +69,9 @@ class MikroTikSSHClient:
                 look_for_keys=False,
                 allow_agent=False
             )
+            if self.keepalive:
+                # Mantiene viva la sesión larga entre operaciones
+                self.client.get_transport().set_keepalive(self.keepalive)
             
             logger.info("mikrotik_ssh_connected", host=self.host)
             return True
@@ -62,13 +93,19 @@ class MikroTikSSHClient:
                 self.client = None
     
     def execute_command(self, command: str) -> Tuple[str, str, int]:
-        """Ejecuta comando SSH y retorna (stdout, stderr, exit_code)"""
+        """Ejecuta comando SSH y retorna (stdout, stderr, exit_code)
+
+        Cada llamada abre un canal nuevo (exec) sobre el transporte de la sesión;
+        lo que se reutiliza es la conexión autenticada, no el canal.
+        """
         if not self.client:
             raise Exception("No hay conexión SSH activa. Llamar connect() primero.")
         
         try:
             logger.debug("mikrotik_ssh_execute", command=command)
+            self.last_used = time.monotonic()
             
+            # Cada exec abre un canal nuevo sobre el mismo transporte (sin handshake)
             stdin, stdout, stderr = self.client.exec_command(command, timeout=self.timeout)
             
             stdout_text = stdout.read().decode('utf-8')
@@ -87,27 +124,256 @@ class MikroTikSSHClient:
             logger.error("mikrotik_ssh_execute_error", command=command, error=str(e))
             raise
     
+    def stream_lines(self, command: str) -> Iterator[str]:
+        """Ejecuta un comando y produce su salida línea a línea según llega del canal"""
+        if not self.client:
+            raise Exception("No hay conexión SSH activa. Llamar connect() primero.")
+        
+        logger.debug("mikrotik_ssh_stream", command=command)
+        self.last_used = time.monotonic()
+        stdin, stdout, stderr = self.client.exec_command(command, timeout=self.timeout)
+        
+        for line in stdout:
+            yield line.rstrip("\r\n")
+        
+        exit_code = stdout.channel.recv_exit_status()
+        if exit_code != 0:
+            error = stderr.read().decode('utf-8', errors='replace').strip()
+            raise Exception(f"Error ejecutando '{command}': {error or exit_code}")
+    
+    def iter_rows(
+        self,
+        path: str,
+        queries: Optional[Dict[str, Any]] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Iterator[Dict[str, str]]:
+        """Lee una tabla con 'print terse' en streaming (filtros y columnas en el router)
+
+        show-ids reemplaza el índice de la salida por el *ID de cada fila, así
+        las filas leídas por SSH traen el mismo .id que por la API (RouterOS 7).
+        """
+        proplist = [f for f in (fields or ()) if not f.startswith(".")]
+        proplist_part = f" proplist={','.join(proplist)}" if proplist else ""
+        command = f"{self.to_menu(path)} print terse show-ids{proplist_part}{self.build_where(queries)}"
+        return iter_terse(self.stream_lines(command), fields or None)
+    
+    def get_rows(
+        self,
+        path: str,
+        queries: Optional[Dict[str, Any]] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, str]]:
+        return list(self.iter_rows(path, queries, fields))
+    
+    def get_dhcp_leases(
+        self,
+        status: Optional[str] = None,
+        address: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> List[DhcpLease]:
+        """Leases DHCP vía SSH (mismos filtros que la API)"""
+        queries = {}
+        if status:
+            queries["status"] = status
+        if address:
+            queries["address"] = address
+        return DhcpLease.from_rows(self.iter_rows("/ip/dhcp-server/lease", queries, fields))
+    
+    def get_address_list(
+        self,
+        list_name: Optional[str] = None,
+        address: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> List[AddressListItem]:
+        """Entradas de address-list vía SSH (mismos filtros que la API)"""
+        queries = {}
+        if list_name:
+            queries["list"] = list_name
+        if address:
+            queries["address"] = address
+        return AddressListItem.from_rows(self.iter_rows("/ip/firewall/address-list", queries, fields))
+    
+    def get_simple_queues(self, fields: Optional[Sequence[str]] = None) -> List[SimpleQueue]:
+        """Simple queues vía SSH"""
+        return SimpleQueue.from_rows(self.iter_rows("/queue/simple", None, fields))
+    
+    def get_system_resource(self, fields: Optional[Sequence[str]] = None) -> Dict[str, str]:
+        """Recursos del sistema vía SSH (salida 'clave: valor')"""
+        return parse_key_values(self.stream_lines("/system resource print"), fields)
+    
+    def execute_batch(self, commands: Sequence[str]) -> List[Tuple[str, bool]]:
+        """Ejecuta varios comandos CLI en un solo canal y separa sus salidas
+        
+        Cada comando va envuelto en :do {...} on-error={...} seguido de un
+        marcador único, así un error no aborta el resto del lote.
+        
+        Returns:
+            [(salida, ok)] en el mismo orden que commands
+        """
+        if not commands:
+            return []
+        marker = f"__SC_{uuid.uuid4().hex}"
+        script = "; ".join(
+            f':do {{ {command} }} on-error={{ :put "{marker}_ERR" }}; :put "{marker}_{i}"'
+            for i, command in enumerate(commands)
+        )
+        stdout, stderr, exit_code = self.execute_command(script)
+        
+        results: List[Tuple[str, bool]] = []
+        current: List[str] = []
+        failed = False
+        for line in stdout.splitlines():
+            stripped = line.strip()
+            if stripped == f"{marker}_ERR":
+                failed = True
+            elif stripped == f"{marker}_{len(results)}":
+                results.append(("\n".join(current), not failed))
+                current, failed = [], False
+            else:
+                current.append(line)
+        
+        # Comandos sin marcador: el canal se cortó antes de ejecutarlos
+        error = stderr.strip() or "sin respuesta"
+        while len(results) < len(commands):
+            results.append((error, False))
+        return results
+    
+    @staticmethod
+    def to_menu(path: str) -> str:
+        """Convierte una ruta API (/ip/firewall/address-list) en menú CLI (/ip firewall address-list)"""
+        return "/" + " ".join(part for part in path.split("/") if part)
+    
+    @staticmethod
+    def quote(value: Any) -> str:
+        """Valor como cadena CLI entre comillas
+
+        Escapa lo que el CLI interpreta dentro de una cadena (\\, ", $, ? y
+        saltos de línea), así un valor nunca puede cerrar la cadena ni
+        inyectar otro comando.
+        """
+        text = str(value)
+        for char, escaped in CLI_ESCAPES:
+            text = text.replace(char, escaped)
+        return f'"{text}"'
+    
+    @classmethod
+    def build_where(cls, queries: Optional[Dict[str, Any]]) -> str:
+        """Equivalente CLI de los filtros API: listas → or, claves → and"""
+        conditions = []
+        for key, value in (queries or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                options = " or ".join(f'{key}={cls.quote(v)}' for v in value)
+                conditions.append(f"({options})")
+            else:
+                conditions.append(f'{key}={cls.quote(value)}')
+        return f" where {' and '.join(conditions)}" if conditions else ""
+    
+    def count(self, path: str, queries: Optional[Dict[str, Any]] = None) -> int:
+        """Cuenta filas vía print count-only"""
+        command = f"{self.to_menu(path)} print count-only{self.build_where(queries)}"
+        stdout, stderr, exit_code = self.execute_command(command)
+        if exit_code != 0:
+            raise Exception(f"Error contando {path}: {stderr.strip()}")
+        return int(stdout.strip() or 0)
+    
+    def _add_command(self, list_name: str, address: str, comment: Optional[str] = None) -> str:
+        comment_part = f' comment={self.quote(comment)}' if comment else ''
+        return f'/ip firewall address-list add list={self.quote(list_name)} address={self.quote(address)}{comment_part}'
+    
+    def _add_if_missing_command(self, list_name: str, address: str, comment: Optional[str] = None) -> str:
+        """Alta que imprime EXISTS_MARK en vez de fallar si (lista, dirección) ya existe
+
+        on-error de RouterOS descarta el texto del error, así que "already have
+        such entry" no se puede distinguir de otro fallo: se busca antes de agregar.
+        """
+        find = f'/ip firewall address-list find{self.build_where({"list": list_name, "address": address})}'
+        return (
+            f':if ([:len [{find}]] > 0) do={{ :put "{EXISTS_MARK}" }} '
+            f'else={{ {self._add_command(list_name, address, comment)} }}'
+        )
+    
     def add_to_address_list(self, list_name: str, address: str, comment: Optional[str] = None) -> bool:
         """Agrega entrada a address-list vía SSH"""
-        comment_part = f' comment="{comment}"' if comment else ''
-        command = f'/ip firewall address-list add list={list_name} address={address}{comment_part}'
+        command = self._add_command(list_name, address, comment)
         
         stdout, stderr, exit_code = self.execute_command(command)
         return exit_code == 0
     
-    def remove_from_address_list(self, list_name: str, address: str) -> bool:
-        """Elimina entrada de address-list vía SSH"""
-        # Buscar ID y eliminar
-        find_cmd = f'/ip firewall address-list print where list={list_name} and address={address}'
-        stdout, stderr, exit_code = self.execute_command(find_cmd)
-        
-        if exit_code == 0 and stdout.strip():
-            # Extraer ID (parsing simplificado)
-            remove_cmd = f'/ip firewall address-list remove [find list={list_name} address={address}]'
-            stdout, stderr, exit_code = self.execute_command(remove_cmd)
-            return exit_code == 0
+    def _remove_commands(self, list_name: str, address: str, entry_id: Optional[str] = None) -> List[str]:
+        """Comandos CLI que cuentan y eliminan las entradas de (lista, dirección) o la de entry_id"""
+        if entry_id:
+            if not ID_RE.match(entry_id):
+                raise ValueError(f".id inválido: {entry_id!r}")
+            where = f" where .id={entry_id}"
+        else:
+            where = self.build_where({"list": list_name, "address": address})
+        find = f'/ip firewall address-list find{where}'
+        return [f':put [:len [{find}]]', f'/ip firewall address-list remove [{find}]']
+    
+    def remove_from_address_list(self, list_name: str, address: str) -> int:
+        """Elimina entrada(s) de address-list vía SSH; devuelve cuántas se eliminaron"""
+        (count_out, count_ok), (_, removed_ok) = self.execute_batch(
+            self._remove_commands(list_name, address)
+        )
+        if not (count_ok and removed_ok):
+            return 0
+        return int(count_out.strip() or 0)
+    
+    def apply_address_list_changes(
+        self,
+        additions: Sequence[Dict[str, Any]] = (),
+        removals: Sequence[Dict[str, Any]] = ()
+    ) -> List[Dict[str, Any]]:
+        """Altas y bajas masivas de address-list en un solo canal (modo lote)
+
+        Una baja con .id elimina solo esa entrada; sin él, todas las de (lista, dirección).
+        """
+        commands: List[str] = []
+        for item in removals:
+            commands.extend(self._remove_commands(item["list"], item["address"], item.get(".id")))
+        for item in additions:
+            commands.append(self._add_if_missing_command(item["list"], item["address"], item.get("comment")))
+        outputs = iter(self.execute_batch(commands))
         
-        return False
+        results = []
+        for item in removals:
+            (count_out, count_ok), (error, removed_ok) = next(outputs), next(outputs)
+            result = {"action": "remove", "list": item["list"], "address": item["address"]}
+            if not (count_ok and removed_ok):
+                result.update(status="error", error=error.strip() or "comando fallido")
+            else:
+                removed = int(count_out.strip() or 0)
+                result.update(status="removed" if removed else "not_found", removed=removed)
+            results.append(result)
+        for item in additions:
+            output, ok = next(outputs)
+            result = {"action": "add", "list": item["list"], "address": item["address"]}
+            if EXISTS_MARK in output or (not ok and "already have" in output.lower()):
+                result["status"] = "already_exists"
+            elif ok:
+                result["status"] = "added"
+            else:
+                result.update(status="error", error=output.strip() or "comando fallido")
+            results.append(result)
+        return results
+    
+    def move_to_address_list(
+        self,
+        address: str,
+        target_list: str,
+        list_names: Sequence[str],
+        comment: Optional[str] = None
+    ) -> bool:
+        """Deja la dirección solo en target_list con un único comando CLI (find + remove + add)"""
+        where = self.build_where({"address": address, "list": list(list_names)})
+        command = (
+            f'/ip firewall address-list remove [find{where}]; '
+            f'{self._add_command(target_list, address, comment)}'
+        )
+        stdout, stderr, exit_code = self.execute_command(command)
+        if exit_code != 0:
+            raise Exception(f"Error moviendo {address} a {target_list}: {stderr.strip()}")
+        return True
     
     def __enter__(self):
         """Context manager entry"""
@@ -0,0 +1,95 @@
+"""Sesiones SSH persistentes por router para el fallback
+
+Una sola conexión paramiko (transporte con keepalive) por router, compartida
+por todas las peticiones del proceso. Cada operación abre un canal sobre ese
+transporte, sin repetir el intercambio de claves ni la autenticación.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+from app.mikrotik.ssh_client import MikroTikSSHClient
+from app.core.logging import get_logger
+from app.core.config import settings
+
+logger = get_logger(__name__)
+
+
+class SSHSessionRegistry:
+    """Registro de sesiones SSH por router (clave: Router.id o host:puerto)"""
+
+    def __init__(self):
+        self._sessions: Dict[Hashable, Tuple[Tuple, MikroTikSSHClient]] = {}
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+
+    @staticmethod
+    def make_fingerprint(config: Dict[str, Any]) -> Tuple:
+        return (config.get("host"), config.get("port"), config.get("username"), config.get("password"))
+
+    async def get(self, key: Hashable, config: Dict[str, Any]) -> MikroTikSSHClient:
+        """Devuelve la sesión viva del router; la (re)abre si hace falta"""
+        fingerprint = self.make_fingerprint(config)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._sessions.get(key)
+            if entry is not None:
+                session_fingerprint, client = entry
+                if session_fingerprint == fingerprint and client.is_connected:
+                    client.timeout = config.get("timeout", client.timeout)
+                    return client
+                del self._sessions[key]
+                await asyncio.to_thread(client.disconnect)
+                logger.info("mikrotik_ssh_session_discarded", key=key)
+
+            client = MikroTikSSHClient(keepalive=settings.MT_SSH_KEEPALIVE_SECONDS, **config)
+            await asyncio.to_thread(client.connect)
+            self._sessions[key] = (fingerprint, client)
+            logger.info("mikrotik_ssh_session_opened", key=key)
+            return client
+
+    async def invalidate(self, key: Hashable, client: Optional[MikroTikSSHClient] = None):
+        """Cierra la sesión de un router (router borrado o sesión rota)
+
+        Con client solo se cierra si sigue siendo la sesión registrada.
+        """
+        entry = self._sessions.get(key)
+        if entry is None or (client is not None and entry[1] is not client):
+            return
+        del self._sessions[key]
+        await asyncio.to_thread(entry[1].disconnect)
+
+    async def maintain(self):
+        """Cierra sesiones caídas o sin uso durante MT_SSH_IDLE_TIMEOUT_SECONDS"""
+        now = time.monotonic()
+        for key, (_, client) in list(self._sessions.items()):
+            idle = now - client.last_used > settings.MT_SSH_IDLE_TIMEOUT_SECONDS
+            if idle or not client.is_connected:
+                if self._sessions.get(key, (None, None))[1] is client:
+                    del self._sessions[key]
+                await asyncio.to_thread(client.disconnect)
+                logger.info("mikrotik_ssh_session_closed", key=key, idle=idle)
+
+    async def run_forever(self):
+        """Cierra sesiones inactivas cada MT_POOL_MAINTENANCE_INTERVAL_SECONDS (tarea de fondo)"""
+        while True:
+            await asyncio.sleep(settings.MT_POOL_MAINTENANCE_INTERVAL_SECONDS)
+            try:
+                await self.maintain()
+            except Exception as e:
+                logger.warning("ssh_session_maintenance_failed", error=str(e))
+
+    async def close_all(self):
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for _, client in sessions:
+            await asyncio.to_thread(client.disconnect)
+
+    def stats(self) -> Dict[Hashable, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            key: {"connected": client.is_connected, "idle_seconds": round(now - client.last_used)}
+            for key, (_, client) in self._sessions.items()
+        }
+
+
+# Registro global del proceso
+ssh_registry = SSHSessionRegistry()
@@ -0,0 +1,90 @@
+"""Parser en streaming de la salida CLI de RouterOS (print terse / print)
+
+Las funciones trabajan sobre iterables de líneas y producen filas una a una,
+así una tabla de decenas de miles de filas leída por SSH nunca se acumula
+como texto completo en memoria.
+
+Formato terse: una fila por línea, índice (o *ID con show-ids), flags y
+pares clave=valor:
+    *1A X  list=INET_BLOQUEADO address=10.0.0.5 comment="cliente a=b" creation-time=jan/02/2024 10:00:00
+Los valores entre comillas pueden contener espacios, = y escapes (\\", \\\\,
+\\C3\\A1...). Un valor sin comillas llega hasta el siguiente ' clave=' (fechas).
+"""
+import re
+from typing import Dict, Iterable, Iterator, Optional, Sequence
+
+# Índice de la fila (print terse) o *ID del router (print terse show-ids), y flags
+HEAD_RE = re.compile(r"^\s*(\d+|\*[0-9A-Fa-f]+)((?:\s+[A-Z]+)*)(?=\s|$)")
+PAIR_RE = re.compile(
+    r'\s*([a-z.][a-z0-9.-]*)=("(?:[^"\\]|\\.)*"|.*?)(?=\s+[a-z.][a-z0-9.-]*=|\s*$)'
+)
+ESCAPE_RE = re.compile(r"\\([0-9A-F]{2}|.)")
+SIMPLE_ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "_": " "}
+
+# Flags comunes de las tablas de RouterOS
+FLAG_FIELDS = {"X": "disabled", "D": "dynamic"}
+
+
+def _unquote(value: str) -> str:
+    """Quita las comillas y resuelve los escapes (\\XX son bytes UTF-8)"""
+    if len(value) < 2 or value[0] != '"' or value[-1] != '"':
+        return value
+    body = value[1:-1]
+    raw = bytearray()
+    pos = 0
+    for match in ESCAPE_RE.finditer(body):
+        raw += body[pos:match.start()].encode()
+        escape = match.group(1)
+        if len(escape) == 2:
+            raw.append(int(escape, 16))
+        else:
+            raw += SIMPLE_ESCAPES.get(escape, escape).encode()
+        pos = match.end()
+    raw += body[pos:].encode()
+    return raw.decode("utf-8", errors="replace")
+
+
+def parse_terse_line(line: str, fields: Optional[Sequence[str]] = None) -> Optional[Dict[str, str]]:
+    """Convierte una línea terse en dict (None si no es una fila)
+
+    Con show-ids la fila lleva su .id; sin él, solo el índice de la salida.
+    """
+    head = HEAD_RE.match(line)
+    if head is None:
+        return None
+
+    row: Dict[str, str] = {}
+    if head.group(1).startswith("*"):
+        row[".id"] = head.group(1)
+    flags = "".join(head.group(2).split())
+    for match in PAIR_RE.finditer(line, head.end()):
+        row[match.group(1)] = _unquote(match.group(2))
+
+    for flag, name in FLAG_FIELDS.items():
+        if name not in row:
+            row[name] = "true" if flag in flags else "false"
+
+    if fields:
+        row = {k: v for k, v in row.items() if k in fields}
+    return row
+
+
+def iter_terse(lines: Iterable[str], fields: Optional[Sequence[str]] = None) -> Iterator[Dict[str, str]]:
+    """Produce las filas de una salida 'print terse' a medida que llegan las líneas"""
+    for line in lines:
+        row = parse_terse_line(line, fields)
+        if row is not None:
+            yield row
+
+
+def parse_key_values(lines: Iterable[str], fields: Optional[Sequence[str]] = None) -> Dict[str, str]:
+    """Convierte la salida 'clave: valor' de menús sin tabla (/system resource print)"""
+    result: Dict[str, str] = {}
+    for line in lines:
+        key, sep, value = line.strip().partition(": ")
+        if not sep or " " in key:
+            continue
+        if fields and key not in fields:
+            continue
+        result[key] = value.strip()
+    return result
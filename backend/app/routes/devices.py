@@ -13,6 +13,9 @@ from app.core.logging import get_logger
 logger = get_logger(__name__)
 router = APIRouter(prefix="/devices", tags=["Devices"])
 
+# Columnas que se piden al router (.proplist)
+ADDRESS_LIST_FIELDS = ("address",)
+
 
 class DeviceResponse(BaseModel):
     id: int
@@ -50,19 +53,10 @@ async def list_devices(
             raise HTTPException(status_code=404, detail="Router no encontrado")
 
         try:
-            with MikroTikClient(
-                host=router_obj.host,
-                username=router_obj.username,
-                password=router_obj.password,
-                api_port=router_obj.api_port,
-                ssh_port=router_obj.ssh_port,
-                use_ssl=router_obj.use_ssl,
-                ssl_verify=router_obj.ssl_verify,
-                timeout=router_obj.timeout
-            ) as client:
-                permitted_entries = client.get_address_list("INET_PERMITIDO")
-                limited_entries = client.get_address_list("INET_LIMITADO")
-                blocked_entries = client.get_address_list("INET_BLOQUEADO")
+            async with MikroTikClient.from_router(router_obj) as client:
+                permitted_entries = await client.get_address_list("INET_PERMITIDO", fields=ADDRESS_LIST_FIELDS)
+                limited_entries = await client.get_address_list("INET_LIMITADO", fields=ADDRESS_LIST_FIELDS)
+                blocked_entries = await client.get_address_list("INET_BLOQUEADO", fields=ADDRESS_LIST_FIELDS)
 
             permitted_set = {
                 entry.get("address")
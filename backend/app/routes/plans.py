@@ -1,16 +1,27 @@
 ﻿"""Rutas para gestión de planes de servicio"""
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
 from app.db.database import get_db
-from app.db.models import Plan
+from app.db.models import Plan, PlanAssignment, Router
+from app.mikrotik.fanout import fan_out
+from app.mikrotik.outbox import enqueue, outbox_worker, register_handler
+from app.mikrotik.pcq import PCQ, PLAN_TYPES, SIMPLE_QUEUE, pcq_registry
+from app.mikrotik.plan_jobs import rollout_plan
+from app.mikrotik.scheduler import BACKGROUND
 from app.core.security import require_admin
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/plans", tags=["Plans"])
 
+# Campos que, al cambiar, se despliegan a las queues de los dispositivos asignados
+ROLLOUT_FIELDS = (
+    "upload_limit", "download_limit", "burst_upload", "burst_download",
+    "burst_threshold", "burst_time", "priority",
+)
+
 
 class PlanCreate(BaseModel):
     name: str
@@ -22,6 +33,7 @@ class PlanCreate(BaseModel):
     burst_threshold: Optional[str] = None
     burst_time: Optional[str] = None
     priority: Optional[int] = 8
+    type: Optional[str] = SIMPLE_QUEUE  # simple_queue | pcq
     is_active: Optional[bool] = True
 
 
@@ -35,6 +47,7 @@ class PlanUpdate(BaseModel):
     burst_threshold: Optional[str] = None
     burst_time: Optional[str] = None
     priority: Optional[int] = None
+    type: Optional[str] = None
     is_active: Optional[bool] = None
 
 
@@ -49,7 +62,10 @@ class PlanResponse(BaseModel):
     burst_threshold: Optional[str]
     burst_time: Optional[str]
     priority: int
+    type: Optional[str] = SIMPLE_QUEUE
     is_active: bool
+    rollout_job_id: Optional[int] = None  # Despliegue de los nuevos límites (PUT)
+    rollout_error: Optional[str] = None  # El plan se guardó pero el despliegue no arrancó (reintentar con /rollout)
     
     class Config:
         from_attributes = True
@@ -94,6 +110,9 @@ async def create_plan(
     if existing:
         raise HTTPException(status_code=400, detail="Ya existe un plan con ese nombre")
     
+    if plan_data.type not in PLAN_TYPES:
+        raise HTTPException(status_code=400, detail=f"Tipo de plan inválido (use {', '.join(PLAN_TYPES)})")
+    
     plan = Plan(
         name=plan_data.name,
         description=plan_data.description,
@@ -104,6 +123,7 @@ async def create_plan(
         burst_threshold=plan_data.burst_threshold,
         burst_time=plan_data.burst_time,
         priority=plan_data.priority or 8,
+        type=plan_data.type,
         is_active=plan_data.is_active
     )
     
@@ -127,6 +147,8 @@ async def update_plan(
     if not plan:
         raise HTTPException(status_code=404, detail="Plan no encontrado")
     
+    previous_limits = {field: getattr(plan, field) for field in ROLLOUT_FIELDS}
+    
     if plan_data.name is not None:
         plan.name = plan_data.name
     if plan_data.description is not None:
@@ -145,27 +167,140 @@ async def update_plan(
         plan.burst_time = plan_data.burst_time
     if plan_data.priority is not None:
         plan.priority = plan_data.priority
+    if plan_data.type is not None and plan_data.type != plan.type:
+        if plan_data.type not in PLAN_TYPES:
+            raise HTTPException(status_code=400, detail=f"Tipo de plan inválido (use {', '.join(PLAN_TYPES)})")
+        # Las asignaciones existentes están aplicadas con el mecanismo anterior
+        if db.query(PlanAssignment).filter(PlanAssignment.plan_id == plan.id).first():
+            raise HTTPException(status_code=400, detail="No se puede cambiar el tipo de un plan con dispositivos asignados")
+        plan.type = plan_data.type
     if plan_data.is_active is not None:
         plan.is_active = plan_data.is_active
     
     db.commit()
     db.refresh(plan)
     
-    logger.info("plan_updated", plan_id=plan.id, user=current_user.get("sub", "unknown"))
-    return plan
+    response = PlanResponse.model_validate(plan)
+    changed = [field for field in ROLLOUT_FIELDS if getattr(plan, field) != previous_limits[field]]
+    if changed:
+        # Las queues ya creadas en los routers toman los nuevos límites en segundo plano
+        try:
+            job = rollout_plan(db, plan, current_user)
+            response.rollout_job_id = job.id if job else None
+        except Exception as e:
+            # El plan ya quedó guardado: se informa sin fallar la petición
+            db.rollback()
+            logger.error("plan_rollout_start_failed", plan_id=plan.id, error=str(e))
+            response.rollout_error = f"No se pudo iniciar el despliegue: {e}"
+    
+    logger.info(
+        "plan_updated",
+        plan_id=plan.id,
+        changed_limits=changed,
+        rollout_job_id=response.rollout_job_id,
+        user=current_user.get("sub", "unknown")
+    )
+    return response
+
+
+@router.post("/{plan_id}/rollout", response_model=PlanResponse, status_code=status.HTTP_202_ACCEPTED)
+async def rollout_plan_limits(
+    plan_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """Volver a desplegar los límites del plan a todos sus dispositivos (p.ej. tras fallos)"""
+    plan = db.query(Plan).filter(Plan.id == plan_id).first()
+    if not plan:
+        raise HTTPException(status_code=404, detail="Plan no encontrado")
+    
+    try:
+        job = rollout_plan(db, plan, current_user)
+    except Exception as e:
+        db.rollback()
+        logger.error("plan_rollout_start_failed", plan_id=plan.id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"No se pudo iniciar el despliegue: {e}"
+        )
+    if job is None:
+        raise HTTPException(status_code=400, detail="El plan no tiene dispositivos asignados")
+    
+    response = PlanResponse.model_validate(plan)
+    response.rollout_job_id = job.id
+    logger.info("plan_rollout_started", plan_id=plan.id, job_id=job.id, user=current_user.get("sub", "unknown"))
+    return response
+
+
+PCQ_DEPROVISION = "pcq_plan_deprovision"
+
+
+async def _apply_pcq_deprovision(client, data: dict) -> dict:
+    """Quita del router los objetos de un plan PCQ ya eliminado (idempotente)"""
+    return {"removed": await pcq_registry.deprovision(client, data["plan_id"])}
+
+
+register_handler(PCQ_DEPROVISION, _apply_pcq_deprovision, priority=BACKGROUND)
 
 
 @router.delete("/{plan_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_plan(
     plan_id: int,
+    force: bool = Query(False, description="Eliminar aunque algún router no responda"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
-    """Eliminar un plan de servicio"""
+    """Eliminar un plan de servicio
+    
+    Un plan PCQ con dispositivos asignados no se elimina; sin ellos, antes de
+    borrar la fila se quitan de cada router sus colas, reglas, queue tree y
+    address-list. Los routers inactivos no se esperan: su limpieza queda en
+    el outbox. Si algún router activo falla el plan se conserva para
+    reintentar, salvo con force, que también deja su limpieza en el outbox.
+    """
     plan = db.query(Plan).filter(Plan.id == plan_id).first()
     if not plan:
         raise HTTPException(status_code=404, detail="Plan no encontrado")
     
+    if plan.type == PCQ:
+        if db.query(PlanAssignment).filter(PlanAssignment.plan_id == plan.id).first():
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="El plan PCQ tiene dispositivos asignados; reasígnelos antes de eliminarlo"
+            )
+        routers = db.query(Router).all()
+        active = [r for r in routers if r.status != "inactive"]
+        results = await fan_out(active, lambda client: pcq_registry.deprovision(client, plan.id))
+        failed = {result.router_id: result.error for result in results if not result.ok}
+        if failed and not force:
+            logger.warning("plan_pcq_deprovision_failed", plan_id=plan_id, routers=failed)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail={
+                    "message": "No se pudo quitar el plan PCQ de todos los routers (force=true lo deja pendiente)",
+                    "routers": failed
+                }
+            )
+        # Lo que no se pudo quitar ahora lo reintenta el outbox cuando el router responda
+        leftover = sorted({r.id for r in routers if r.status == "inactive"} | failed.keys())
+        for router_id in leftover:
+            enqueue(
+                db,
+                router_id,
+                PCQ_DEPROVISION,
+                f"plan-{plan.id}",
+                {"plan_id": plan.id},
+                created_by=current_user.get("sub")
+            )
+        if leftover:
+            outbox_worker.notify()
+        logger.info(
+            "plan_pcq_deprovisioned",
+            plan_id=plan_id,
+            removed={result.router_id: result.value for result in results if result.ok},
+            pending_routers=leftover
+        )
+    
     db.delete(plan)
     db.commit()
     
@@ -3,15 +3,22 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 from app.db.database import get_db
-from app.db.models import Device, Router, Plan, PlanAssignment
+from app.db.models import Device, Router, Plan, PlanAssignment, PlanAssignmentJob
 from app.core.security import require_admin
+from app.core.deadline import DeadlineExceeded
 from app.core.logging import get_logger
 from app.mikrotik.client import MikroTikClient
+from app.mikrotik.pcq import PCQ, pcq_registry, plan_list_name
+from app.mikrotik.plan_jobs import create_job, queue_limits, select_devices
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/qos", tags=["QoS"])
 
+# Columnas que se piden al router (.proplist)
+QUEUE_LIST_FIELDS = (".id", "name", "target", "max-limit", "comment")
+
 
 class QueueCreate(BaseModel):
     router_id: int
@@ -35,6 +42,36 @@ class AssignPlanRequest(BaseModel):
     plan_id: int
 
 
+class BulkAssignPlanRequest(BaseModel):
+    plan_id: int
+    # Filtros de dispositivos (se combinan: todos deben cumplirse)
+    device_ids: Optional[List[int]] = None
+    router_id: Optional[int] = None
+    subnet: Optional[str] = None  # 10.0.0.0/24
+
+
+class PlanJobResponse(BaseModel):
+    id: int
+    plan_id: int
+    kind: str = "assign"  # assign | rollout
+    selection: Optional[dict] = None
+    status: str  # pending | running | done | failed
+    total: int
+    processed: int
+    succeeded: int
+    failed: int
+    skipped: int  # Sin IP asignada
+    summary: Optional[dict] = None
+    errors: Optional[list] = None
+    created_by: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 @router.get("/queues/{router_id}", response_model=List[QueueResponse])
 async def list_queues(
     router_id: int,
@@ -47,16 +84,9 @@ async def list_queues(
         raise HTTPException(status_code=404, detail="Router no encontrado")
     
     try:
-        client = MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl
-        )
+        client = MikroTikClient.from_router(router_obj)
         
-        queues = await client.get_simple_queues()
+        queues = await client.get_simple_queues(QUEUE_LIST_FIELDS)
         
         result = []
         for queue in queues:
@@ -70,6 +100,8 @@ async def list_queues(
         
         return result
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("list_queues_failed", router_id=router_id, error=str(e))
         raise HTTPException(
@@ -90,14 +122,7 @@ async def create_queue(
         raise HTTPException(status_code=404, detail="Router no encontrado")
     
     try:
-        client = MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl
-        )
+        client = MikroTikClient.from_router(router_obj)
         
         # Formato: upload/download
         max_limit = f"{queue_data.max_limit_upload}/{queue_data.max_limit_download}"
@@ -113,7 +138,7 @@ async def create_queue(
             "queue_created",
             router_id=queue_data.router_id,
             queue_name=queue_data.name,
-            user=current_user["username"]
+            user=current_user.get("sub")
         )
         
         return {
@@ -122,6 +147,8 @@ async def create_queue(
             "name": queue_data.name
         }
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("create_queue_failed", error=str(e))
         raise HTTPException(
@@ -143,14 +170,7 @@ async def delete_queue(
         raise HTTPException(status_code=404, detail="Router no encontrado")
     
     try:
-        client = MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl
-        )
+        client = MikroTikClient.from_router(router_obj)
         
         await client.remove_simple_queue(queue_id)
         
@@ -158,11 +178,13 @@ async def delete_queue(
             "queue_deleted",
             router_id=router_id,
             queue_id=queue_id,
-            user=current_user["username"]
+            user=current_user.get("sub")
         )
         
         return {"message": "Queue eliminada exitosamente"}
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("delete_queue_failed", error=str(e))
         raise HTTPException(
@@ -190,64 +212,85 @@ async def assign_plan_to_device(
     if not router_obj:
         raise HTTPException(status_code=404, detail="Router no encontrado")
     
+    if not device.ip:
+        raise HTTPException(status_code=400, detail="El dispositivo no tiene IP asignada")
+    
+    existing_assignment = db.query(PlanAssignment).filter(
+        PlanAssignment.device_id == device.id
+    ).first()
+    previous_plan = existing_assignment.plan if existing_assignment else None
+    
     try:
-        client = MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl
-        )
+        client = MikroTikClient.from_router(router_obj)
         
-        # Nombre de la queue
-        queue_name = f"QoS-{device.hostname or device.mac}"
         comment = f"SmartBJPortal - Plan: {plan.name}"
+        pcq_lists = [plan_list_name(plan_id) for (plan_id,) in db.query(Plan.id).filter(Plan.type == PCQ)]
         
-        # Verificar si ya existe una queue para este dispositivo
-        existing_queues = await client.get_simple_queues()
-        existing_queue = None
-        for q in existing_queues:
-            if device.ip in q.get("target", ""):
-                existing_queue = q
-                break
-        
-        # Formato: upload/download
-        max_limit = f"{plan.upload_limit}/{plan.download_limit}"
-        
-        if existing_queue:
-            # Actualizar queue existente
-            await client.update_simple_queue(
-                queue_id=existing_queue[".id"],
-                max_limit=max_limit,
-                comment=comment
-            )
-            action = "actualizada"
+        if plan.type == PCQ:
+            # Cola PCQ y queue tree del plan (una vez por router); el
+            # dispositivo entra al plan por address-list
+            await pcq_registry.ensure(client, plan)
+            target = device.ip
+            
+            if previous_plan is not None and previous_plan.type != PCQ:
+                queue_id = await client.find_simple_queue(device.ip)
+                if queue_id:
+                    await client.remove_simple_queue(queue_id)
+            
+            await client.move_to_address_list(device.ip, plan_list_name(plan.id), pcq_lists, comment)
+            queue_id = None
+            action = "pcq"
         else:
-            # Crear nueva queue
-            await client.add_simple_queue(
-                name=queue_name,
-                target=f"{device.ip}/32",
-                max_limit=max_limit,
-                comment=comment
-            )
-            action = "creada"
+            if previous_plan is not None and previous_plan.type == PCQ:
+                await client.remove_from_address_lists(pcq_lists, device.ip)
+            
+            # Nombre de la queue
+            queue_name = f"QoS-{device.hostname or device.mac}"
+            
+            target = f"{device.ip}/32"
+            
+            # Verificar si ya existe una queue para este dispositivo (índice exacto por target)
+            queue_id = await client.find_simple_queue(device.ip)
+            
+            # max-limit (subida/bajada), burst y prioridad del plan
+            limits = {key.replace("-", "_"): value for key, value in queue_limits(plan).items()}
+            
+            if queue_id:
+                # Actualizar queue existente
+                await client.update_simple_queue(
+                    queue_id=queue_id,
+                    comment=comment,
+                    **limits
+                )
+                action = "actualizada"
+            else:
+                # Crear nueva queue
+                result = await client.add_simple_queue(
+                    name=queue_name,
+                    target=target,
+                    comment=comment,
+                    **limits
+                )
+                queue_id = result[0].get("ret") if result else None
+                action = "creada"
         
         # Registrar asignaciÃ³n en BD
-        existing_assignment = db.query(PlanAssignment).filter(
-            PlanAssignment.device_id == device.id
-        ).first()
-        
         if existing_assignment:
             existing_assignment.plan_id = plan.id
+            existing_assignment.router_id = device.router_id
+            existing_assignment.queue_mikrotik_id = queue_id
+            existing_assignment.target = target
         else:
             assignment_record = PlanAssignment(
                 device_id=device.id,
-                plan_id=plan.id
+                plan_id=plan.id,
+                router_id=device.router_id,
+                queue_mikrotik_id=queue_id,
+                target=target,
+                assigned_by_user_id=current_user.get("user_id")
             )
             db.add(assignment_record)
         
-        device.current_plan_id = plan.id
         db.commit()
         
         logger.info(
@@ -255,17 +298,23 @@ async def assign_plan_to_device(
             device_id=device.id,
             plan_id=plan.id,
             action=action,
-            user=current_user["username"]
+            user=current_user.get("sub")
         )
         
         return {
-            "message": f"Plan asignado y queue {action} exitosamente",
+            "message": (
+                "Plan asignado exitosamente (PCQ por address-list)" if plan.type == PCQ
+                else f"Plan asignado y queue {action} exitosamente"
+            ),
+            "plan_type": plan.type,
             "device": device.hostname or device.mac,
             "plan": plan.name,
             "download_limit": plan.download_limit,
             "upload_limit": plan.upload_limit
         }
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("assign_plan_failed", error=str(e))
         raise HTTPException(
@@ -274,6 +323,73 @@ async def assign_plan_to_device(
         )
 
 
+@router.post("/assign-plan/bulk", response_model=PlanJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def bulk_assign_plan(
+    request: BulkAssignPlanRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """Asignar un plan a muchos dispositivos en segundo plano
+
+    La selección se resuelve al crear el trabajo; el progreso se consulta en
+    GET /qos/assign-plan/jobs/{job_id}.
+    """
+    if not (request.device_ids or request.router_id is not None or request.subnet):
+        raise HTTPException(status_code=400, detail="Indique device_ids, router_id o subnet")
+    
+    plan = db.query(Plan).filter(Plan.id == request.plan_id).first()
+    if not plan:
+        raise HTTPException(status_code=404, detail="Plan no encontrado")
+    
+    try:
+        devices = select_devices(db, request.device_ids, request.router_id, request.subnet)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Subred inválida")
+    if not devices:
+        raise HTTPException(status_code=400, detail="Ningún dispositivo coincide con la selección")
+    
+    with_ip = [d.id for d in devices if d.ip]
+    job = create_job(
+        db, plan.id, with_ip,
+        selection=request.model_dump(exclude_none=True, exclude={"plan_id"}),
+        skipped=len(devices) - len(with_ip),
+        current_user=current_user
+    )
+    
+    logger.info(
+        "plan_bulk_assignment_started",
+        job_id=job.id,
+        plan_id=plan.id,
+        devices=job.total,
+        skipped=job.skipped,
+        user=current_user.get("sub")
+    )
+    return job
+
+
+@router.get("/assign-plan/jobs", response_model=List[PlanJobResponse])
+async def list_plan_jobs(
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """Listar trabajos de asignación masiva, los más recientes primero"""
+    return db.query(PlanAssignmentJob).order_by(PlanAssignmentJob.id.desc()).limit(min(limit, 500)).all()
+
+
+@router.get("/assign-plan/jobs/{job_id}", response_model=PlanJobResponse)
+async def get_plan_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """Progreso de un trabajo de asignación masiva"""
+    job = db.query(PlanAssignmentJob).filter(PlanAssignmentJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
 @router.delete("/unassign-plan/{device_id}")
 async def unassign_plan_from_device(
     device_id: int,
@@ -286,38 +402,34 @@ async def unassign_plan_from_device(
     if not device:
         raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
     
-    if remove_queue:
+    assignment = db.query(PlanAssignment).filter(
+        PlanAssignment.device_id == device_id
+    ).first()
+    
+    if remove_queue and device.ip:
         router_obj = db.query(Router).filter(Router.id == device.router_id).first()
         if router_obj:
             try:
-                client = MikroTikClient(
-                    host=router_obj.host,
-                    username=router_obj.username,
-                    password=router_obj.password,
-                    api_port=router_obj.api_port,
-                    ssh_port=router_obj.ssh_port,
-                    use_ssl=router_obj.use_ssl
-                )
+                client = MikroTikClient.from_router(router_obj)
                 
-                # Buscar y eliminar queue
-                queues = await client.get_simple_queues()
-                for q in queues:
-                    if device.ip in q.get("target", ""):
-                        await client.remove_simple_queue(q[".id"])
-                        break
+                if assignment and assignment.plan and assignment.plan.type == PCQ:
+                    # Plan PCQ: basta con sacar la IP de las listas de planes
+                    pcq_lists = [plan_list_name(plan_id) for (plan_id,) in db.query(Plan.id).filter(Plan.type == PCQ)]
+                    await client.remove_from_address_lists(pcq_lists, device.ip)
+                else:
+                    # Buscar y eliminar queue
+                    queue_id = await client.find_simple_queue(device.ip)
+                    if queue_id:
+                        await client.remove_simple_queue(queue_id)
             except Exception as e:
                 logger.warning("queue_removal_failed", device_id=device_id, error=str(e))
     
     # Eliminar asignaciÃ³n de BD
-    assignment = db.query(PlanAssignment).filter(
-        PlanAssignment.device_id == device_id
-    ).first()
     if assignment:
         db.delete(assignment)
     
-    device.current_plan_id = None
     db.commit()
     
-    logger.info("plan_unassigned", device_id=device_id, user=current_user["username"])
+    logger.info("plan_unassigned", device_id=device_id, user=current_user.get("sub"))
     
     return {"message": "Plan desasignado exitosamente"}
@@ -1,18 +1,52 @@
 """Rutas para gestión de routers MikroTik"""
-from fastapi import APIRouter, Depends, HTTPException, status
+import ipaddress
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Response, status
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
 from app.db.database import get_db
 from app.db.models import Router
 from app.core.security import require_admin, require_admin_or_operator, get_current_user_payload
 from app.mikrotik.client import MikroTikClient
+from app.mikrotik.pool import pool_registry
+from app.mikrotik.breaker import breaker_registry
+from app.mikrotik.ssh_pool import ssh_registry
+from app.mikrotik.mirror import mirror_registry
+from app.mikrotik.cache import read_cache
+from app.mikrotik.health import health_prober
+from app.mikrotik.latency import latency_registry
+from app.mikrotik.queue_index import queue_index_registry
+from app.mikrotik.pcq import pcq_registry
+from app.mikrotik.scheduler import BULK, scheduler_registry
+from app.mikrotik.outbox import DONE, FAILED, enqueue, outbox_worker, register_handler, wait_for_mutation
+from app.mikrotik.reconcile import ReconcileRefused, reconcile_router
+from app.core.deadline import DeadlineExceeded, remaining
 from app.core.logging import get_logger
+from app.core.config import MANAGED_LISTS, settings
 from datetime import datetime
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/routers", tags=["Routers"])
 
+# Columnas que se piden al router (.proplist)
+SYSTEM_RESOURCE_FIELDS = ("version", "board-name", "uptime", "cpu-load", "free-memory", "total-memory")
+LEASE_SYNC_FIELDS = ("mac-address", "active-mac-address", "address", "active-address", "host-name", "status", "server")
+ADDRESS_LIST_FIELDS = ("address",)
+MAX_BULK_ITEMS = 5000
+# Valores que llegan al router (por API o como texto CLI en el fallback SSH)
+LIST_NAME_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+MAX_COMMENT_LENGTH = 255
+
+
+def validate_address(value: str) -> str:
+    """IP o red (CIDR) válida; cualquier otra cosa se rechaza antes de llegar al router"""
+    value = value.strip()
+    try:
+        ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        raise ValueError(f"Dirección IP o red inválida: {value!r}")
+    return value
+
 
 class RouterResponse(BaseModel):
     id: int
@@ -28,6 +62,8 @@ class RouterResponse(BaseModel):
     description: Optional[str] = None
     last_seen: Optional[datetime] = None
     created_at: datetime
+    latency_ms: Optional[float] = None  # Último sondeo de salud en segundo plano
+    probe_method: Optional[str] = None  # API o SSH
 
     class Config:
         from_attributes = True
@@ -59,9 +95,17 @@ async def list_routers(
     db: Session = Depends(get_db),
     payload: dict = Depends(require_admin_or_operator)
 ):
-    """Lista todos los routers configurados"""
+    """Lista todos los routers configurados (con la salud del último sondeo)"""
     routers = db.query(Router).all()
-    return routers
+    result = []
+    for router_obj in routers:
+        item = RouterResponse.model_validate(router_obj)
+        health = health_prober.get(router_obj.id)
+        if health is not None:
+            item.latency_ms = health.latency_ms
+            item.probe_method = health.method
+        result.append(item)
+    return result
 
 
 @router.post("", response_model=RouterResponse, status_code=status.HTTP_201_CREATED)
@@ -125,6 +169,30 @@ async def get_router(
     return router_obj
 
 
+@router.get("/{router_id}/metrics")
+async def get_router_metrics(
+    router_id: int,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(require_admin)
+):
+    """Métricas en memoria del router: cola del planificador, pool, breaker y latencias"""
+    router_obj = db.query(Router).filter(Router.id == router_id).first()
+    
+    if not router_obj:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Router no encontrado"
+        )
+    
+    return {
+        "router_id": router_id,
+        "scheduler": scheduler_registry.get(router_id).stats(),
+        "pool": pool_registry.stats().get(router_id),
+        "circuit_breaker": breaker_registry.stats().get(router_id),
+        "latency": latency_registry.stats(router_id),
+    }
+
+
 @router.post("/{router_id}/test", response_model=TestConnectionResponse)
 async def test_router_connection(
     router_id: int,
@@ -144,18 +212,9 @@ async def test_router_connection(
     
     try:
         # Crear cliente MikroTik
-        with MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl,
-            ssl_verify=router_obj.ssl_verify,
-            timeout=router_obj.timeout
-        ) as client:
+        async with MikroTikClient.from_router(router_obj) as client:
             # Obtener información del sistema
-            system_info = client.get_system_resource()
+            system_info = await client.get_system_resource(SYSTEM_RESOURCE_FIELDS)
             
             # Actualizar last_seen en DB
             router_obj.last_seen = datetime.utcnow()
@@ -180,6 +239,8 @@ async def test_router_connection(
                 message=f"Conexión exitosa vía {client.method_used}"
             )
     
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("router_test_failed", router_id=router_id, error=str(e))
         
@@ -211,17 +272,8 @@ async def get_router_address_lists(
         )
     
     try:
-        with MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl,
-            ssl_verify=router_obj.ssl_verify,
-            timeout=router_obj.timeout
-        ) as client:
-            entries = client.get_address_list(list_name)
+        async with MikroTikClient.from_router(router_obj) as client:
+            entries = await client.get_address_list(list_name)
             
             return {
                 "success": True,
@@ -230,6 +282,8 @@ async def get_router_address_lists(
                 "entries": entries
             }
     
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("get_address_lists_failed", router_id=router_id, error=str(e))
         raise HTTPException(
@@ -256,17 +310,8 @@ async def get_router_dhcp_leases(
         )
     
     try:
-        with MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl,
-            ssl_verify=router_obj.ssl_verify,
-            timeout=router_obj.timeout
-        ) as client:
-            leases = client.get_dhcp_leases(status_filter)
+        async with MikroTikClient.from_router(router_obj) as client:
+            leases = await client.get_dhcp_leases(status_filter)
             
             return {
                 "success": True,
@@ -275,6 +320,8 @@ async def get_router_dhcp_leases(
                 "leases": leases
             }
     
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("get_dhcp_leases_failed", router_id=router_id, error=str(e))
         raise HTTPException(
@@ -302,17 +349,8 @@ async def sync_dhcp_leases(
         )
     
     try:
-        with MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl,
-            ssl_verify=router_obj.ssl_verify,
-            timeout=router_obj.timeout
-        ) as client:
-            leases = client.get_dhcp_leases()
+        async with MikroTikClient.from_router(router_obj, priority=BULK) as client:
+            leases = await client.get_dhcp_leases(fields=LEASE_SYNC_FIELDS)
             
             devices_created = 0
             devices_updated = 0
@@ -372,6 +410,8 @@ async def sync_dhcp_leases(
                 "total_leases": len(leases)
             }
     
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("dhcp_sync_failed", router_id=router_id, error=str(e))
         raise HTTPException(
@@ -380,16 +420,201 @@ async def sync_dhcp_leases(
         )
 
 
+def _record_address_list_entries(db: Session, router_id: int, items: List[dict]):
+    """Registra en DB entradas que quedaron en el router (la reconciliación las toma como deseadas)
+
+    items: dicts con list, address y opcionalmente comment e id (*ID en el router).
+    """
+    from app.db.models import AddressListEntry as AddressListModel
+
+    if not items:
+        return
+    existing = {
+        (entry.list_name, entry.address): entry
+        for entry in db.query(AddressListModel).filter(
+            AddressListModel.router_id == router_id,
+            AddressListModel.list_name.in_({item["list"] for item in items})
+        )
+    }
+    now = datetime.utcnow()
+    for item in items:
+        key = (item["list"], item["address"])
+        entry = existing.get(key)
+        if entry is None:
+            entry = existing[key] = AddressListModel(router_id=router_id, list_name=key[0], address=key[1])
+            db.add(entry)
+        if item.get("comment") is not None:
+            entry.comment = item["comment"]
+        if item.get("id"):
+            entry.mikrotik_id = item["id"]
+        entry.synced_at = now
+
+
+def _forget_address_list_entry(db: Session, router_id: int, list_name: str, address: str):
+    """Quita de DB una entrada eliminada del router"""
+    from app.db.models import AddressListEntry as AddressListModel
+
+    db.query(AddressListModel).filter(
+        AddressListModel.router_id == router_id,
+        AddressListModel.list_name == list_name,
+        AddressListModel.address == address
+    ).delete(synchronize_session=False)
+
+
+class AddressListBulkItem(BaseModel):
+    list_name: str = Field(pattern=LIST_NAME_PATTERN)
+    address: str
+    comment: Optional[str] = Field(None, max_length=MAX_COMMENT_LENGTH)
+
+    @field_validator("address")
+    @classmethod
+    def check_address(cls, value: str) -> str:
+        return validate_address(value)
+
+
+class AddressListBulkRequest(BaseModel):
+    add: List[AddressListBulkItem] = []
+    remove: List[AddressListBulkItem] = []
+
+
+@router.post("/{router_id}/address-lists/bulk")
+async def bulk_address_list_changes(
+    router_id: int,
+    request: AddressListBulkRequest,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(require_admin_or_operator)
+):
+    """Agrega y elimina muchas direcciones de address-lists en un solo lote
+
+    Una lectura de las listas implicadas y las escrituras en pipeline;
+    devuelve el resultado de cada elemento.
+    """
+    router_obj = db.query(Router).filter(Router.id == router_id).first()
+
+    if not router_obj:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Router no encontrado"
+        )
+
+    if len(request.add) + len(request.remove) > MAX_BULK_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo {MAX_BULK_ITEMS} elementos por lote"
+        )
+
+    additions = [
+        {"list": item.list_name, "address": item.address, "comment": item.comment}
+        for item in request.add
+    ]
+    removals = [{"list": item.list_name, "address": item.address} for item in request.remove]
+
+    try:
+        async with MikroTikClient.from_router(router_obj, priority=BULK) as client:
+            results = await client.apply_address_list_changes(additions, removals)
+
+            # Reflejar en DB lo que quedó en el router (ya existente incluido)
+            for result in results:
+                if result["action"] == "remove" and result["status"] in ("removed", "not_found"):
+                    _forget_address_list_entry(db, router_id, result["list"], result["address"])
+            comments = {(item["list"], item["address"]): item["comment"] for item in additions}
+            _record_address_list_entries(db, router_id, [
+                {**result, "comment": comments.get((result["list"], result["address"]))}
+                for result in results
+                if result["action"] == "add" and result["status"] in ("added", "already_exists")
+            ])
+            db.commit()
+
+            summary = {}
+            for result in results:
+                summary[result["status"]] = summary.get(result["status"], 0) + 1
+
+            logger.info("address_list_bulk_completed",
+                       router_id=router_id,
+                       additions=len(additions),
+                       removals=len(removals),
+                       summary=summary,
+                       user=payload.get("sub", "unknown"))
+
+            return {
+                "success": summary.get("error", 0) == 0,
+                "method_used": client.method_used,
+                "summary": summary,
+                "results": results
+            }
+
+    except DeadlineExceeded:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error("address_list_bulk_failed", router_id=router_id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Error aplicando lote de address-list: {str(e)}"
+        )
+
+
+@router.post("/{router_id}/address-lists/reconcile")
+async def reconcile_address_lists(
+    router_id: int,
+    dry_run: bool = Query(True, description="Solo calcular y devolver el diff"),
+    force: bool = Query(False, description="Aplicar aunque supere la proporción máxima de bajas"),
+    db: Session = Depends(get_db),
+    payload: dict = Depends(require_admin)
+):
+    """Alinea las listas de control de internet del router con la DB
+
+    Calcula el diff mínimo (altas y bajas) entre las entradas de la DB y las
+    del router; por defecto solo lo devuelve. Con dry_run=false aplica solo
+    eso en lotes, salvo que vaciaría las listas o eliminaría más de
+    MT_RECONCILE_MAX_REMOVE_RATIO de las entradas (409; force omite el límite
+    de proporción).
+    """
+    router_obj = db.query(Router).filter(Router.id == router_id).first()
+
+    if not router_obj:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Router no encontrado"
+        )
+
+    try:
+        report = await reconcile_router(router_obj, MANAGED_LISTS, dry_run=dry_run, force=force)
+    except ReconcileRefused as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error("address_list_reconcile_failed", router_id=router_id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Error reconciliando address-lists: {str(e)}"
+        )
+
+    logger.info("address_list_reconcile_requested",
+               router_id=router_id,
+               dry_run=dry_run,
+               force=force,
+               user=payload.get("sub", "unknown"))
+    return {"success": not report["errors"], **report}
+
+
 class AddressListEntry(BaseModel):
     address: str
-    comment: Optional[str] = None
+    comment: Optional[str] = Field(None, max_length=MAX_COMMENT_LENGTH)
+
+    @field_validator("address")
+    @classmethod
+    def check_address(cls, value: str) -> str:
+        return validate_address(value)
 
 
 @router.post("/{router_id}/address-lists/{list_name}")
 async def add_to_address_list(
     router_id: int,
-    list_name: str,
     entry: AddressListEntry,
+    list_name: str = Path(pattern=LIST_NAME_PATTERN),
     db: Session = Depends(get_db),
     payload: dict = Depends(require_admin)
 ):
@@ -404,17 +629,14 @@ async def add_to_address_list(
         )
     
     try:
-        with MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl,
-            ssl_verify=router_obj.ssl_verify,
-            timeout=router_obj.timeout
-        ) as client:
-            result = client.add_to_address_list(list_name, entry.address, entry.comment)
+        async with MikroTikClient.from_router(router_obj) as client:
+            result = await client.add_to_address_list(list_name, entry.address, entry.comment)
+            
+            mikrotik_id = result[0].get("ret") if isinstance(result, list) and result else None
+            _record_address_list_entries(db, router_id, [
+                {"list": list_name, "address": entry.address, "comment": entry.comment, "id": mikrotik_id}
+            ])
+            db.commit()
             
             logger.info("address_added", 
                        router_id=router_id, 
@@ -428,6 +650,8 @@ async def add_to_address_list(
                 "data": result
             }
     
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("add_to_address_list_failed", 
                     router_id=router_id, 
@@ -442,13 +666,18 @@ async def add_to_address_list(
 @router.delete("/{router_id}/address-lists/{list_name}/{address}")
 async def remove_from_address_list(
     router_id: int,
-    list_name: str,
     address: str,
+    list_name: str = Path(pattern=LIST_NAME_PATTERN),
     db: Session = Depends(get_db),
     payload: dict = Depends(require_admin)
 ):
     """Elimina una dirección de una address-list"""
     
+    try:
+        address = validate_address(address)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
     router_obj = db.query(Router).filter(Router.id == router_id).first()
     
     if not router_obj:
@@ -458,17 +687,11 @@ async def remove_from_address_list(
         )
     
     try:
-        with MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl,
-            ssl_verify=router_obj.ssl_verify,
-            timeout=router_obj.timeout
-        ) as client:
-            result = client.remove_from_address_list(list_name, address)
+        async with MikroTikClient.from_router(router_obj) as client:
+            result = await client.remove_from_address_list(list_name, address)
+            
+            _forget_address_list_entry(db, router_id, list_name, address)
+            db.commit()
             
             logger.info("address_removed", 
                        router_id=router_id, 
@@ -482,6 +705,8 @@ async def remove_from_address_list(
                 "data": result
             }
     
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error("remove_from_address_list_failed", 
                     router_id=router_id, 
@@ -496,20 +721,91 @@ async def remove_from_address_list(
 class ToggleInternetRequest(BaseModel):
     ip_address: str
     enable: bool
-    comment: Optional[str] = None
+    comment: Optional[str] = Field(None, max_length=MAX_COMMENT_LENGTH)
     list_type: Optional[str] = "permitted"  # permitted | limited
 
+    @field_validator("ip_address")
+    @classmethod
+    def check_ip_address(cls, value: str) -> str:
+        return validate_address(value)
+
+
+ADDRESS_LIST_MOVE = "address_list_move"
+
 
-@router.post("/{router_id}/toggle-internet")
+async def _apply_address_list_move(client: MikroTikClient, data: dict) -> dict:
+    """Deja la IP solo en la lista objetivo (idempotente: reintentar no duplica)"""
+    # Una lectura y, juntos en pipeline, el remove de las demás listas
+    # (y duplicados) más el add en la lista objetivo
+    return await client.move_to_address_list(
+        data["ip_address"], data["list_name"], MANAGED_LISTS, data.get("comment")
+    )
+
+
+def _commit_address_list_move(db: Session, router_id: int, data: dict, result: dict):
+    """Refleja en DB: solo queda la entrada de la lista objetivo"""
+    from app.db.models import AddressListEntry as AddressListModel
+
+    deleted_count = db.query(AddressListModel).filter(
+        AddressListModel.router_id == router_id,
+        AddressListModel.list_name.in_(MANAGED_LISTS),
+        AddressListModel.address == data["ip_address"]
+    ).delete(synchronize_session=False)
+    db.add(AddressListModel(
+        router_id=router_id,
+        list_name=data["list_name"],
+        address=data["ip_address"],
+        mikrotik_id=result.get("id"),
+        comment=data.get("comment"),
+        synced_at=datetime.utcnow()
+    ))
+    removed_counts = {name: n for name, n in result["removed"].items() if name != data["list_name"]}
+    logger.info(
+        "cleanup_complete",
+        ip=data["ip_address"],
+        removed_from=list(removed_counts),
+        removed_counts=removed_counts,
+        db_deleted=deleted_count
+    )
+
+
+register_handler(ADDRESS_LIST_MOVE, _apply_address_list_move, _commit_address_list_move)
+
+
+class RouterMutationResponse(BaseModel):
+    id: int
+    router_id: int
+    kind: str
+    payload: dict
+    status: str  # pending | in_progress | done | failed | superseded
+    attempts: int
+    next_attempt_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    result: Optional[dict] = None
+    created_by: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+@router.post("/{router_id}/toggle-internet", status_code=status.HTTP_202_ACCEPTED)
 async def toggle_device_internet(
     router_id: int,
     request: ToggleInternetRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=100),
     db: Session = Depends(get_db),
     payload: dict = Depends(require_admin_or_operator)
 ):
-    """Habilita o deshabilita el internet de un dispositivo"""
-    from app.db.models import AddressListEntry as AddressListModel
-    
+    """Habilita o deshabilita el internet de un dispositivo
+
+    El cambio queda registrado en el outbox y el endpoint espera hasta
+    MT_OUTBOX_SYNC_WAIT_SECONDS a que se aplique: 200 si se aplicó, 503 si el
+    router lo rechazó o se agotaron los reintentos. Si aún no terminó responde
+    202 y sigue en segundo plano (con reintentos); mutation_id permite seguirlo.
+    """
     router_obj = db.query(Router).filter(Router.id == router_id).first()
     
     if not router_obj:
@@ -518,197 +814,108 @@ async def toggle_device_internet(
             detail="Router no encontrado"
         )
     
-    try:
-        with MikroTikClient(
-            host=router_obj.host,
-            username=router_obj.username,
-            password=router_obj.password,
-            api_port=router_obj.api_port,
-            ssh_port=router_obj.ssh_port,
-            use_ssl=router_obj.use_ssl,
-            ssl_verify=router_obj.ssl_verify,
-            timeout=router_obj.timeout
-        ) as client:
-            comment = request.comment or f"SmartBJ Portal - {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}"
-            list_type = (request.list_type or "permitted").lower()
-            target_list = "INET_LIMITADO" if list_type == "limited" else "INET_PERMITIDO"
-            
-            if request.enable:
-                # PERMITIR/LIMITAR: Eliminar de TODAS las listas y agregar solo a la objetivo
-                removed_from = []
-                removed_counts = {}
-                
-                logger.info("allowing_device", ip=request.ip_address, target_list=target_list)
-                
-                # PASO 1: Eliminar COMPLETAMENTE de INET_BLOQUEADO y la otra lista permitida
-                lists_to_clean = ["INET_BLOQUEADO"]
-                # Si vamos a INET_PERMITIDO, limpiar INET_LIMITADO y viceversa
-                if target_list == "INET_PERMITIDO":
-                    lists_to_clean.append("INET_LIMITADO")
-                else:
-                    lists_to_clean.append("INET_PERMITIDO")
-                
-                for list_to_clean in lists_to_clean:
-                    try:
-                        count = client.remove_from_address_list(list_to_clean, request.ip_address)
-                        if count > 0:
-                            removed_from.append(list_to_clean)
-                            removed_counts[list_to_clean] = count
-                            logger.info(f"ELIMINADAS {count} entradas de {list_to_clean} para {request.ip_address}")
-                    except Exception as e:
-                        logger.warning(f"Error al eliminar de {list_to_clean}: {e}")
-                
-                # PASO 2: Verificar que NO esté en las listas bloqueadas/opuestas
-                try:
-                    verificacion_bloqueado = client.get_address_list("INET_BLOQUEADO")
-                    still_in_bloqueado = any(e.get("address") == request.ip_address for e in verificacion_bloqueado)
-                    
-                    if still_in_bloqueado:
-                        logger.error(f"ADVERTENCIA: {request.ip_address} AUN esta en INET_BLOQUEADO despues de eliminar!")
-                except Exception as e:
-                    logger.warning(f"Error verificando limpieza: {e}")
-                
-                # PASO 3: Eliminar duplicados de la lista objetivo si existen
-                try:
-                    count_target = client.remove_from_address_list(target_list, request.ip_address)
-                    if count_target > 0:
-                        logger.info(f"Limpiados {count_target} duplicados de {target_list}")
-                except Exception as e:
-                    logger.warning(f"Error limpiando duplicados de {target_list}: {e}")
-                
-                # PASO 4: Eliminar de DB
-                deleted_count = db.query(AddressListModel).filter(
-                    AddressListModel.router_id == router_id,
-                    AddressListModel.list_name.in_(["INET_BLOQUEADO", "INET_PERMITIDO", "INET_LIMITADO"]),
-                    AddressListModel.address == request.ip_address
-                ).delete()
-                
-                logger.info(
-                    "cleanup_complete",
-                    ip=request.ip_address,
-                    removed_from=removed_from,
-                    removed_counts=removed_counts,
-                    db_deleted=deleted_count
-                )
-                
-                # PASO 5: Agregar SOLO a lista objetivo
-                logger.info(f"Agregando {request.ip_address} a {target_list}")
-                result = client.add_to_address_list(target_list, request.ip_address, comment)
-                
-                # PASO 6: Guardar en DB
-                entry = AddressListModel(
-                    router_id=router_id,
-                    list_name=target_list,
-                    address=request.ip_address,
-                    comment=comment,
-                    synced_at=datetime.utcnow()
-                )
-                db.add(entry)
-                action = "permitido" if target_list == "INET_PERMITIDO" else "limitado"
-                
-                logger.info("device_allowed_successfully", ip=request.ip_address, list=target_list)
-            else:
-                # BLOQUEAR: Eliminar de TODAS las listas y agregar solo a bloqueados
-                removed_from = []
-                removed_counts = {}
-                
-                logger.info("blocking_device", ip=request.ip_address)
-                
-                # PASO 1: Eliminar COMPLETAMENTE de INET_PERMITIDO e INET_LIMITADO
-                for list_to_clean in ["INET_PERMITIDO", "INET_LIMITADO"]:
-                    try:
-                        count = client.remove_from_address_list(list_to_clean, request.ip_address)
-                        if count > 0:
-                            removed_from.append(list_to_clean)
-                            removed_counts[list_to_clean] = count
-                            logger.info(f"ELIMINADAS {count} entradas de {list_to_clean} para {request.ip_address}")
-                    except Exception as e:
-                        logger.warning(f"Error al eliminar de {list_to_clean}: {e}")
-                
-                # PASO 2: Verificar que NO esté en INET_PERMITIDO ni INET_LIMITADO
-                try:
-                    verificacion_permitido = client.get_address_list("INET_PERMITIDO")
-                    verificacion_limitado = client.get_address_list("INET_LIMITADO")
-                    
-                    still_in_permitido = any(e.get("address") == request.ip_address for e in verificacion_permitido)
-                    still_in_limitado = any(e.get("address") == request.ip_address for e in verificacion_limitado)
-                    
-                    if still_in_permitido or still_in_limitado:
-                        logger.error(f"ADVERTENCIA: {request.ip_address} AUN esta en listas permitidas despues de eliminar!")
-                        if still_in_permitido:
-                            logger.error(f"  - Aun en INET_PERMITIDO")
-                        if still_in_limitado:
-                            logger.error(f"  - Aun en INET_LIMITADO")
-                except Exception as e:
-                    logger.warning(f"Error verificando limpieza: {e}")
-                
-                # PASO 3: Eliminar duplicados de INET_BLOQUEADO si existen
-                try:
-                    count_bloqueado = client.remove_from_address_list("INET_BLOQUEADO", request.ip_address)
-                    if count_bloqueado > 0:
-                        logger.info(f"Limpiados {count_bloqueado} duplicados de INET_BLOQUEADO")
-                except Exception as e:
-                    logger.warning(f"Error limpiando duplicados de INET_BLOQUEADO: {e}")
-                
-                # PASO 4: Eliminar de DB
-                deleted_count = db.query(AddressListModel).filter(
-                    AddressListModel.router_id == router_id,
-                    AddressListModel.list_name.in_(["INET_PERMITIDO", "INET_LIMITADO", "INET_BLOQUEADO"]),
-                    AddressListModel.address == request.ip_address
-                ).delete()
-                
-                logger.info(
-                    "cleanup_complete",
-                    ip=request.ip_address,
-                    removed_from=removed_from,
-                    removed_counts=removed_counts,
-                    db_deleted=deleted_count
-                )
-                
-                # PASO 5: Agregar SOLO a bloqueados
-                logger.info(f"Agregando {request.ip_address} a INET_BLOQUEADO")
-                result = client.add_to_address_list("INET_BLOQUEADO", request.ip_address, comment)
-                
-                # PASO 6: Guardar en DB
-                entry = AddressListModel(
-                    router_id=router_id,
-                    list_name="INET_BLOQUEADO",
-                    address=request.ip_address,
-                    comment=comment,
-                    synced_at=datetime.utcnow()
-                )
-                db.add(entry)
-                action = "bloqueado"
-                
-                logger.info("device_blocked_successfully", ip=request.ip_address)
-            
-            db.commit()
-            
-            logger.info(
-                "internet_toggled",
-                router_id=router_id,
-                ip=request.ip_address,
-                action=action,
-                user=payload.get("sub", "unknown")
-            )
-            
-            return {
-                "success": True,
-                "method_used": client.method_used,
-                "action": action,
-                "ip_address": request.ip_address,
-                "message": f"Internet {action} para {request.ip_address}"
-            }
+    comment = request.comment or f"SmartBJ Portal - {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}"
+    list_type = (request.list_type or "permitted").lower()
+    target_list = "INET_LIMITADO" if list_type == "limited" else "INET_PERMITIDO"
+    
+    if request.enable:
+        action = "permitido" if target_list == "INET_PERMITIDO" else "limitado"
+    else:
+        target_list = "INET_BLOQUEADO"
+        action = "bloqueado"
+    
+    # Un bloqueo aún pendiente seguido de un desbloqueo de la misma IP se
+    # reemplaza: solo se aplica el último estado
+    mutation = enqueue(
+        db,
+        router_id,
+        ADDRESS_LIST_MOVE,
+        request.ip_address,
+        {"ip_address": request.ip_address, "list_name": target_list, "comment": comment},
+        idempotency_key=idempotency_key,
+        created_by=payload.get("sub")
+    )
+    outbox_worker.notify()
+    
+    logger.info(
+        "internet_toggle_queued",
+        router_id=router_id,
+        ip=request.ip_address,
+        action=action,
+        mutation_id=mutation.id,
+        user=payload.get("sub", "unknown")
+    )
     
-    except Exception as e:
-        logger.error("toggle_internet_failed", 
-                    router_id=router_id,
-                    ip=request.ip_address,
-                    error=str(e))
+    wait = settings.MT_OUTBOX_SYNC_WAIT_SECONDS
+    left = remaining()
+    if left is not None:
+        # Responder antes del deadline de la petición aunque no haya terminado
+        wait = min(wait, left - 1)
+    state = await wait_for_mutation(mutation.id, wait) if wait > 0 else None
+    mutation_status = state["status"] if state is not None else mutation.status
+    
+    if mutation_status == FAILED:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Error cambiando estado de internet: {str(e)}"
+            detail=f"Error aplicando el cambio: {state['last_error']}"
         )
+    if mutation_status == DONE:
+        response.status_code = status.HTTP_200_OK
+        message = f"Internet {action} para {request.ip_address}"
+    elif state is not None and state["last_error"]:
+        # Primer intento fallido: el worker lo reintenta con backoff
+        message = f"Internet {action} para {request.ip_address} (en cola, reintentando: {state['last_error']})"
+    else:
+        message = f"Internet {action} para {request.ip_address} (en cola)"
+    
+    return {
+        "success": True,
+        "method_used": "OUTBOX",
+        "action": action,
+        "ip_address": request.ip_address,
+        "mutation_id": mutation.id,
+        "status": mutation_status,
+        "message": message
+    }
+
+
+@router.get("/{router_id}/mutations", response_model=List[RouterMutationResponse])
+async def list_router_mutations(
+    router_id: int,
+    mutation_status: Optional[str] = Query(None, alias="status"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    payload: dict = Depends(require_admin_or_operator)
+):
+    """Cambios del outbox de un router, los más recientes primero"""
+    from app.db.models import RouterMutation
+
+    query = db.query(RouterMutation).filter(RouterMutation.router_id == router_id)
+    if mutation_status:
+        query = query.filter(RouterMutation.status == mutation_status)
+    return query.order_by(RouterMutation.id.desc()).limit(limit).all()
+
+
+@router.get("/{router_id}/mutations/{mutation_id}", response_model=RouterMutationResponse)
+async def get_router_mutation(
+    router_id: int,
+    mutation_id: int,
+    db: Session = Depends(get_db),
+    payload: dict = Depends(require_admin_or_operator)
+):
+    """Estado de un cambio del outbox"""
+    from app.db.models import RouterMutation
+
+    mutation = db.query(RouterMutation).filter(
+        RouterMutation.id == mutation_id,
+        RouterMutation.router_id == router_id
+    ).first()
+    if not mutation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Cambio no encontrado"
+        )
+    return mutation
 
 
 @router.delete("/{router_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -718,7 +925,7 @@ async def delete_router(
     payload: dict = Depends(require_admin)
 ):
     """Elimina un router y todos sus dispositivos asociados"""
-    from app.db.models import Device, AddressListEntry, PlanAssignment, StatsSnapshot
+    from app.db.models import Device, AddressListEntry, PlanAssignment, StatsSnapshot, RouterMutation
     
     # Obtener router
     router_obj = db.query(Router).filter(Router.id == router_id).first()
@@ -739,10 +946,25 @@ async def delete_router(
         # Eliminar snapshots de estadísticas
         db.query(StatsSnapshot).filter(StatsSnapshot.router_id == router_id).delete()
         
+        # Eliminar cambios del outbox (pendientes o históricos)
+        db.query(RouterMutation).filter(RouterMutation.router_id == router_id).delete()
+        
         # Eliminar el router
         db.delete(router_obj)
         db.commit()
         
+        # Cerrar conexiones API abiertas y olvidar el breaker del router eliminado
+        await pool_registry.invalidate(router_id)
+        await breaker_registry.invalidate(router_id)
+        await ssh_registry.invalidate(router_id)
+        await mirror_registry.invalidate(router_id)
+        read_cache.clear(router_id)
+        health_prober.forget(router_id)
+        latency_registry.invalidate(router_id)
+        queue_index_registry.invalidate(router_id)
+        pcq_registry.invalidate(router_id)
+        scheduler_registry.invalidate(router_id)
+        
         logger.info("router_deleted", 
                    router_id=router_id, 
                    router_name=router_obj.name,
@@ -1,4 +1,5 @@
 """Rutas para estadísticas del sistema"""
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func
@@ -6,13 +7,23 @@ from app.db.database import get_db
 from app.db.models import Device, Plan, PlanAssignment, Router, AddressListEntry
 from app.core.security import require_admin_or_operator
 from app.core.logging import get_logger
-from app.mikrotik.client import MikroTikClient
+from app.core.config import MANAGED_LISTS
+from app.mikrotik.client import ADDRESS_LIST_PATH
+from app.mikrotik.fanout import fan_out
 from typing import Dict, Any, List
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/stats", tags=["Statistics"])
 
 
+async def count_address_lists(client) -> Dict[str, int]:
+    """Totales de las listas de control de un router (count-only, sin filas, en paralelo)"""
+    counts = await asyncio.gather(
+        *(client.count(ADDRESS_LIST_PATH, {"list": list_name}) for list_name in MANAGED_LISTS)
+    )
+    return dict(zip(MANAGED_LISTS, counts))
+
+
 @router.get("/summary")
 async def get_stats_summary(
     db: Session = Depends(get_db),
@@ -29,29 +40,16 @@ async def get_stats_summary(
         # Count devices in permitted/blocked lists from MikroTik (fallback to DB)
         active_devices = 0
         blocked_devices = 0
+        routers_failed = []
         routers = db.query(Router).all()
         if routers:
-            for router_obj in routers:
-                try:
-                    with MikroTikClient(
-                        host=router_obj.host,
-                        username=router_obj.username,
-                        password=router_obj.password,
-                        api_port=router_obj.api_port,
-                        ssh_port=router_obj.ssh_port,
-                        use_ssl=router_obj.use_ssl,
-                        ssl_verify=router_obj.ssl_verify,
-                        timeout=router_obj.timeout
-                    ) as client:
-                        permitted_entries = client.get_address_list("INET_PERMITIDO")
-                        limited_entries = client.get_address_list("INET_LIMITADO")
-                        blocked_entries = client.get_address_list("INET_BLOQUEADO")
-
-                    active_devices += len([e for e in permitted_entries if e.get("address")])
-                    active_devices += len([e for e in limited_entries if e.get("address")])
-                    blocked_devices += len([e for e in blocked_entries if e.get("address")])
-                except Exception as e:
-                    logger.warning("stats_live_address_list_failed", router_id=router_obj.id, error=str(e))
+            # Todos los routers a la vez: la espera es la del más lento
+            for result in await fan_out(routers, count_address_lists):
+                if not result.ok:
+                    routers_failed.append(result.router_id)
+                    continue
+                active_devices += result.value["INET_PERMITIDO"] + result.value["INET_LIMITADO"]
+                blocked_devices += result.value["INET_BLOQUEADO"]
         else:
             # Fallback to DB if no routers configured
             active_devices = db.query(AddressListEntry).filter(
@@ -80,7 +78,10 @@ async def get_stats_summary(
             "total_routers": total_routers,
             "active_routers": active_routers,
             "active_plans": active_plans,
-            "total_assignments": total_assignments
+            "total_assignments": total_assignments,
+            # Routers que no respondieron: los totales en vivo son parciales
+            "partial": bool(routers_failed),
+            "routers_failed": routers_failed
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching statistics: {str(e)}")
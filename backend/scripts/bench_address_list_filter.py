@@ -0,0 +1,88 @@
+"""Benchmark: filtrado de address-list en Python vs consultas en el router
+
+Compara bytes recibidos y latencia de:
+  - descarga completa de /ip/firewall/address-list + filtro en Python (comportamiento anterior)
+  - consulta ?list=... (y ?address=...) evaluada por RouterOS
+
+Uso:
+    python -m scripts.bench_address_list_filter --list INET_BLOQUEADO --iterations 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from app.core.config import settings
+from app.mikrotik.api_client import MikroTikAPIClient
+
+
+async def measure(client: MikroTikAPIClient, iterations: int, fetch):
+    """Ejecuta fetch() N veces y devuelve (filas, bytes por llamada, latencias en ms)"""
+    latencies = []
+    rows = 0
+    start_bytes = client.connection.bytes_received
+    for _ in range(iterations):
+        start = time.perf_counter()
+        rows = len(await fetch())
+        latencies.append((time.perf_counter() - start) * 1000)
+    total_bytes = client.connection.bytes_received - start_bytes
+    return rows, total_bytes / iterations, latencies
+
+
+def report(name: str, rows: int, bytes_per_call: float, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{name:28s} filas={rows:6d}  bytes/llamada={bytes_per_call:12.0f}  "
+        f"p50={statistics.median(ordered):8.1f}ms  p95={p95:8.1f}ms"
+    )
+
+
+async def run(args):
+    client = MikroTikAPIClient(
+        host=args.host,
+        username=args.username,
+        password=args.password,
+        port=args.port,
+        use_ssl=settings.MT_USE_SSL,
+        ssl_verify=settings.MT_SSL_VERIFY,
+        timeout=args.timeout
+    )
+    async with client:
+        async def legacy_list():
+            entries = await client.execute("/ip/firewall/address-list", "get")
+            return [e for e in entries if e.get("list") == args.list]
+
+        async def legacy_address():
+            entries = await legacy_list()
+            return [e for e in entries if e.get("address") == args.address]
+
+        print(f"Router {args.host}:{args.port} - lista {args.list} - {args.iterations} iteraciones\n")
+        full = await measure(client, args.iterations, legacy_list)
+        filtered = await measure(client, args.iterations, lambda: client.get_address_list(args.list))
+        report("lista: filtro en Python", *full)
+        report("lista: ?list=", *filtered)
+
+        if args.address:
+            full = await measure(client, args.iterations, legacy_address)
+            filtered = await measure(
+                client, args.iterations, lambda: client.get_address_list(args.list, args.address)
+            )
+            report("ip: filtro en Python", *full)
+            report("ip: ?list= ?address=", *filtered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.MT_HOST)
+    parser.add_argument("--port", type=int, default=settings.MT_PORT)
+    parser.add_argument("--username", default=settings.MT_USER)
+    parser.add_argument("--password", default=settings.MT_PASS)
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--list", default=settings.LIST_BLOQUEADO)
+    parser.add_argument("--address", default=None, help="IP a buscar además de la lista")
+    parser.add_argument("--iterations", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Benchmark: memoria y throughput de registros tipados vs dicts de RouterOS
+
+Genera filas sintéticas con la forma que devuelve la API (dicts de str) y
+compara, para leases, address-lists y simple queues:
+  - memoria retenida por la lista de filas (tracemalloc)
+  - tiempo de conversión dict → registro
+  - tiempo de un recorrido típico (leer dirección, MAC y estado de cada fila)
+
+Uso:
+    python -m scripts.bench_records --rows 20000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from app.mikrotik.records import AddressListItem, DhcpLease, SimpleQueue
+
+
+def lease_rows(n: int):
+    for i in range(n):
+        yield {
+            ".id": f"*{i + 1:X}",
+            "address": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            "mac-address": f"AA:BB:CC:{(i >> 16) & 255:02X}:{(i >> 8) & 255:02X}:{i & 255:02X}",
+            "client-id": f"1:aa:bb:cc:{(i >> 16) & 255:02x}:{(i >> 8) & 255:02x}:{i & 255:02x}",
+            "host-name": f"host-{i}",
+            "server": "dhcp-lan",
+            "status": "bound" if i % 4 else "waiting",
+            "active-address": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            "active-mac-address": f"AA:BB:CC:{(i >> 16) & 255:02X}:{(i >> 8) & 255:02X}:{i & 255:02X}",
+            "active-server": "dhcp-lan",
+            "expires-after": "9m58s",
+            "last-seen": "2s",
+            "dynamic": "true",
+            "disabled": "false",
+        }
+
+
+def address_list_rows(n: int):
+    lists = ("INET_PERMITIDO", "INET_LIMITADO", "INET_BLOQUEADO")
+    for i in range(n):
+        yield {
+            ".id": f"*{i + 1:X}",
+            "list": lists[i % 3],
+            "address": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            "comment": f"device-{i}",
+            "creation-time": "jan/02/2024 10:00:00",
+            "dynamic": "false",
+            "disabled": "false",
+        }
+
+
+def queue_rows(n: int):
+    for i in range(n):
+        yield {
+            ".id": f"*{i + 1:X}",
+            "name": f"QoS-host-{i}",
+            "target": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}/32",
+            "parent": "none",
+            "queue": "default-small/default-small",
+            "priority": "8/8",
+            "max-limit": "5000000/10000000",
+            "limit-at": "0/0",
+            "burst-limit": "0/0",
+            "burst-threshold": "0/0",
+            "burst-time": "0s/0s",
+            "bytes": f"{i * 1500}/{i * 9000}",
+            "packets": f"{i}/{i * 6}",
+            "comment": "SmartBJPortal - Plan: Basico",
+            "dynamic": "false",
+            "disabled": "false",
+        }
+
+
+def retained(build):
+    """(objeto, bytes retenidos) de construir build()"""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+
+def timed(build):
+    start = time.perf_counter()
+    build()
+    return time.perf_counter() - start
+
+
+def scan(rows, keys):
+    start = time.perf_counter()
+    for row in rows:
+        for key in keys:
+            row.get(key)
+    return time.perf_counter() - start
+
+
+def bench(name: str, generator, record_cls, n: int, keys):
+    # Las filas de la API llegan como dicts nuevos (strings no compartidos)
+    dicts, dict_bytes = retained(lambda: list(generator(n)))
+    source = list(generator(n))
+    records, record_bytes = retained(lambda: record_cls.from_rows(source))
+    record_build = timed(lambda: record_cls.from_rows(source))
+    del source
+    attr_keys = [record_cls.SPEC[k][0] for k in keys]
+    start = time.perf_counter()
+    for record in records:
+        for attr in attr_keys:
+            getattr(record, attr)
+    attr_scan = time.perf_counter() - start
+
+    print(f"{name} ({n} filas)")
+    print(f"  memoria   dicts={dict_bytes / 1048576:7.2f} MiB  registros={record_bytes / 1048576:7.2f} MiB  "
+          f"({record_bytes / dict_bytes:5.1%})")
+    print(f"  conversión dict→registro {record_build * 1000:8.1f} ms ({n / record_build:,.0f} filas/s)")
+    print(f"  recorrido get() dicts={scan(dicts, keys) * 1000:7.1f} ms  registros={scan(records, keys) * 1000:7.1f} ms"
+          f"  atributos tipados={attr_scan * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    bench("leases", lease_rows, DhcpLease, args.rows, ("address", "mac-address", "status"))
+    bench("address-list", address_list_rows, AddressListItem, args.rows, ("list", "address"))
+    bench("simple queues", queue_rows, SimpleQueue, args.rows, ("target", "max-limit", "bytes"))
+
+
+if __name__ == "__main__":
+    main()
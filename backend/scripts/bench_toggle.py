@@ -0,0 +1,93 @@
+"""Benchmark: latencia del toggle de internet (secuencia anterior vs move_to_address_list)
+
+Alterna una IP entre INET_PERMITIDO e INET_BLOQUEADO y mide p50/p99 de:
+  - la secuencia anterior de toggle-internet: remove por lista (lectura +
+    remove), lecturas de verificación, limpieza de duplicados y add
+  - move_to_address_list: una lectura y remove + add en pipeline
+
+Uso:
+    python -m scripts.bench_toggle --address 10.255.255.254 --iterations 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from app.core.config import settings
+from app.mikrotik.api_client import MikroTikAPIClient
+
+MANAGED_LISTS = ("INET_PERMITIDO", "INET_LIMITADO", "INET_BLOQUEADO")
+COMMENT = "bench_toggle"
+
+
+async def legacy_toggle(client: MikroTikAPIClient, address: str, target_list: str):
+    """Pasos que hacía toggle-internet antes del move en una operación"""
+    for list_name in MANAGED_LISTS:
+        if list_name != target_list:
+            await client.remove_from_address_list_by_address(list_name, address)
+    for list_name in MANAGED_LISTS:
+        if list_name != target_list:
+            await client.get_address_list(list_name, address, fields=("address",))
+    await client.remove_from_address_list_by_address(target_list, address)
+    await client.add_to_address_list(target_list, address, COMMENT)
+
+
+async def move_toggle(client: MikroTikAPIClient, address: str, target_list: str):
+    await client.move_to_address_list(address, target_list, MANAGED_LISTS, COMMENT)
+
+
+async def measure(client: MikroTikAPIClient, address: str, iterations: int, toggle):
+    latencies = []
+    for i in range(iterations):
+        target_list = "INET_BLOQUEADO" if i % 2 else "INET_PERMITIDO"
+        start = time.perf_counter()
+        await toggle(client, address, target_list)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(ordered, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def report(name: str, latencies):
+    ordered = sorted(latencies)
+    print(
+        f"{name:24s} n={len(ordered):5d}  p50={statistics.median(ordered):8.1f}ms  "
+        f"p99={percentile(ordered, 0.99):8.1f}ms  max={ordered[-1]:8.1f}ms"
+    )
+
+
+async def run(args):
+    client = MikroTikAPIClient(
+        host=args.host,
+        username=args.username,
+        password=args.password,
+        port=args.port,
+        use_ssl=settings.MT_USE_SSL,
+        ssl_verify=settings.MT_SSL_VERIFY,
+        timeout=args.timeout
+    )
+    async with client:
+        print(f"Router {args.host}:{args.port} - IP {args.address} - {args.iterations} toggles\n")
+        try:
+            report("secuencia anterior", await measure(client, args.address, args.iterations, legacy_toggle))
+            report("move_to_address_list", await measure(client, args.address, args.iterations, move_toggle))
+        finally:
+            # No dejar la IP de prueba en ninguna lista
+            await client.remove_from_address_lists_by_address(MANAGED_LISTS, args.address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.MT_HOST)
+    parser.add_argument("--port", type=int, default=settings.MT_PORT)
+    parser.add_argument("--username", default=settings.MT_USER)
+    parser.add_argument("--password", default=settings.MT_PASS)
+    parser.add_argument("--timeout", type=int, default=30)
+    parser.add_argument("--address", required=True, help="IP de prueba (no usar la de un cliente real)")
+    parser.add_argument("--iterations", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 """Script de prueba para conectar al MikroTik"""
+import asyncio
 import sys
 sys.path.insert(0, 'C:\\SmartControl\\backend')
 
@@ -7,7 +8,7 @@ from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 
-def test_mikrotik():
+async def test_mikrotik():
     """Prueba conexión con MikroTik"""
     
     print("\n" + "="*60)
@@ -29,14 +30,14 @@ def test_mikrotik():
     print(f"Usuario: {config['username']}")
     
     try:
-        with MikroTikClient(**config) as client:
+        async with MikroTikClient(**config) as client:
             print(f"\n✓ Conexión exitosa vía {client.method_used}")
             
             # Test 1: System Resource
             print("\n" + "-"*60)
             print("TEST 1: Información del Sistema")
             print("-"*60)
-            system_info = client.get_system_resource()
+            system_info = await client.get_system_resource()
             print(f"Versión: {system_info.get('version', 'N/A')}")
             print(f"Board: {system_info.get('board-name', 'N/A')}")
             print(f"Uptime: {system_info.get('uptime', 'N/A')}")
@@ -48,7 +49,7 @@ def test_mikrotik():
             print("\n" + "-"*60)
             print("TEST 2: Address Lists (INET_PERMITIDO)")
             print("-"*60)
-            permitidos = client.get_address_list("INET_PERMITIDO")
+            permitidos = await client.get_address_list("INET_PERMITIDO")
             print(f"Total entradas PERMITIDO: {len(permitidos)}")
             for i, entry in enumerate(permitidos[:5], 1):
                 print(f"  {i}. {entry.get('address', 'N/A')} - {entry.get('comment', 'Sin comentario')}")
@@ -58,7 +59,7 @@ def test_mikrotik():
             print("\n" + "-"*60)
             print("TEST 3: Address Lists (INET_BLOQUEADO)")
             print("-"*60)
-            bloqueados = client.get_address_list("INET_BLOQUEADO")
+            bloqueados = await client.get_address_list("INET_BLOQUEADO")
             print(f"Total entradas BLOQUEADO: {len(bloqueados)}")
             for i, entry in enumerate(bloqueados[:5], 1):
                 print(f"  {i}. {entry.get('address', 'N/A')} - {entry.get('comment', 'Sin comentario')}")
@@ -69,7 +70,7 @@ def test_mikrotik():
             print("\n" + "-"*60)
             print("TEST 4: DHCP Leases (bound)")
             print("-"*60)
-            leases = client.get_dhcp_leases(status="bound")
+            leases = await client.get_dhcp_leases(status="bound")
             print(f"Total leases activos: {len(leases)}")
             for i, lease in enumerate(leases[:10], 1):
                 mac = lease.get('mac-address', 'N/A')
@@ -83,7 +84,7 @@ def test_mikrotik():
             print("\n" + "-"*60)
             print("TEST 5: Simple Queues")
             print("-"*60)
-            queues = client.get_simple_queues()
+            queues = await client.get_simple_queues()
             print(f"Total queues: {len(queues)}")
             for i, queue in enumerate(queues[:5], 1):
                 name = queue.get('name', 'N/A')
@@ -108,5 +109,5 @@ def test_mikrotik():
 
 
 if __name__ == "__main__":
-    success = test_mikrotik()
+    success = asyncio.run(test_mikrotik())
     sys.exit(0 if success else 1)
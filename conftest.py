@@ -0,0 +1,22 @@
+"""Configuración común de las pruebas unitarias del backend
+
+Las pruebas importan el paquete app de backend/ sin servidor ni routers
+reales; Settings exige SECRET_KEY, así que se dan valores de prueba si el
+entorno no los trae.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("SECRET_KEY", "pruebas-unitarias-" + "x" * 32)
+os.environ.setdefault("DEBUG", "false")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "smartcontrol-tests.log"))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "smartcontrol-tests.db"))
+
+# Script manual contra un router real (python backend/test_mikrotik_live.py)
+collect_ignore = ["backend/test_mikrotik_live.py"]
@@ -3,6 +3,29 @@ import { Smartphone, Shield, ShieldOff, RefreshCw, Search, Filter, LayoutGrid, L
 import api from '../services/api';
 import Modal from '../components/Modal';
 
+// El backend responde 202 si el cambio sigue en el outbox: se consulta hasta que termine
+const MUTATION_POLL_INTERVAL_MS = 1000;
+const MUTATION_POLL_MAX_ATTEMPTS = 30;
+const MUTATION_IN_FLIGHT = ['pending', 'in_progress'];
+
+async function toggleInternet(routerId, body) {
+  const response = await api.post(`/api/routers/${routerId}/toggle-internet`, body, { timeout: 30000 });
+  let mutation = response.data;
+  for (let attempt = 0; attempt < MUTATION_POLL_MAX_ATTEMPTS && MUTATION_IN_FLIGHT.includes(mutation.status); attempt++) {
+    await new Promise((resolve) => setTimeout(resolve, MUTATION_POLL_INTERVAL_MS));
+    const { data } = await api.get(`/api/routers/${routerId}/mutations/${response.data.mutation_id}`);
+    mutation = data;
+  }
+  if (mutation.status === 'failed') {
+    throw new Error(mutation.last_error || 'El router rechazó el cambio');
+  }
+  return mutation;
+}
+
+function isQueued(mutation) {
+  return MUTATION_IN_FLIGHT.includes(mutation.status);
+}
+
 export default function Devices() {
   const [devices, setDevices] = useState([]);
   const [routers, setRouters] = useState([]);
@@ -87,15 +110,14 @@ export default function Devices() {
       }
 
       // Bloquear: eliminar de permitidos/limitados y agregar a bloqueados
-      await api.post(
-        `/api/routers/${selectedRouter}/toggle-internet`,
-        {
-          ip_address: device.ip,
-          enable: false,
-          comment: `SmartControl Portal - Bloqueado - ${device.hostname || 'Dispositivo'}`
-        },
-        { timeout: 30000 }
-      );
+      const mutation = await toggleInternet(selectedRouter, {
+        ip_address: device.ip,
+        enable: false,
+        comment: `SmartControl Portal - Bloqueado - ${device.hostname || 'Dispositivo'}`
+      });
+      if (isQueued(mutation)) {
+        alert('El router aún no aplicó el cambio; queda en cola y se reintentará');
+      }
 
       // Actualizar lista de dispositivos
       await loadDevices();
@@ -109,16 +131,15 @@ export default function Devices() {
     setPlanActionError(null);
     setPlanActionLoading(true);
     try {
-      await api.post(
-        `/api/routers/${selectedRouter}/toggle-internet`,
-        {
-          ip_address: pendingDevice.ip,
-          enable: true,
-          list_type: listType,
-          comment: `SmartBJ Portal - ${pendingDevice.hostname || 'Dispositivo'}`
-        },
-        { timeout: 30000 }
-      );
+      const mutation = await toggleInternet(selectedRouter, {
+        ip_address: pendingDevice.ip,
+        enable: true,
+        list_type: listType,
+        comment: `SmartBJ Portal - ${pendingDevice.hostname || 'Dispositivo'}`
+      });
+      if (isQueued(mutation)) {
+        alert('El router aún no aplicó el cambio; queda en cola y se reintentará');
+      }
       setPlanModalOpen(false);
       setPendingDevice(null);
       await loadDevices();
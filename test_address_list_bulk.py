@@ -0,0 +1,118 @@
+"""Pruebas del endpoint de lotes de address-list (validación y reflejo en la DB)"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import models
+from app.db.database import Base
+from app.routes import routers as routes
+from app.routes.routers import (
+    MAX_BULK_ITEMS,
+    AddressListBulkItem,
+    AddressListBulkRequest,
+    bulk_address_list_changes,
+)
+
+USER = {"sub": "operador"}
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(models.Router(id=1, name="r1", host="10.0.0.1", username="u", password="p"))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+class FakeClient:
+    """MikroTikClient sin router: responde cada elemento como aplicado"""
+
+    method_used = "API"
+
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def apply_address_list_changes(self, additions, removals):
+        self.calls.append((additions, removals))
+        results = []
+        for item in additions:
+            exists = (item["list"], item["address"]) in self.existing
+            results.append({
+                "action": "add", "list": item["list"], "address": item["address"],
+                "status": "already_exists" if exists else "added", "id": "*1",
+            })
+        for item in removals:
+            results.append({"action": "remove", "list": item["list"], "address": item["address"], "status": "removed"})
+        return results
+
+
+@pytest.mark.parametrize("item", [
+    {"list_name": "INET_BLOQUEADO", "address": "10.0.0.1; /system reboot"},
+    {"list_name": "INET_BLOQUEADO", "address": "no-es-ip"},
+    {"list_name": 'LISTA "rara"', "address": "10.0.0.1"},
+    {"list_name": "", "address": "10.0.0.1"},
+    {"list_name": "INET_BLOQUEADO", "address": "10.0.0.1", "comment": "x" * 256},
+])
+def test_invalid_items_are_rejected(item):
+    with pytest.raises(ValidationError):
+        AddressListBulkItem(**item)
+
+
+def test_valid_items_accept_ips_and_networks():
+    request = AddressListBulkRequest(
+        add=[{"list_name": "INET_BLOQUEADO", "address": " 10.0.0.1 ", "comment": "cliente"}],
+        remove=[{"list_name": "INET_PERMITIDO", "address": "10.0.1.0/24"}],
+    )
+    assert request.add[0].address == "10.0.0.1"
+    assert request.remove[0].address == "10.0.1.0/24"
+
+
+def test_unknown_router_is_404(db):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(bulk_address_list_changes(99, AddressListBulkRequest(), db, USER))
+    assert error.value.status_code == 404
+
+
+def test_too_many_items_is_400(db):
+    item = AddressListBulkItem(list_name="INET_BLOQUEADO", address="10.0.0.1")
+    request = AddressListBulkRequest(add=[item] * (MAX_BULK_ITEMS + 1))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(bulk_address_list_changes(1, request, db, USER))
+    assert error.value.status_code == 400
+
+
+def test_results_are_mirrored_in_the_db(db, monkeypatch):
+    client = FakeClient(existing={("INET_BLOQUEADO", "10.0.0.2")})
+    monkeypatch.setattr(routes.MikroTikClient, "from_router", classmethod(lambda cls, *a, **k: client))
+    db.add(models.AddressListEntry(router_id=1, list_name="INET_PERMITIDO", address="10.0.0.3"))
+    db.commit()
+
+    request = AddressListBulkRequest(
+        add=[
+            {"list_name": "INET_BLOQUEADO", "address": "10.0.0.1", "comment": "nuevo"},
+            {"list_name": "INET_BLOQUEADO", "address": "10.0.0.2"},
+        ],
+        remove=[{"list_name": "INET_PERMITIDO", "address": "10.0.0.3"}],
+    )
+    response = asyncio.run(bulk_address_list_changes(1, request, db, USER))
+
+    assert response["success"]
+    assert response["summary"] == {"added": 1, "already_exists": 1, "removed": 1}
+    rows = {(e.list_name, e.address, e.comment) for e in db.query(models.AddressListEntry)}
+    assert rows == {("INET_BLOQUEADO", "10.0.0.1", "nuevo"), ("INET_BLOQUEADO", "10.0.0.2", None)}
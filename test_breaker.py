@@ -0,0 +1,128 @@
+"""Pruebas del circuit breaker API → SSH (transiciones, sondeo y turnos de half-open)"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.deadline import reset_deadline, set_deadline
+from app.mikrotik import client as client_module
+from app.mikrotik.breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitState, breaker_registry
+from app.mikrotik.client import MikroTikClient
+
+
+def expire(breaker):
+    breaker.opened_at = datetime.utcnow() - timedelta(seconds=breaker.timeout_seconds + 1)
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3)
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.can_attempt_api()
+
+
+def test_half_open_allows_one_attempt_after_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, timeout_seconds=60)
+    breaker.record_failure()
+    expire(breaker)
+    assert breaker.can_attempt_api()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert not breaker.can_attempt_api()
+
+
+@pytest.mark.parametrize("succeeded,state", [(True, CircuitState.CLOSED), (False, CircuitState.OPEN)])
+def test_half_open_verdict(succeeded, state):
+    breaker = CircuitBreaker(failure_threshold=1, timeout_seconds=60)
+    breaker.record_failure()
+    expire(breaker)
+    breaker.can_attempt_api()
+    assert (breaker.record_success() if succeeded else breaker.record_failure())
+    assert breaker.state == state
+
+
+def test_release_half_open_frees_the_slot():
+    breaker = CircuitBreaker(failure_threshold=1, timeout_seconds=60)
+    breaker.record_failure()
+    expire(breaker)
+    assert breaker.can_attempt_api()
+    breaker.release_half_open()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.can_attempt_api()
+
+
+def test_apply_adopts_only_newer_snapshots():
+    breaker = CircuitBreaker()
+    newer = {"state": "open", "failure_count": 3, "opened_at": datetime.utcnow(),
+             "changed_at": breaker.changed_at + timedelta(seconds=1)}
+    older = dict(newer, state="closed", changed_at=breaker.changed_at - timedelta(seconds=1))
+    breaker.apply(older)
+    assert breaker.state == CircuitState.CLOSED
+    breaker.apply(newer)
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.failure_count == 3
+
+
+def test_breaker_adopted_from_another_worker_is_probed(monkeypatch):
+    registry = CircuitBreakerRegistry()
+    monkeypatch.setattr(client_module, "breaker_registry", registry)
+    client = MikroTikClient("10.0.0.1", "u", "p", router_id=7)
+    breaker = registry.get(7)
+    breaker.apply({"state": "open", "failure_count": 3, "opened_at": datetime.utcnow(),
+                   "changed_at": datetime.utcnow() + timedelta(seconds=1)})
+
+    probed = []
+
+    async def fake_probe(b):
+        probed.append(b.probe_config)
+
+    monkeypatch.setattr(registry, "_probe", fake_probe)
+    asyncio.run(registry.probe())
+    assert probed == [client.api_config()]
+
+
+def test_deadline_trimmed_timeout_releases_half_open_slot(monkeypatch):
+    client = MikroTikClient("10.0.0.250", "u", "p", timeout=5)
+    breaker = client.circuit_breaker
+    breaker.record_failure()
+    breaker.state, breaker.half_open_calls = CircuitState.HALF_OPEN, 0
+
+    async def slow_call(api_func):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(client, "_api_call", slow_call)
+
+    async def run():
+        token = set_deadline(0.05)
+        try:
+            with pytest.raises(Exception, match="no hay función SSH"):
+                await client._call_with_fallback(lambda c: None)
+        finally:
+            reset_deadline(token)
+
+    try:
+        asyncio.run(run())
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.half_open_calls == 0
+    finally:
+        breaker_registry._breakers.pop(client.pool_key, None)
+
+
+def test_adaptive_timeout_counts_as_failure(monkeypatch):
+    client = MikroTikClient("10.0.0.251", "u", "p", timeout=5)
+    breaker = client.circuit_breaker
+
+    async def slow_call(api_func):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(client, "_api_call", slow_call)
+    monkeypatch.setattr(client_module.latency_registry, "timeout", lambda key, operation, ceiling: 0.05)
+    monkeypatch.setattr(client_module.latency_registry, "observe", lambda *args: None)
+
+    try:
+        with pytest.raises(Exception, match="no hay función SSH"):
+            asyncio.run(client._call_with_fallback(lambda c: None, operation="/p:rows:full"))
+        assert breaker.failure_count == 1
+    finally:
+        breaker_registry._breakers.pop(client.pool_key, None)
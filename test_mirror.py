@@ -0,0 +1,73 @@
+"""Pruebas del espejo de tablas (foto inicial, eventos listen y filtros locales)"""
+import time
+
+from app.mikrotik.mirror import MirrorRegistry, RouterMirror, TableMirror, matches
+from app.mikrotik.records import AddressListItem
+
+PATH = "/ip/firewall/address-list"
+
+
+def make_table():
+    table = TableMirror(PATH, AddressListItem)
+    table.load([
+        {".id": "*1", "list": "INET_PERMITIDO", "address": "10.0.0.1"},
+        {".id": "*2", "list": "INET_BLOQUEADO", "address": "10.0.0.2"},
+        {"list": "sin-id", "address": "10.0.0.9"},
+    ])
+    table.ready = True
+    return table
+
+
+def test_load_indexes_rows_by_id():
+    table = make_table()
+    assert set(table.rows) == {"*1", "*2"}
+    assert isinstance(table.rows["*1"], AddressListItem)
+    assert table.version == 1
+
+
+def test_apply_updates_adds_and_removes_rows():
+    table = make_table()
+    table.apply({".id": "*1", "comment": "cliente"})
+    table.apply({".id": "*3", "list": "INET_BLOQUEADO", "address": "10.0.0.3"})
+    table.apply({".id": "*2", ".dead": "true"})
+    table.apply({"list": "sin-id"})
+    assert table.rows["*1"]["address"] == "10.0.0.1"
+    assert table.rows["*1"]["comment"] == "cliente"
+    assert set(table.rows) == {"*1", "*3"}
+    assert table.events == 3
+
+
+def test_select_filters_and_projects():
+    table = make_table()
+    rows = table.select({"list": ["INET_BLOQUEADO", "OTRA"]}, fields=["address"])
+    assert [dict(row) for row in rows] == [{"address": "10.0.0.2"}]
+    assert table.count() == 2
+    assert table.count({"id": "*1"}) == 1
+
+
+def test_matches_compares_as_strings():
+    assert matches({"disabled": "false"}, {"disabled": "false"})
+    assert not matches({"list": "A"}, {"list": "B"})
+    assert matches({"priority": "8/8"}, {"priority": ["8/8", "1/1"]})
+
+
+def test_own_write_bypasses_the_table_for_a_while(monkeypatch):
+    registry = MirrorRegistry()
+    mirror = RouterMirror(1, {"host": "10.0.0.1"}, paths=[PATH])
+    mirror.tables[PATH] = make_table()
+    registry._mirrors[1] = mirror
+
+    assert registry.table(1, PATH) is mirror.tables[PATH]
+    registry.note_write(1, PATH)
+    assert registry.table(1, PATH) is None
+    mirror.tables[PATH].bypass_until = time.monotonic() - 1
+    assert registry.table(1, PATH) is not None
+    assert registry.table(1, "/queue/simple") is None
+    assert registry.table(2, PATH) is None
+
+
+def test_table_not_ready_is_not_used():
+    mirror = RouterMirror(1, {"host": "10.0.0.1"}, paths=[PATH])
+    mirror.tables[PATH] = make_table()
+    mirror._set_ready(False)
+    assert mirror.table(PATH) is None
@@ -0,0 +1,94 @@
+"""Pruebas del outbox de cambios en routers (coalescencia, idempotencia y espera del resultado)"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import database, models
+from app.db.database import Base
+from app.mikrotik.outbox import DONE, FAILED, PENDING, SUPERSEDED, enqueue, wait_for_mutation
+from app.routes import routers as routes
+from app.routes.routers import ToggleInternetRequest, toggle_device_internet
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(models.Router(id=1, name="r1", host="10.0.0.1", username="u", password="p"))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_new_mutation_supersedes_pending_for_same_target(db):
+    first = enqueue(db, 1, "address_list_move", "10.0.0.5", {"target_list": "INET_BLOQUEADO"})
+    second = enqueue(db, 1, "address_list_move", "10.0.0.5", {"target_list": "INET_PERMITIDO"})
+    other = enqueue(db, 1, "address_list_move", "10.0.0.6", {"target_list": "INET_BLOQUEADO"})
+    db.refresh(first)
+    assert first.status == SUPERSEDED
+    assert first.completed_at is not None
+    assert second.status == PENDING
+    assert other.status == PENDING
+    assert second.coalesce_key == "address_list_move:10.0.0.5"
+
+
+def test_in_progress_mutation_is_not_superseded(db):
+    first = enqueue(db, 1, "address_list_move", "10.0.0.5", {"target_list": "INET_BLOQUEADO"})
+    first.status = "in_progress"
+    db.commit()
+    enqueue(db, 1, "address_list_move", "10.0.0.5", {"target_list": "INET_PERMITIDO"})
+    db.refresh(first)
+    assert first.status == "in_progress"
+
+
+def test_idempotency_key_returns_existing_mutation(db):
+    first = enqueue(db, 1, "address_list_move", "10.0.0.5", {"target_list": "INET_BLOQUEADO"}, idempotency_key="k1")
+    again = enqueue(db, 1, "address_list_move", "10.0.0.5", {"target_list": "INET_PERMITIDO"}, idempotency_key="k1")
+    assert again.id == first.id
+    assert again.payload == {"target_list": "INET_BLOQUEADO"}
+    assert again.status == PENDING
+    assert db.query(models.RouterMutation).count() == 1
+
+
+def test_wait_returns_finished_state_or_last_state_on_timeout(db, monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    done = enqueue(db, 1, "address_list_move", "10.0.0.5", {})
+    pending = enqueue(db, 1, "address_list_move", "10.0.0.6", {})
+    done.status, done.result = DONE, {"added": True}
+    pending.last_error = "timeout"
+    db.commit()
+
+    finished = asyncio.run(wait_for_mutation(done.id, 5))
+    assert finished["status"] == DONE
+    assert finished["result"] == {"added": True}
+    waiting = asyncio.run(wait_for_mutation(pending.id, 0.05))
+    assert waiting["status"] == PENDING
+    assert waiting["last_error"] == "timeout"
+
+
+@pytest.mark.parametrize("state,code", [
+    ({"status": DONE, "attempts": 1, "last_error": None, "result": {}}, 200),
+    ({"status": PENDING, "attempts": 1, "last_error": "timeout", "result": None}, 202),
+    ({"status": FAILED, "attempts": 1, "last_error": "no such item", "result": None}, 503),
+])
+def test_toggle_reports_the_outcome_of_the_mutation(db, monkeypatch, state, code):
+    async def fake_wait(mutation_id, timeout):
+        return state
+
+    monkeypatch.setattr(routes, "wait_for_mutation", fake_wait)
+    response = Response(status_code=202)
+    request = ToggleInternetRequest(ip_address="10.0.0.5", enable=False)
+    try:
+        body = asyncio.run(toggle_device_internet(1, request, response, None, db, {"sub": "operador"}))
+    except HTTPException as error:
+        assert error.status_code == code
+        assert "no such item" in error.detail
+        return
+    assert response.status_code == code
+    assert body["status"] == state["status"]
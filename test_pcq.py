@@ -0,0 +1,149 @@
+"""Pruebas de los planes PCQ (aprovisionamiento, baja y eliminación del plan)"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import models
+from app.db.database import Base
+from app.mikrotik.api_client import MikroTikAPIClient
+from app.mikrotik.fanout import FanOutResult
+from app.mikrotik.outbox import PENDING
+from app.mikrotik.pcq import PCQ, PCQ_COMMENT, PcqRegistry, plan_object_keys, plan_objects
+from app.routes import plans as routes
+from app.routes.plans import PCQ_DEPROVISION, delete_plan
+
+USER = {"sub": "admin"}
+
+
+def make_plan(**kwargs):
+    values = dict(id=5, download_limit="10M", upload_limit="unlimited", priority=None)
+    values.update(kwargs)
+    return SimpleNamespace(**values)
+
+
+class FakeClient:
+    """MikroTikClient sin router: registra las altas y bajas pedidas"""
+
+    pool_key = 1
+
+    def __init__(self):
+        self.ensured = []
+        self.removed = []
+
+    async def ensure_entries(self, path, key, desired, place_before=None):
+        self.ensured.append((path, key, [dict(item) for item in desired], place_before))
+        return {}
+
+    async def remove_entries(self, path, key, values):
+        self.removed.append((path, key, list(values)))
+        return len(values)
+
+
+def test_plan_objects_use_per_device_rates_and_plan_list():
+    objects = plan_objects(make_plan())
+    down, up = objects["/queue/type"]
+    assert (down["pcq-rate"], down["pcq-classifier"]) == ("10M", "dst-address")
+    assert (up["pcq-rate"], up["pcq-classifier"]) == ("0", "src-address")
+    assert objects["/ip/firewall/mangle"][0]["dst-address-list"] == "SMARTBJ_PLAN_5"
+    assert objects["/queue/tree"][0]["priority"] == "8"
+    for path, field in (("/queue/type", "name"), ("/ip/firewall/mangle", "comment"), ("/queue/tree", "name")):
+        assert [item[field] for item in objects[path]] == plan_object_keys(5)[path]
+
+
+def test_ensure_provisions_in_order_once_and_again_when_plan_changes():
+    registry = PcqRegistry()
+    client = FakeClient()
+    assert asyncio.run(registry.ensure(client, make_plan()))
+    assert not asyncio.run(registry.ensure(client, make_plan()))
+    assert [path for path, *_ in client.ensured] == ["/queue/type", "/ip/firewall/mangle", "/queue/tree"]
+    assert client.ensured[1][3] == {"chain": "forward"}
+    assert client.ensured[0][3] is None
+    assert asyncio.run(registry.ensure(client, make_plan(download_limit="20M")))
+    assert len(client.ensured) == 6
+
+
+def test_deprovision_removes_in_reverse_order_and_forgets_the_plan():
+    registry = PcqRegistry()
+    client = FakeClient()
+    asyncio.run(registry.ensure(client, make_plan()))
+    removed = asyncio.run(registry.deprovision(client, 5))
+    assert [path for path, *_ in client.removed] == [
+        "/queue/tree", "/ip/firewall/mangle", "/queue/type", "/ip/firewall/address-list"
+    ]
+    assert client.removed[1][2] == [f"{PCQ_COMMENT} plan-5-down", f"{PCQ_COMMENT} plan-5-up"]
+    assert client.removed[3] == ("/ip/firewall/address-list", "list", ["SMARTBJ_PLAN_5"])
+    assert removed == 7
+    assert asyncio.run(registry.ensure(client, make_plan()))
+
+
+def test_new_mangle_rules_go_before_the_first_forward_rule():
+    client = MikroTikAPIClient("10.0.0.1", "u", "p")
+    reads = []
+
+    async def execute(path, method="get", params=None, queries=None, proplist=None):
+        reads.append(queries)
+        if "chain" in queries:
+            return [{".id": "*A"}, {".id": "*B"}]
+        return []
+
+    async def execute_many(commands, window=None):
+        client.commands = commands
+        return [[{"ret": f"*{i}"}] for i, _ in enumerate(commands)]
+
+    client.execute, client.execute_many = execute, execute_many
+    rules = plan_objects(make_plan())["/ip/firewall/mangle"]
+    asyncio.run(client.ensure_entries("/ip/firewall/mangle", "comment", rules, {"chain": "forward"}))
+    assert [c["params"]["place-before"] for c in client.commands] == ["*A", "*A"]
+    assert reads[1] == {"chain": "forward"}
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        models.Router(id=1, name="r1", host="10.0.0.1", username="u", password="p", status="active"),
+        models.Router(id=2, name="r2", host="10.0.0.2", username="u", password="p", status="active"),
+        models.Router(id=3, name="r3", host="10.0.0.3", username="u", password="p", status="inactive"),
+        models.Plan(id=5, name="pcq", upload_limit="5M", download_limit="10M", type=PCQ),
+    ])
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def router_2_down(monkeypatch):
+    attempted = []
+
+    async def fake_fan_out(routers, operation):
+        attempted.extend(r.id for r in routers)
+        return [FanOutResult(r.id, error="timeout") if r.id == 2 else FanOutResult(r.id, value=8) for r in routers]
+
+    monkeypatch.setattr(routes, "fan_out", fake_fan_out)
+    return attempted
+
+
+def test_delete_keeps_the_plan_when_an_active_router_fails(db, router_2_down):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(delete_plan(5, False, db, USER))
+    assert error.value.status_code == 503
+    assert router_2_down == [1, 2]
+    assert db.get(models.Plan, 5) is not None
+
+
+def test_forced_delete_leaves_pending_cleanup_in_the_outbox(db, router_2_down):
+    asyncio.run(delete_plan(5, True, db, USER))
+    assert db.get(models.Plan, 5) is None
+    pending = db.query(models.RouterMutation).order_by(models.RouterMutation.router_id).all()
+    assert [(m.router_id, m.kind, m.payload, m.status) for m in pending] == [
+        (2, PCQ_DEPROVISION, {"plan_id": 5}, PENDING),
+        (3, PCQ_DEPROVISION, {"plan_id": 5}, PENDING),
+    ]
@@ -0,0 +1,108 @@
+"""Pruebas de los trabajos de planes (toma condicional, reemplazo y latido)"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import database, models
+from app.db.database import Base
+from app.mikrotik.plan_jobs import (
+    ASSIGN,
+    FAILED,
+    INTERRUPTED_MESSAGE,
+    PENDING,
+    ROLLOUT,
+    RUNNING,
+    SUPERSEDED_MESSAGE,
+    JobProgress,
+    JobSuperseded,
+    _fail_stale_jobs,
+    _heartbeat,
+    _load_job,
+    _record_batch,
+)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(database, "SessionLocal", factory)
+    session = factory()
+    session.add_all([
+        models.Router(id=1, name="r1", host="10.0.0.1", username="u", password="p"),
+        models.Plan(id=1, name="10M", upload_limit="5M", download_limit="10M"),
+        models.Device(id=1, router_id=1, mac="AA:BB:CC:DD:EE:01", ip="10.0.0.11"),
+        models.Device(id=2, router_id=1, mac="AA:BB:CC:DD:EE:02", ip="10.0.0.12"),
+    ])
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def add_job(db, kind=ASSIGN, status=PENDING, heartbeat_at=None):
+    job = models.PlanAssignmentJob(
+        plan_id=1, kind=kind, device_ids=[1, 2], status=status, total=2,
+        heartbeat_at=heartbeat_at or datetime.utcnow()
+    )
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def status_of(db, job_id):
+    db.expire_all()
+    return db.get(models.PlanAssignmentJob, job_id)
+
+
+def test_job_is_claimed_only_once(db):
+    job_id = add_job(db)
+    context = _load_job(job_id)
+    assert context["kind"] == ASSIGN
+    assert [d["device_id"] for d in context["devices"][1]] == [1, 2]
+    assert [r.id for r in context["routers"]] == [1]
+    assert status_of(db, job_id).status == RUNNING
+    assert _load_job(job_id) is None
+
+
+def test_newer_rollout_supersedes_older_ones(db):
+    older = add_job(db, kind=ROLLOUT, status=RUNNING)
+    assign = add_job(db, kind=ASSIGN, status=RUNNING)
+    newer = add_job(db, kind=ROLLOUT)
+    _load_job(newer)
+    assert status_of(db, older).status == FAILED
+    assert status_of(db, older).errors[-1]["error"] == SUPERSEDED_MESSAGE
+    assert status_of(db, assign).status == RUNNING
+
+
+def test_batch_is_recorded_only_while_running(db):
+    job_id = add_job(db, status=RUNNING)
+    progress = JobProgress()
+    results = [{"device_id": 1, "status": "ok", "action": "queue_created", "target": "10.0.0.11/32", "queue_id": "*1"}]
+    progress.add(results)
+    _record_batch(job_id, 1, 1, None, results, progress)
+    assignment = db.query(models.PlanAssignment).one()
+    assert (assignment.device_id, assignment.queue_mikrotik_id) == (1, "*1")
+    assert status_of(db, job_id).processed == 1
+
+    job = status_of(db, job_id)
+    job.status = FAILED
+    db.commit()
+    with pytest.raises(JobSuperseded):
+        _record_batch(job_id, 1, 1, None, [dict(results[0], device_id=2)], progress)
+    assert db.query(models.PlanAssignment).count() == 1
+
+
+def test_only_jobs_without_recent_heartbeat_are_failed(db):
+    old = datetime.utcnow() - timedelta(hours=1)
+    stale = add_job(db, status=RUNNING, heartbeat_at=old)
+    alive = add_job(db, status=RUNNING, heartbeat_at=old)
+    _heartbeat(alive)
+    assert _fail_stale_jobs() == [stale]
+    assert status_of(db, stale).status == FAILED
+    assert status_of(db, stale).errors[-1]["error"] == INTERRUPTED_MESSAGE
+    assert status_of(db, alive).status == RUNNING
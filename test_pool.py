@@ -0,0 +1,124 @@
+"""Pruebas del pool de conexiones API por router (préstamo, descarte y expulsión)"""
+import asyncio
+
+import pytest
+
+from app.mikrotik.pool import RouterConnectionPool, _PooledConnection
+from app.mikrotik.protocol import RouterOSConnectionError, RouterOSTrapError
+
+
+class FakeClient:
+    """Cliente API sin red: cuenta conexiones abiertas y cerradas"""
+
+    opened = 0
+
+    def __init__(self):
+        FakeClient.opened += 1
+        self.is_connected = True
+        self.healthy = True
+
+    async def ping(self):
+        return self.healthy
+
+    async def disconnect(self):
+        self.is_connected = False
+
+
+def make_pool(**kwargs):
+    FakeClient.opened = 0
+    pool = RouterConnectionPool("r1", {"host": "10.0.0.1", "timeout": 0.05}, **kwargs)
+
+    async def fake_open():
+        return _PooledConnection(FakeClient())
+
+    pool._open = fake_open
+    return pool
+
+
+def test_released_connection_is_reused():
+    async def run():
+        pool = make_pool()
+        async with pool.connection() as first:
+            pass
+        async with pool.connection() as second:
+            pass
+        return first is second, pool.stats()
+
+    same, stats = asyncio.run(run())
+    assert same
+    assert FakeClient.opened == 1
+    assert stats == {"idle": 1, "in_use": 0, "max_size": 8}
+
+
+@pytest.mark.parametrize("error,kept", [
+    (RouterOSTrapError("no such item"), True),
+    (ValueError("uso incorrecto"), True),
+    (RouterOSConnectionError("cerrada"), False),
+    (asyncio.TimeoutError(), False),
+])
+def test_trap_keeps_connection_and_transport_errors_discard_it(error, kept):
+    async def run():
+        pool = make_pool()
+        with pytest.raises(type(error)):
+            async with pool.connection() as client:
+                raise error
+        return client, pool.stats()
+
+    client, stats = asyncio.run(run())
+    assert client.is_connected is kept
+    assert stats["idle"] == (1 if kept else 0)
+    assert stats["in_use"] == 0
+
+
+def test_broken_idle_connection_is_replaced_on_checkout():
+    async def run():
+        pool = make_pool(health_check_interval=0)
+        async with pool.connection() as first:
+            pass
+        first.healthy = False
+        async with pool.connection() as second:
+            pass
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is not second
+    assert not first.is_connected
+    assert FakeClient.opened == 2
+
+
+def test_exhausted_pool_times_out():
+    async def run():
+        pool = make_pool(max_size=1)
+        held = await pool.acquire()
+        with pytest.raises(Exception, match="agotado"):
+            await pool.acquire()
+        await pool.release(held)
+        return pool.stats()
+
+    assert asyncio.run(run())["in_use"] == 0
+
+
+def test_maintain_evicts_expired_but_keeps_min_idle():
+    async def run():
+        pool = make_pool(min_idle=1, max_idle=4, idle_timeout=60)
+        clients = [await pool.acquire() for _ in range(3)]
+        for client in clients:
+            await pool.release(client)
+        for conn in pool._idle:
+            conn.last_used -= 120
+        await pool.maintain()
+        return pool.stats(), sum(1 for c in clients if c.is_connected)
+
+    stats, connected = asyncio.run(run())
+    assert stats["idle"] == 1
+    assert connected == 1
+
+
+def test_maintain_prewarms_min_idle():
+    async def run():
+        pool = make_pool(min_idle=2)
+        await pool.maintain()
+        return pool.stats()
+
+    assert asyncio.run(run())["idle"] == 2
+    assert FakeClient.opened == 2
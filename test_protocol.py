@@ -0,0 +1,103 @@
+"""Pruebas del protocolo API de RouterOS (longitudes y reparto por etiqueta)"""
+import asyncio
+
+import pytest
+
+from app.mikrotik.protocol import (
+    ApiConnection,
+    RouterOSConnectionError,
+    RouterOSTrapError,
+    _PendingCommand,
+    encode_length,
+    encode_sentence,
+)
+
+# Un valor en cada borde de los tamaños de la codificación (1 a 5 bytes)
+LENGTHS = [0, 1, 0x7F, 0x80, 0x3FFF, 0x4000, 0x1FFFFF, 0x200000, 0xFFFFFFF, 0x10000000, 0xFFFFFFFF]
+
+
+def read_length(data: bytes) -> int:
+    """Decodifica data con ApiConnection._read_length sobre un StreamReader"""
+    async def run():
+        connection = ApiConnection("127.0.0.1")
+        connection._reader = asyncio.StreamReader()
+        connection._reader.feed_data(data)
+        connection._reader.feed_eof()
+        return await connection._read_length()
+
+    return asyncio.run(run())
+
+
+def dispatch(sentences, on_row=None):
+    """Registra los comandos con tag 1 y 2 y les reparte las sentencias"""
+    async def run():
+        connection = ApiConnection("127.0.0.1")
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for tag in ("1", "2"):
+            futures[tag] = loop.create_future()
+            connection._pending[tag] = _PendingCommand(futures[tag], on_row if tag == "1" else None)
+        for sentence in sentences:
+            connection._dispatch(sentence)
+        return connection, futures
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("length", LENGTHS)
+def test_length_round_trip(length):
+    assert read_length(encode_length(length)) == length
+
+
+@pytest.mark.parametrize("length,size", [(0x7F, 1), (0x80, 2), (0x4000, 3), (0x200000, 4), (0x10000000, 5)])
+def test_length_size(length, size):
+    assert len(encode_length(length)) == size
+
+
+def test_unsupported_control_byte():
+    with pytest.raises(RouterOSConnectionError):
+        read_length(b"\xf8")
+
+
+def test_encode_sentence_ends_with_empty_word():
+    assert encode_sentence(["/login"]) == b"\x06/login\x00"
+
+
+def test_dispatch_routes_rows_by_tag():
+    connection, futures = dispatch([
+        ["!re", ".tag=2", "=address=10.0.0.2"],
+        ["!re", ".tag=1", "=address=10.0.0.1", "=comment=a=b"],
+        ["!done", ".tag=1"],
+        ["!done", ".tag=2", "=ret=*5"],
+    ])
+    assert futures["1"].result() == ([{"address": "10.0.0.1", "comment": "a=b"}], {})
+    assert futures["2"].result() == ([{"address": "10.0.0.2"}], {"ret": "*5"})
+    assert connection._pending == {}
+
+
+def test_dispatch_trap_fails_only_its_command():
+    connection, futures = dispatch([
+        ["!trap", ".tag=1", "=message=no such item", "=category=0"],
+        ["!done", ".tag=1"],
+    ])
+    error = futures["1"].exception()
+    assert isinstance(error, RouterOSTrapError)
+    assert str(error) == "no such item"
+    assert not futures["2"].done()
+    assert list(connection._pending) == ["2"]
+
+
+def test_dispatch_on_row_callback_and_unknown_tag():
+    rows = []
+    connection, futures = dispatch([
+        ["!re", ".tag=1", "=.id=*1"],
+        ["!re", ".tag=99", "=.id=*2"],
+    ], on_row=rows.append)
+    assert rows == [{".id": "*1"}]
+    assert not futures["1"].done()
+    assert connection._pending["1"].rows == []
+
+
+def test_dispatch_fatal_raises_connection_error():
+    with pytest.raises(RouterOSConnectionError):
+        dispatch([["!fatal", "session terminated"]])
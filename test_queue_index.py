@@ -0,0 +1,56 @@
+"""Pruebas del índice target → simple queue"""
+from app.mikrotik.queue_index import QueueIndex, QueueIndexRegistry
+
+
+def build():
+    return QueueIndex.build([
+        {".id": "*1", "target": "10.0.0.1/32"},
+        {".id": "*2", "target": "10.0.0.12/32,10.0.1.0/24"},
+        {".id": "*3", "target": "ether2"},
+        {"target": "10.0.0.50/32"},
+    ])
+
+
+def test_exact_lookup_not_substring():
+    index = build()
+    assert index.lookup("10.0.0.1") == "*1"
+    assert index.lookup("10.0.0.12") == "*2"
+    assert index.lookup("10.0.1.0/24") == "*2"
+    assert index.lookup("10.0.0.2") is None
+    assert index.lookup("10.0.0.50") is None
+    assert index.lookup("no-es-ip") is None
+    assert len(index) == 3
+
+
+def test_first_queue_wins_shared_target():
+    index = QueueIndex.build([
+        {".id": "*1", "target": "10.0.0.1/32"},
+        {".id": "*2", "target": "10.0.0.1/32"},
+    ])
+    assert index.lookup("10.0.0.1") == "*1"
+
+
+def test_put_and_discard():
+    index = build()
+    index.put("*1", "10.0.0.7/32")
+    assert index.lookup("10.0.0.1") is None
+    assert index.lookup("10.0.0.7") == "*1"
+    index.discard("*2")
+    assert index.lookup("10.0.0.12") is None
+
+
+def test_registry_version_and_ttl():
+    registry = QueueIndexRegistry()
+    registry.store("r1", QueueIndex(version=1))
+    assert registry.get("r1", 1) is not None
+    assert registry.get("r1", 2) is None
+    # Un índice del espejo no sirve cuando se lee sin espejo
+    assert registry.get("r1") is None
+    assert registry.peek("r1") is not None
+
+    registry.store("r2", QueueIndex())
+    assert registry.get("r2") is not None
+    registry.peek("r2").built_at -= 10 ** 6
+    assert registry.get("r2") is None
+    registry.invalidate("r2")
+    assert registry.peek("r2") is None
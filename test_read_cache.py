@@ -0,0 +1,143 @@
+"""Pruebas de la caché de lecturas (TTL, stale-while-revalidate e invalidación)"""
+import asyncio
+
+from app.mikrotik import cache as cache_module
+from app.mikrotik.cache import ReadCache, read_key
+
+
+class Loader:
+    """Loader que devuelve el valor actual y cuenta las lecturas al router"""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return [dict(row) for row in self.value]
+
+
+def age(cache, key, seconds):
+    cache._entries[key].loaded_at -= seconds
+
+
+def test_hit_within_ttl_and_copies_rows():
+    async def run():
+        cache = ReadCache(ttl=5, stale=30)
+        loader = Loader([{"address": "10.0.0.1"}])
+        first = await cache.get(1, "/p", "rows", loader)
+        first[0]["address"] = "modificada"
+        second = await cache.get(1, "/p", "rows", loader)
+        return loader.calls, second, cache.stats()
+
+    calls, rows, stats = asyncio.run(run())
+    assert calls == 1
+    assert rows == [{"address": "10.0.0.1"}]
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_stale_value_is_served_while_refreshing():
+    async def run():
+        cache = ReadCache(ttl=5, stale=30)
+        loader = Loader([{"v": 1}])
+        await cache.get(1, "/p", "rows", loader)
+        loader.value = [{"v": 2}]
+        age(cache, read_key(1, "/p", "rows", None, None), 10)
+        stale = await cache.get(1, "/p", "rows", loader)
+        await asyncio.gather(*cache._refreshing.values())
+        fresh = await cache.get(1, "/p", "rows", loader)
+        return stale, fresh, loader.calls, cache.stats()
+
+    stale, fresh, calls, stats = asyncio.run(run())
+    assert stale == [{"v": 1}]
+    assert fresh == [{"v": 2}]
+    assert calls == 2
+    assert stats["stale_hits"] == 1
+
+
+def test_expired_past_stale_window_reloads():
+    async def run():
+        cache = ReadCache(ttl=5, stale=30)
+        loader = Loader([{"v": 1}])
+        await cache.get(1, "/p", "rows", loader)
+        age(cache, read_key(1, "/p", "rows", None, None), 60)
+        await cache.get(1, "/p", "rows", loader)
+        return loader.calls
+
+    assert asyncio.run(run()) == 2
+
+
+def test_invalidate_only_affected_filters():
+    async def run():
+        cache = ReadCache(ttl=5, stale=30)
+        permitted = Loader([{"list": "INET_PERMITIDO"}])
+        blocked = Loader([{"list": "INET_BLOQUEADO"}])
+        await cache.get(1, "/p", "rows", permitted, {"list": "INET_PERMITIDO"})
+        await cache.get(1, "/p", "rows", blocked, {"list": "INET_BLOQUEADO"})
+        cache.invalidate(1, "/p", [{"list": "INET_BLOQUEADO", "address": "10.0.0.1"}])
+        await cache.get(1, "/p", "rows", permitted, {"list": "INET_PERMITIDO"})
+        await cache.get(1, "/p", "rows", blocked, {"list": "INET_BLOQUEADO"})
+        return permitted.calls, blocked.calls
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_read_in_flight_during_write_is_not_stored():
+    async def run():
+        cache = ReadCache(ttl=5, stale=30)
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_loader():
+            started.set()
+            await release.wait()
+            return [{"v": "viejo"}]
+
+        reading = asyncio.create_task(cache.get(1, "/p", "rows", slow_loader))
+        await started.wait()
+        cache.invalidate(1, "/p")
+        release.set()
+        await reading
+        return cache.stats()["entries"]
+
+    assert asyncio.run(run()) == 0
+
+
+def test_lookup_reports_whether_the_loader_ran():
+    async def run():
+        cache = ReadCache(ttl=5, stale=30)
+        loader = Loader([{"v": 1}])
+        first = await cache.lookup(1, "/p", "rows", loader)
+        second = await cache.lookup(1, "/p", "rows", loader)
+        return first, second
+
+    (_, first_cached), (value, second_cached) = asyncio.run(run())
+    assert not first_cached
+    assert second_cached
+    assert value == [{"v": 1}]
+
+
+def test_shared_version_is_checked_at_most_once_per_interval(monkeypatch):
+    versions = {"1|/p": 0}
+    checks = []
+
+    def load_version(key):
+        checks.append(key)
+        return versions[key]
+
+    monkeypatch.setattr(cache_module, "_load_version", load_version)
+
+    async def run():
+        cache = ReadCache(ttl=5, stale=30, shared=True, version_check_seconds=60)
+        loader = Loader([{"v": 1}])
+        for _ in range(5):
+            await cache.get(1, "/p", "rows", loader)
+        # Escritura de otro worker: se ve cuando vence el intervalo
+        versions["1|/p"] = 1
+        await cache.get(1, "/p", "rows", loader)
+        cache._checked_at[(1, "/p")] -= 61
+        await cache.get(1, "/p", "rows", loader)
+        return loader.calls
+
+    assert asyncio.run(run()) == 2
+    assert len(checks) == 2
@@ -0,0 +1,118 @@
+"""Pruebas de la reconciliación de address-lists (diff y carreras con el outbox)"""
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import database, models
+from app.db.database import Base
+from app.mikrotik.client import MikroTikClient
+from app.mikrotik.outbox import enqueue
+from app.mikrotik.reconcile import diff_address_lists, reconcile_router, refusal_reason
+
+
+def entry(entry_id, list_name, address):
+    return {".id": entry_id, "list": list_name, "address": address}
+
+
+def test_adds_missing_and_removes_extra():
+    diff = diff_address_lists(
+        [("INET_PERMITIDO", "10.0.0.1"), ("INET_BLOQUEADO", "10.0.0.2")],
+        [entry("*1", "INET_PERMITIDO", "10.0.0.1"), entry("*2", "INET_PERMITIDO", "10.0.0.2")]
+    )
+    assert diff.add == [("INET_BLOQUEADO", "10.0.0.2")]
+    assert diff.remove == [{".id": "*2", "list": "INET_PERMITIDO", "address": "10.0.0.2", "duplicate": False}]
+    assert diff.ids == {("INET_PERMITIDO", "10.0.0.1"): "*1"}
+    assert diff.unchanged == 1
+    assert diff.actual == 2
+
+
+def test_duplicates_keep_first_entry():
+    diff = diff_address_lists(
+        [("INET_PERMITIDO", "10.0.0.1")],
+        [entry("*1", "INET_PERMITIDO", "10.0.0.1"), entry("*9", "INET_PERMITIDO", "10.0.0.1")]
+    )
+    assert diff.add == []
+    assert diff.remove == [{".id": "*9", "list": "INET_PERMITIDO", "address": "10.0.0.1", "duplicate": True}]
+    assert diff.ids[("INET_PERMITIDO", "10.0.0.1")] == "*1"
+
+
+def test_host_prefix_is_normalized_and_skip_is_untouched():
+    diff = diff_address_lists(
+        [("INET_PERMITIDO", "10.0.0.1/32"), ("INET_PERMITIDO", "10.0.0.3")],
+        [entry("*1", "INET_PERMITIDO", "10.0.0.1"), entry("*2", "INET_BLOQUEADO", "10.0.0.3")],
+        skip={"10.0.0.3"}
+    )
+    assert not diff
+    assert diff.unchanged == 1
+
+
+def test_refusal_guards():
+    empty = diff_address_lists([], [entry("*1", "INET_PERMITIDO", "10.0.0.1")])
+    assert refusal_reason(0, empty, 0.2) is not None
+    assert refusal_reason(0, empty, None) is not None
+
+    entries = [entry(f"*{i}", "INET_PERMITIDO", f"10.0.0.{i}") for i in range(10)]
+    desired = [("INET_PERMITIDO", f"10.0.0.{i}") for i in range(5)]
+    diff = diff_address_lists(desired, entries)
+    assert refusal_reason(len(desired), diff, 0.2) is not None
+    assert refusal_reason(len(desired), diff, 0.5) is None
+    assert refusal_reason(len(desired), diff, None) is None
+
+
+def test_dynamic_entries_are_ignored():
+    dynamic = dict(entry("*5", "INET_BLOQUEADO", "10.0.0.5"), dynamic="true")
+    static = dict(entry("*6", "INET_BLOQUEADO", "10.0.0.6"), dynamic="false")
+    diff = diff_address_lists([], [dynamic, static])
+    assert [item[".id"] for item in diff.remove] == ["*6"]
+    assert diff.actual == 1
+
+
+class RouterDuringToggle:
+    """Router cuyas listas se leen justo cuando llega un cambio al outbox"""
+
+    method_used = "API"
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.applied = []
+
+    async def get_address_list(self, list_name, fields=None):
+        if list_name != "INET_BLOQUEADO":
+            return []
+        db = self.session_factory()
+        enqueue(db, 1, "address_list_move", "10.0.0.9", {"list_name": "INET_BLOQUEADO"})
+        db.close()
+        return [entry("*1", "INET_BLOQUEADO", "10.0.0.1"), entry("*9", "INET_BLOQUEADO", "10.0.0.9")]
+
+    async def apply_address_list_diff(self, removals, additions):
+        self.applied.append((removals, additions))
+        return []
+
+    async def disconnect(self):
+        pass
+
+
+def test_addresses_changed_during_the_read_are_skipped(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(database, "SessionLocal", factory)
+    db = factory()
+    router_obj = models.Router(id=1, name="r1", host="10.0.0.1", username="u", password="p")
+    db.add(router_obj)
+    db.add(models.AddressListEntry(router_id=1, list_name="INET_BLOQUEADO", address="10.0.0.1"))
+    db.commit()
+    db.refresh(router_obj)
+    db.expunge(router_obj)
+    db.close()
+
+    client = RouterDuringToggle(factory)
+    monkeypatch.setattr(MikroTikClient, "from_router", classmethod(lambda cls, *a, **k: client))
+    report = asyncio.run(reconcile_router(router_obj, ["INET_PERMITIDO", "INET_BLOQUEADO"], force=True))
+
+    assert "10.0.0.9" in report["skipped"]
+    assert report["to_remove"] == []
+    assert client.applied == []
+    engine.dispose()
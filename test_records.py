@@ -0,0 +1,29 @@
+"""Pruebas de los registros tipados (Mapping de RouterOS y serialización JSON)"""
+import json
+
+import pytest
+
+from app.mikrotik.records import AddressListItem, DhcpLease, to_plain
+
+ROW = {".id": "*1", "address": "10.0.0.5", "mac-address": "AA:BB:CC:DD:EE:FF", "status": "bound", "x-raro": "1"}
+
+
+def test_record_round_trips_routeros_values():
+    lease = DhcpLease.from_row(ROW)
+    assert dict(lease) == ROW
+    assert lease.get("mac-address") == "AA:BB:CC:DD:EE:FF"
+    assert isinstance(lease.mac_address, int)
+
+
+def test_records_need_to_plain_for_json():
+    lease = DhcpLease.from_row(ROW)
+    with pytest.raises(TypeError):
+        json.dumps(lease)
+    item = AddressListItem.from_row({".id": "*2", "list": "INET_BLOQUEADO", "address": "10.0.0.5"})
+    value = {"lease": lease, "items": [item], "n": 1}
+    assert json.loads(json.dumps(to_plain(value))) == {
+        "lease": ROW,
+        "items": [{".id": "*2", "list": "INET_BLOQUEADO", "address": "10.0.0.5"}],
+        "n": 1,
+    }
+    assert lease._asdict() == ROW
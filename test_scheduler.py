@@ -0,0 +1,70 @@
+"""Pruebas del planificador de turnos por router (carriles de prioridad)"""
+import asyncio
+
+from app.mikrotik.scheduler import BACKGROUND, BULK, INTERACTIVE, RouterScheduler
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_lanes_are_served_by_priority_then_arrival():
+    async def run():
+        scheduler = RouterScheduler("r", max_concurrent=2, interactive_reserved=1)
+        await scheduler.acquire(INTERACTIVE)
+        await scheduler.acquire(INTERACTIVE)
+        order = []
+
+        async def call(name, priority):
+            async with scheduler.slot(priority):
+                order.append(name)
+
+        tasks = []
+        for name, priority in (("bg", BACKGROUND), ("bulk1", BULK), ("ui", INTERACTIVE), ("bulk2", BULK)):
+            tasks.append(asyncio.create_task(call(name, priority)))
+            await settle()
+        assert scheduler.depth() == {"interactive": 1, "bulk": 2, "background": 1}
+
+        scheduler.release()
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["ui", "bulk1", "bulk2", "bg"]
+
+
+def test_reserved_slot_only_for_interactive():
+    async def run():
+        scheduler = RouterScheduler("r", max_concurrent=2, interactive_reserved=1)
+        await scheduler.acquire(BULK)
+        waiting = asyncio.create_task(scheduler.acquire(BULK))
+        await settle()
+        assert not waiting.done()
+        # El turno reservado deja pasar a interactive sin esperar al bulk
+        await asyncio.wait_for(scheduler.acquire(INTERACTIVE), 1)
+        scheduler.release()
+        scheduler.release()
+        await asyncio.wait_for(waiting, 1)
+        return scheduler.stats()
+
+    stats = asyncio.run(run())
+    assert stats["executed"] == {"interactive": 1, "bulk": 2, "background": 0}
+    assert stats["running"] == 1
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        scheduler = RouterScheduler("r", max_concurrent=1, interactive_reserved=0)
+        await scheduler.acquire(BULK)
+        waiting = asyncio.create_task(scheduler.acquire(BULK))
+        await settle()
+        waiting.cancel()
+        await settle()
+        depth = scheduler.depth()
+        scheduler.release()
+        return depth, scheduler.stats()["running"]
+
+    depth, running = asyncio.run(run())
+    assert depth["bulk"] == 0
+    assert running == 0
@@ -0,0 +1,63 @@
+"""Pruebas del modo lote SSH (marcadores, comillas y altas ya existentes)"""
+import re
+
+from app.mikrotik.ssh_client import EXISTS_MARK, MikroTikSSHClient
+
+
+class ScriptedClient(MikroTikSSHClient):
+    """Cliente SSH sin red: ejecuta el lote contra address-lists en memoria"""
+
+    def __init__(self, existing=(), failing=()):
+        super().__init__("10.0.0.1", "u", "p")
+        self.existing = set(existing)
+        self.failing = set(failing)
+        self.scripts = []
+
+    def execute_command(self, command):
+        self.scripts.append(command)
+        marker = re.search(r'(__SC_[0-9a-f]+)_0"', command).group(1)
+        lines = []
+        parts = re.split(rf'on-error={{ :put "{marker}_ERR" }}; :put "{marker}_\d+"', command)[:-1]
+        for i, part in enumerate(parts):
+            added = re.search(r'add list="([^"]*)" address="([^"]*)"', part)
+            if ":if (" in part and added and added.groups() in self.existing:
+                lines.append(EXISTS_MARK)
+            elif added and added.group(2) in self.failing:
+                lines.append(f"{marker}_ERR")
+            elif ":put [:len" in part:
+                lines.append("1")
+            lines.append(f"{marker}_{i}")
+        return "\n".join(lines) + "\n", "", 0
+
+
+def test_quote_escapes_cli_metacharacters():
+    assert MikroTikSSHClient.quote('a"b$c?d\\') == '"a\\"b\\$c\\?d\\\\"'
+
+
+def test_existing_entry_is_reported_as_already_exists():
+    client = ScriptedClient(existing={("INET_BLOQUEADO", "10.0.0.2")})
+    results = client.apply_address_list_changes(
+        additions=[
+            {"list": "INET_BLOQUEADO", "address": "10.0.0.1"},
+            {"list": "INET_BLOQUEADO", "address": "10.0.0.2"},
+        ],
+        removals=[{"list": "INET_PERMITIDO", "address": "10.0.0.2"}],
+    )
+    assert [r["status"] for r in results] == ["removed", "added", "already_exists"]
+    assert len(client.scripts) == 1
+
+
+def test_failed_command_does_not_abort_the_batch():
+    client = ScriptedClient(failing={"10.0.0.1"})
+    results = client.apply_address_list_changes(additions=[
+        {"list": "INET_BLOQUEADO", "address": "10.0.0.1"},
+        {"list": "INET_BLOQUEADO", "address": "10.0.0.3"},
+    ])
+    assert results[0]["status"] == "error"
+    assert results[1]["status"] == "added"
+
+
+def test_missing_markers_are_errors():
+    client = MikroTikSSHClient("10.0.0.1", "u", "p")
+    client.execute_command = lambda command: ("", "channel closed", 1)
+    assert client.execute_batch([":put 1", ":put 2"]) == [("channel closed", False)] * 2
@@ -0,0 +1,45 @@
+"""Pruebas del parser de la salida CLI de RouterOS (print terse)"""
+from app.mikrotik.terse import iter_terse, parse_key_values, parse_terse_line
+
+
+def test_plain_row_with_index_and_flags():
+    row = parse_terse_line(" 0 X  list=INET_BLOQUEADO address=10.0.0.5 creation-time=jan/02/2024 10:00:00")
+    assert row == {
+        "list": "INET_BLOQUEADO",
+        "address": "10.0.0.5",
+        "creation-time": "jan/02/2024 10:00:00",
+        "disabled": "true",
+        "dynamic": "false",
+    }
+    assert ".id" not in row
+
+
+def test_show_ids_row_keeps_id():
+    row = parse_terse_line("*1A    list=INET_PERMITIDO address=10.0.0.6")
+    assert row[".id"] == "*1A"
+    assert row["disabled"] == "false"
+
+
+def test_quoted_values_with_spaces_equals_and_escapes():
+    row = parse_terse_line(r'*2 list=L address=10.0.0.7 comment="cliente a=b \"vip\" \\ fin"')
+    assert row["comment"] == 'cliente a=b "vip" \\ fin'
+    assert row["address"] == "10.0.0.7"
+
+
+def test_hex_escapes_are_utf8_bytes():
+    row = parse_terse_line(r'*3 list=L address=10.0.0.8 comment="Mar\C3\ADa"')
+    assert row["comment"] == "María"
+
+
+def test_fields_filter_and_non_rows():
+    rows = list(iter_terse(
+        ["Flags: X - disabled", "", "*4 list=L address=10.0.0.9 comment=x"],
+        fields=(".id", "address")
+    ))
+    assert rows == [{".id": "*4", "address": "10.0.0.9"}]
+
+
+def test_key_values():
+    lines = ["   uptime: 1w2d", "  version: 7.14 (stable)", "not a pair", "cpu load: 5%"]
+    assert parse_key_values(lines) == {"uptime": "1w2d", "version": "7.14 (stable)"}
+    assert parse_key_values(lines, fields=("version",)) == {"version": "7.14 (stable)"}